@@ -1,21 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash
 import yaml
+import copy
 import os
+import queue
 import subprocess
 import signal
+import threading
 import psutil
 import json
 import time
+import live_status
+import metrics
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'  # 用于flash消息
 
 # 存储进程信息的文件
 PROCESS_INFO_FILE = 'process_info.json'
+SUPERVISOR_STATUS_FILE = os.path.join('data', 'supervisor.json')
+# 状态文件超过这么久没更新，对应进程视为已停止；更旧的文件（比如上次不同分片数留下的）直接忽略
+LIVE_STALE_AFTER = 30
+LIVE_EXPIRE_AFTER = 300
+
+# 配置按修改时间缓存，刷新页面只 stat 一次，文件变了才重新解析
+config_cache = {'mtime': None, 'config': None}
+config_lock = threading.Lock()
 
 def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
+    with config_lock:
+        mtime = os.stat("config.yaml").st_mtime_ns
+        if config_cache['mtime'] != mtime:
+            with open("config.yaml", "r") as f:
+                config_cache['config'] = yaml.safe_load(f)
+            config_cache['mtime'] = mtime
+        # 调用方会修改返回的配置再保存，给一份副本
+        return copy.deepcopy(config_cache['config'])
 
 def get_web_config():
     config = load_config()
@@ -26,8 +45,20 @@ def get_web_config():
     }
 
 def save_config(config):
-    with open("config.yaml", "w") as f:
+    # 先写临时文件再替换，main.py 重载时不会读到写了一半的配置
+    with open("config.yaml.tmp", "w") as f:
         yaml.dump(config, f, default_flow_style=False)
+    os.replace("config.yaml.tmp", "config.yaml")
+    notify_reload()
+
+def notify_reload():
+    # main.py 收到 SIGHUP 后只增删变化的账户，不用整个重启
+    process_info = load_process_info()
+    if process_info.get('pid') and is_process_running(process_info['pid']):
+        try:
+            os.kill(process_info['pid'], signal.SIGHUP)
+        except OSError as e:
+            app.logger.error(f"notify main process reload failed:{e}")
 
 def save_process_info(pid):
     with open(PROCESS_INFO_FILE, 'w') as f:
@@ -60,6 +91,88 @@ def get_process_status():
         os.remove(PROCESS_INFO_FILE)
     return False
 
+class LiveFeed:
+    # 一个后台线程读交易进程写的状态文件，有变化才推给所有订阅的页面；页面开得再多也只有这一个读者
+    def __init__(self, directory, interval=1):
+        self.directory = directory
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.latest = None
+        self.thread = None
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name='live-feed')
+                self.thread.start()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=5)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def read(self, now):
+        processes = []
+        accounts = []
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            age = now - status.get('time', 0)
+            if age > LIVE_EXPIRE_AFTER:
+                continue
+            stale = age > LIVE_STALE_AFTER
+            processes.append({'pid': status.get('pid'), 'shard': status.get('shard'), 'time': status.get('time'), 'stale': stale})
+            for account in status.get('accounts', []):
+                accounts.append(dict(account, shard=status.get('shard'), stale=stale))
+        accounts.sort(key=lambda account: (account.get('name') or '', account['account']))
+        return {'processes': processes, 'accounts': accounts}
+
+    def publish(self, data):
+        with self.lock:
+            self.latest = data
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(data)
+            except queue.Full:
+                # 每次推的都是完整快照，跟不上的页面丢掉旧的只看最新的
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(data)
+
+    def run(self):
+        last = None
+        while True:
+            try:
+                snapshot = self.read(time.time())
+                data = json.dumps(snapshot, sort_keys=True)
+                if data != last:
+                    last = data
+                    self.publish(data)
+            except Exception as e:
+                app.logger.error(f"read live status failed:{e}")
+            time.sleep(self.interval)
+
+
+live_feed = LiveFeed(live_status.status_dir)
+
 @app.route('/')
 def index():
     config = load_config()
@@ -75,9 +188,9 @@ def start_process():
         return redirect(url_for('index'))
     
     try:
-        # 使用nohup启动main.py，并将输出重定向到日志文件
+        # 使用nohup启动main.py的supervisor模式：账户按代理分到多个子进程，子进程挂掉单独重启
         with open('nohup.out', 'a') as f:
-            process = subprocess.Popen(['nohup', 'python', 'main.py'],
+            process = subprocess.Popen(['nohup', 'python', 'main.py', '--supervise'],
                                     stdout=f,
                                     stderr=f,
                                     preexec_fn=os.setpgrp)  # 创建新的进程组
@@ -128,6 +241,49 @@ def stop_process():
         flash(f'停止失败：{str(e)}')
     return redirect(url_for('index'))
 
+@app.route('/metrics')
+def metrics_route():
+    # 指标由 main.py 进程在本地 socket 上提供，这里只做转发
+    path = load_config().get('metrics_socket', metrics.socket_path)
+    try:
+        text = metrics.fetch(path)
+    except OSError as e:
+        return Response(f"# main process metrics unavailable: {e}\n", status=503, mimetype='text/plain')
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/workers')
+def workers_route():
+    # supervisor 每隔几秒写一次各分片进程的存活状态
+    try:
+        with open(SUPERVISOR_STATUS_FILE, 'r') as f:
+            status = json.load(f)
+    except (OSError, ValueError) as e:
+        return Response(json.dumps({'error': str(e)}), status=503, mimetype='application/json')
+    status['stale'] = time.time() - status.get('time', 0) > 30
+    return Response(json.dumps(status), mimetype='application/json')
+
+@app.route('/events')
+def events():
+    # SSE：先发当前快照，之后只在状态变化时推送，空闲时发注释行保活
+    live_feed.ensure_started()
+    subscriber = live_feed.subscribe()
+
+    def stream():
+        try:
+            if live_feed.latest is not None:
+                yield f"data: {live_feed.latest}\n\n"
+            while True:
+                try:
+                    data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            live_feed.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/add_account', methods=['POST'])
 def add_account():
     config = load_config()
@@ -160,5 +316,6 @@ if __name__ == '__main__':
     app.run(
         host=web_config['host'],
         port=web_config['port'],
-        debug=False  # 生产环境建议关闭debug模式
+        debug=False,  # 生产环境建议关闭debug模式
+        threaded=True  # 每个 SSE 连接占一个线程
     ) 
\ No newline at end of file
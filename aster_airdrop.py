@@ -0,0 +1,51 @@
+import importlib
+import sys
+import time
+
+# 子命令 -> 模块，模块在选中后才导入，查询类命令不会加载主程序的推送、批量下单等依赖
+commands = {
+    "balance": ("check_balance", "查询所有账户的净值"),
+    "fees": ("check_fee_cost", "查询所有账户当天的手续费"),
+    "flatten": ("close_all_position", "平掉所有账户的仓位"),
+    "init": ("init_account", "初始化所有账户的杠杆和联合保证金模式"),
+    "volume": ("trade_vol", "统计所有账户近 1 / 7 / 30 天的成交额"),
+    "journal": ("journal", "读取事件日志"),
+    "sim": ("simulator", "本地模拟交易所（压测用）"),
+    "bench": ("bench", "交易循环基准测试"),
+    "run": ("main", "启动刷量主程序"),
+}
+
+
+def usage() -> str:
+    lines = ["usage: python aster_airdrop.py [--timing] <command> [args...]", "", "commands:"]
+    for name, (_, description) in commands.items():
+        lines.append(f"  {name:<10}{description}")
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    start = time.perf_counter()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    timing = "--timing" in argv
+    if timing:
+        argv.remove("--timing")
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+    name, args = argv[0], argv[1:]
+    if name not in commands:
+        print(f"unknown command: {name}\n\n{usage()}", file=sys.stderr)
+        return 2
+    module = importlib.import_module(commands[name][0])
+    imported = time.perf_counter()
+    if timing:
+        print(f"[timing] import {commands[name][0]}: {(imported - start) * 1000:.1f}ms", file=sys.stderr)
+    try:
+        return module.main(args)
+    finally:
+        if timing:
+            print(f"[timing] {name} total: {(time.perf_counter() - start) * 1000:.1f}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
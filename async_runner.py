@@ -0,0 +1,777 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+from yarl import URL
+from aster.error import ClientError, ServerError
+
+from batch_orders import format_batch_orders, leg_gap_ms, split_batch_results
+import commission_ledger
+from commission_ledger import get_ledger, page_limit
+from hedge_scheduler import HedgeScheduler, hold_time as hedge_hold_time, idle_wait as hedge_idle_wait
+import live_status
+import market_data
+import metrics
+import pacing
+from market_data import book_ticker_feed, mark_price_cache, parse_stream_message
+from rate_limiter import is_priority, request_weight, scheduler
+from pricing import calc_net_balance, size_orders
+from symbol_limits import symbol_limits_service
+from workers import restart_fields
+from user_stream import AccountState, keepalive_interval, touch_interval
+
+logger = logging.getLogger("aster")
+
+base_url = "https://fapi.asterdex.com"
+
+
+class SessionPool:
+    # 同一个代理的账户共用一个 aiohttp 会话，复用 keep-alive 连接
+    def __init__(self, pool_size: int = 10, timeout: float = 10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.sessions = {}
+
+    def get(self, proxy: str) -> aiohttp.ClientSession:
+        session = self.sessions.get(proxy)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.sessions[proxy] = session
+        return session
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions = {}
+
+
+class AsyncClient:
+    # 与 aster Client 同名的异步接口，只实现本项目用到的端点
+    def __init__(self, key: str, secret: str, session: aiohttp.ClientSession, proxy: str = None, base_url: str = base_url):
+        self.key = key
+        self.secret = secret
+        self.session = session
+        self.proxy = proxy or None
+        self.base_url = base_url
+
+    async def request(self, method: str, path: str, params: dict = None, signed: bool = False):
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        # 先排队再加 timestamp 签名，排队或退避再久也不会超出 recvWindow
+        weight, priority = request_weight(method, path, params), is_priority(method, params)
+        while True:
+            wait = scheduler.reserve(self.proxy, self.key, weight, priority)
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, 5))
+        if signed:
+            params["timestamp"] = int(time.time() * 1000)
+        query = urlencode(params, True)
+        if signed:
+            signature = hmac.new(self.secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+            query = f"{query}&signature={signature}"
+        url = self.base_url + path
+        if query:
+            url += "?" + query
+        headers = {"X-MBX-APIKEY": self.key}
+        start = time.time()
+        # 按签名时的原样发出，不让 yarl 重新转义 query（batchOrders 里的 : , 会被还原，签名就对不上了）
+        async with self.session.request(method, URL(url, encoded=True), headers=headers, proxy=self.proxy) as response:
+            body = await response.text()
+            scheduler.on_response(self.proxy, self.key, response.status, response.headers)
+            metrics.observe_request(method, url, self.proxy, response.status, (time.time() - start) * 1000,
+                                    response.headers, metrics.error_code_of(response.status, lambda: json.loads(body)))
+            if 400 <= response.status < 500:
+                try:
+                    err = json.loads(body)
+                except ValueError:
+                    raise ClientError(response.status, None, body, dict(response.headers))
+                raise ClientError(response.status, err.get("code"), err.get("msg"), dict(response.headers))
+            if response.status >= 500:
+                raise ServerError(response.status, body)
+            return json.loads(body)
+
+    async def exchange_info(self):
+        return await self.request("GET", "/fapi/v1/exchangeInfo")
+
+    async def book_ticker(self, symbol: str):
+        return await self.request("GET", "/fapi/v1/ticker/bookTicker", {"symbol": symbol})
+
+    async def mark_price(self, symbol: str = None):
+        return await self.request("GET", "/fapi/v1/premiumIndex", {"symbol": symbol})
+
+    async def account(self):
+        return await self.request("GET", "/fapi/v2/account", signed=True)
+
+    async def balance(self):
+        return await self.request("GET", "/fapi/v2/balance", signed=True)
+
+    async def get_orders(self):
+        return await self.request("GET", "/fapi/v1/openOrders", signed=True)
+
+    async def cancel_open_orders(self, symbol: str):
+        return await self.request("DELETE", "/fapi/v1/allOpenOrders", {"symbol": symbol}, signed=True)
+
+    async def get_position_risk(self):
+        return await self.request("GET", "/fapi/v2/positionRisk", signed=True)
+
+    async def get_income_history(self, **kwargs):
+        return await self.request("GET", "/fapi/v1/income", kwargs, signed=True)
+
+    async def new_order(self, **kwargs):
+        return await self.request("POST", "/fapi/v1/order", kwargs, signed=True)
+
+    async def new_batch_order(self, batch_orders: str):
+        return await self.request("POST", "/fapi/v1/batchOrders", {"batchOrders": batch_orders}, signed=True)
+
+    async def cancel_order(self, symbol: str, orderId: int):
+        return await self.request("DELETE", "/fapi/v1/order", {"symbol": symbol, "orderId": orderId}, signed=True)
+
+    async def new_listen_key(self):
+        return await self.request("POST", "/fapi/v1/listenKey")
+
+    async def renew_listen_key(self, listen_key: str):
+        return await self.request("PUT", "/fapi/v1/listenKey", {"listenKey": listen_key})
+
+
+class AsyncUserStream:
+    # 协程版账户推送，复用线程版的 AccountState；断线后自动重连并用 REST 对账
+    def __init__(self, client: AsyncClient):
+        self.client = client
+        self.state = AccountState()
+        self.listen_key = None
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.loop())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def reconcile(self):
+        orders = await self.client.get_orders()
+        positions = await self.client.get_position_risk()
+        balances = await self.client.balance()
+        self.state.reset(orders, positions, balances)
+
+    async def loop(self):
+        while True:
+            try:
+                self.listen_key = (await self.client.new_listen_key())["listenKey"]
+                url = f"{market_data.stream_url}/ws/{self.listen_key}"
+                async with self.client.session.ws_connect(url, heartbeat=60, proxy=self.client.proxy) as ws:
+                    await self.reconcile()
+                    ledger = get_ledger(self.client, self.client.key)
+                    ledger.attach_stream()
+                    self.ready.set()
+                    renew_at = time.time() + keepalive_interval
+                    while True:
+                        ledger.touch_stream()
+                        if time.time() >= renew_at:
+                            await self.client.renew_listen_key(self.listen_key)
+                            renew_at = time.time() + keepalive_interval
+                        # 最多等 touch_interval 秒就醒来给账本报一次活
+                        timeout = max(min(renew_at - time.time(), touch_interval), 0)
+                        try:
+                            message = await ws.receive(timeout=timeout)
+                        except asyncio.TimeoutError:
+                            continue
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        if self.on_message(message.data):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.client.key} async user stream error:{e}")
+            get_ledger(self.client, self.client.key).detach_stream()
+            self.ready.clear()
+            await asyncio.sleep(1)
+
+    def on_message(self, message) -> bool:
+        # 返回 True 表示需要重连
+        event = parse_stream_message(message)
+        if not isinstance(event, dict) or "e" not in event:
+            return False
+        self.state.last_event_time = event.get("E", 0)
+        if event["e"] == "ORDER_TRADE_UPDATE":
+            self.state.on_order_update(event["o"], event.get("E", 0))
+            if event["o"].get("x") == "TRADE":
+                metrics.inc_fills(self.client.key)
+                get_ledger(self.client, self.client.key).record_fill(event["o"], mark_price_cache.prices)
+        elif event["e"] == "ACCOUNT_UPDATE":
+            self.state.on_account_update(event["a"], event.get("E", 0))
+        elif event["e"] == "listenKeyExpired":
+            logger.warning(f"{self.client.key} listen key expired")
+            return True
+        return False
+
+
+mark_price_lock = asyncio.Lock()
+
+
+async def get_mark_price_dict(client: AsyncClient) -> dict:
+    # 同时发现过期的协程只让一个去拉 REST
+    async with mark_price_lock:
+        if mark_price_cache.is_stale():
+            try:
+                mark_price_cache.update(await client.mark_price())
+            except Exception as e:
+                logger.error(f"get mark price failed:{e}")
+    return mark_price_cache.prices
+
+
+async def get_book_ticker(client: AsyncClient, symbol: str) -> dict:
+    ticker = book_ticker_feed.get(symbol)
+    if ticker is None:
+        ticker = book_ticker_feed.update(await client.book_ticker(symbol))
+    return ticker
+
+
+async def get_symbol_limits(client: AsyncClient) -> dict:
+    service = symbol_limits_service
+    if service.limits is None or time.time() - service.fetched_at > service.ttl:
+        if not service.load():
+            service.update(await client.exchange_info())
+    return service.limits
+
+
+# 账户 -> asyncio.Lock：检查成本和后台对账不会同时翻同一个账户的流水
+sync_locks = {}
+
+
+def with_ledger_lock(ledger, method, *args):
+    with ledger.lock:
+        return method(*args)
+
+
+async def reconcile(client: AsyncClient) -> float:
+    # 增量拉取流水并按标记价格折成 USDT。流水走异步 REST；换日加载、落盘和持锁的部分放到线程里，不卡事件循环
+    ledger = get_ledger(client, client.key)
+    async with sync_locks.setdefault(client.key, asyncio.Lock()):
+        start_time, end_time = await asyncio.to_thread(with_ledger_lock, ledger, ledger.begin_sync)
+        while start_time is not None:
+            try:
+                items = await client.get_income_history(startTime=start_time, endTime=end_time, incomeType="COMMISSION", limit=page_limit)
+            except Exception as e:
+                logger.exception(f"get income history error:{e}")
+                break
+            start_time = await asyncio.to_thread(with_ledger_lock, ledger, ledger.ingest, items, start_time)
+        mark_price_dict = await get_mark_price_dict(client)
+        return await asyncio.to_thread(ledger.settle, mark_price_dict)
+
+
+async def calc_cost(client: AsyncClient) -> float:
+    # 推送连着时直接读账本里实时估算的成本；对账到期或推送断开时才拉流水
+    ledger = get_ledger(client, client.key)
+    if not ledger.needs_reconcile() and time.time() - ledger.synced_at < commission_ledger.reconcile_interval:
+        return ledger.cost()
+    return await reconcile(client)
+
+
+async def check_cost(client: AsyncClient, cost_per_day: float) -> tuple:
+    cost = await calc_cost(client)
+    metrics.set_cost(client.key, cost, cost_per_day)
+    live_status.set_cost(client.key, cost, cost_per_day)
+    return cost, abs(cost) >= cost_per_day
+
+
+def plan_round(client: AsyncClient, pacer: pacing.Pacer, cost: float, cost_per_day: float) -> tuple:
+    # 事件循环本身就是一个定时堆，这里只按 pacing 算出间隔和单量，到点由 asyncio.sleep 叫醒
+    pacer.observe(cost)
+    sleep_time, value = pacer.plan(cost, cost_per_day)
+    live_status.set_plan(client.key, time.time() + sleep_time, value)
+    return sleep_time, value
+
+
+async def close_position(client: AsyncClient, state: AccountState = None, force: bool = False):
+    try:
+        positions = state.get_positions() if state is not None else await client.get_position_risk()
+        live_status.set_positions(client.key, positions)
+        for position in positions:
+            if time.time() * 1000 - position["updateTime"] <= 100 and not force:
+                continue
+            if abs(float(position["notional"])) > 1:
+                side = "SELL" if float(position["positionAmt"]) > 0 else "BUY"
+                amount = abs(float(position["positionAmt"]))
+                logger.info(f"symbol: {position['symbol']} quantity: {amount} price: {position['entryPrice']}")
+                await client.new_order(symbol=position["symbol"], side=side, type="MARKET", quantity=amount, reduceOnly="true")
+            elif abs(float(position["notional"])) > 0:
+                logger.info(f"position {position['symbol']} notional: {position['notional']} updateTime: {position['updateTime']}")
+    except Exception as e:
+        logger.exception(e)
+
+
+async def get_balances(client: AsyncClient, state: AccountState = None) -> list:
+    # 推送维护的可用余额只在没有新成交时可信，成交后走一次 REST 刷新
+    if state is None:
+        return await client.balance()
+    balances, version = state.fresh_balances()
+    if balances is None:
+        balances = await client.balance()
+        state.set_balances(balances, version)
+    return balances
+
+
+async def get_open_orders(client: AsyncClient, state: AccountState = None) -> list:
+    orders = state.open_orders() if state is not None else await client.get_orders()
+    live_status.set_orders(client.key, orders)
+    return orders
+
+
+async def cancel_stale_orders(client: AsyncClient, state: AccountState, order_timeout: int, force_close: bool) -> bool:
+    # 有挂单时撤掉超时的并平仓，返回是否存在挂单
+    orders = await get_open_orders(client, state)
+    if orders:
+        live_status.set_phase(client.key, "cancel")
+    for order in orders:
+        logger.info(f"order symbol {order['symbol']} updateTime: {order['updateTime']} diff: {time.time() * 1000 - order['updateTime']}")
+        if time.time() * 1000 - order['updateTime'] > order_timeout:
+            response = await client.cancel_open_orders(symbol=order['symbol'])
+            logger.info(f"cancel order response: {response}")
+            await close_position(client, state, force=force_close)
+    return len(orders) > 0
+
+
+# 每个账户只建一条推送连接，协程异常重启后沿用，不会每次重启都多开一条 websocket
+user_streams = {}
+
+
+async def open_state(client: AsyncClient, use_user_stream: bool):
+    if not use_user_stream:
+        return None
+    stream = user_streams.get(client.key)
+    if stream is None:
+        stream = AsyncUserStream(client)
+        user_streams[client.key] = stream
+    stream.start()
+    try:
+        await asyncio.wait_for(stream.ready.wait(), timeout=30)
+    except asyncio.TimeoutError:
+        logger.error(f"{client.key} async user stream not ready, fall back to REST")
+        return None
+    return stream.state
+
+
+async def place_batch_orders(client: AsyncClient, batch_orders: list, symbol_limit: dict):
+    start = time.time()
+    responses = await client.new_batch_order(format_batch_orders(batch_orders, symbol_limit))
+    round_trip = (time.time() - start) * 1000
+    placed, failed = split_batch_results(batch_orders, responses)
+    metrics.inc_orders_placed(client.key, len(placed))
+    for order, response in failed:
+        logger.error(f"batch order failed: {order['side']} {order['symbol']} code: {response.get('code')} msg: {response.get('msg')}")
+        live_status.set_error(client.key, f"batch order failed: {order['side']} {order['symbol']} code: {response.get('code')} msg: {response.get('msg')}")
+    if failed:
+        for response in placed:
+            try:
+                cancel = await client.cancel_order(symbol=response["symbol"], orderId=response["orderId"])
+                logger.info(f"cancel surviving leg response: {cancel}")
+            except ClientError as error:
+                logger.error(f"cancel surviving leg {response['orderId']} failed: {error.error_message}")
+    logger.info(f"batch order placed: {len(placed)} failed: {len(failed)} round_trip: {round_trip:.1f}ms leg_gap: {leg_gap_ms(placed)}ms")
+    for response in placed:
+        logger.info(f"new order response: {response}")
+    return placed, failed
+
+
+async def run_account(client: AsyncClient, account: dict, symbols: list, use_user_stream: bool):
+    symbol_limits = await get_symbol_limits(client)
+    state = await open_state(client, use_user_stream)
+    pacer = pacing.pacer_of(client.key, 2)
+    while True:
+        sleep_time = pacing.min_delay
+        metrics.inc_loop(client.key)
+        live_status.begin_loop(client.key)
+        try:
+            cost, enough = await check_cost(client, account["cost_per_day"])
+            sleep_time, value = plan_round(client, pacer, cost, account["cost_per_day"])
+            logger.info(f"sleep_time: {sleep_time:.0f} value: {value:.1f}")
+            if enough:
+                logger.info("cost is enough, not trading")
+                live_status.set_phase(client.key, "idle")
+                await close_position(client, state, force=True)
+                await asyncio.sleep(sleep_time)
+                continue
+            if await cancel_stale_orders(client, state, 1000, True):
+                await asyncio.sleep(10)
+                continue
+            await close_position(client, state)
+            symbol = random.choice(symbols)
+            live_status.set_phase(client.key, "quote")
+            book_ticker = await get_book_ticker(client, symbol)
+            logger.info(f"book_ticker: {book_ticker}")
+            balances = await get_balances(client, state)
+            net_balance = 0
+            for balance in balances:
+                if balance["asset"] == "USDT":
+                    net_balance = balance["availableBalance"]
+            if float(net_balance) < 0.001:
+                logger.info("net_balance is less than 0.001, not trading")
+                await asyncio.sleep(sleep_time)
+                continue
+            symbol_limit = symbol_limits[symbol]
+            if float(net_balance) < value:
+                value = 20 * float(net_balance) / 2
+            mid_price, (quantity,) = size_orders(book_ticker, symbol_limit, [value])
+            if mid_price is None:
+                # 价格波动太小，不交易
+                await asyncio.sleep(10)
+                continue
+            if quantity is None:
+                logger.info(f"quantity * mid_price < 5, not trading")
+                await asyncio.sleep(sleep_time)
+                continue
+            logger.info(f"symbol: {symbol} quantity: {quantity} price: {mid_price}")
+            batch_orders = [
+                {"symbol": symbol, "side": side, "quantity": quantity, "price": mid_price, "timeInForce": "GTC", "type": "LIMIT"}
+                for side in ("BUY", "SELL")
+            ]
+            live_status.set_phase(client.key, "order")
+            await place_batch_orders(client, batch_orders, symbol_limit)
+            pacer.traded(value)
+        except ClientError as error:
+            logger.exception(
+                "Found error. status: {}, error code: {}, error message: {}".format(
+                    error.status_code, error.error_code, error.error_message
+                )
+            )
+            live_status.set_error(client.key, f"error code: {error.error_code}, error message: {error.error_message}")
+        await close_position(client, state)
+        live_status.set_phase(client.key, "wait")
+        await asyncio.sleep(sleep_time)
+
+
+async def wind_down(client: AsyncClient, state: AccountState = None):
+    # 退出配对时先撤掉所有挂单再平仓，不留单边敞口
+    try:
+        for symbol in {order["symbol"] for order in await get_open_orders(client, state)}:
+            response = await client.cancel_open_orders(symbol=symbol)
+            logger.info(f"cancel order response: {response}")
+    except Exception as e:
+        logger.exception(e)
+    await close_position(client, state, force=True)
+
+
+async def hedge_round(legs: list, symbols: list, dry_run: bool, sleep_time: float, value: float) -> bool:
+    # 与线程版 hedge_round 一致：撤超时挂单、平残留仓位、两边反向各挂一单，然后等成交。返回是否下了单
+    (account_a, client_a, state_a), (account_b, client_b, state_b) = legs
+    logger.info(f"sleep_time: {sleep_time:.0f} value: {value:.1f}")
+    placed = False
+    try:
+        order_timeout = 300 + random.randint(0, 60 * 10)
+        # 任何一边还有挂单，这一轮两边都不下新单
+        has_orders = False
+        for _, c, state in legs:
+            if await cancel_stale_orders(c, state, order_timeout, False):
+                has_orders = True
+        if has_orders:
+            await asyncio.sleep(10)
+            return placed
+        await close_position(client_a, state_a)
+        await close_position(client_b, state_b)
+
+        symbol_limits = await get_symbol_limits(client_a)
+        symbol = random.choice(symbols)
+        live_status.set_phase(client_a.key, "quote")
+        book_ticker = await get_book_ticker(client_a, symbol)
+        logger.info(f"book_ticker: {book_ticker}")
+        account = await client_a.account()
+        net_balance = calc_net_balance(account, await get_mark_price_dict(client_a))
+        mid_price, quantity = None, None
+        if float(net_balance) >= 0.001:
+            mid_price, (quantity,) = size_orders(book_ticker, symbol_limits[symbol], [value])
+        if quantity is None:
+            await asyncio.sleep(10)
+            return placed
+        logger.info(f"hedge plan -> symbol: {symbol} qty: {quantity} price: {mid_price}")
+        if dry_run:
+            logger.info("dry_run enabled, skip placing orders")
+        else:
+            side_a = random.choice(["BUY", "SELL"])
+            side_b = "SELL" if side_a == "BUY" else "BUY"
+            for (_, client, _), side, name in zip(legs, (side_a, side_b), ("A", "B")):
+                live_status.set_phase(client.key, "order")
+                response = await client.new_order(symbol=symbol, side=side, type="LIMIT", quantity=quantity, price=mid_price, timeInForce="GTC")
+                metrics.inc_orders_placed(client.key)
+                logger.info(f"{name} new order response: {response}")
+                placed = True
+    except ClientError as error:
+        logger.exception(
+            "Found error. status: {}, error code: {}, error message: {}".format(
+                error.status_code, error.error_code, error.error_message
+            )
+        )
+        for client in (client_a, client_b):
+            live_status.set_error(client.key, f"error code: {error.error_code}, error message: {error.error_message}")
+        await close_position(client_a, state_a, force=True)
+        await close_position(client_b, state_b, force=True)
+    except Exception as e:
+        logger.exception(e)
+        for client in (client_a, client_b):
+            live_status.set_error(client.key, e)
+        await close_position(client_a, state_a, force=True)
+        await close_position(client_b, state_b, force=True)
+    for client in (client_a, client_b):
+        live_status.set_phase(client.key, "wait")
+    await asyncio.sleep(sleep_time)
+    return placed
+
+
+async def hedge_turn(scheduler: HedgeScheduler, pair: list, legs: list, symbols: list, dry_run: bool) -> list:
+    # 先查两边当天成本：达到预算的账户撤单平仓、退出配对，另一边回到账户池等下一次配对。返回达到预算的账户
+    finished = []
+    plans = []
+    for entry, (account, client, state) in zip(pair, legs):
+        metrics.inc_loop(client.key)
+        live_status.begin_loop(client.key)
+        cost, enough = await check_cost(client, account.get("cost_per_day", 0))
+        scheduler.record(entry, cost)
+        # 每个账户只挂一条腿；各自按自己的进度决定下次什么时候再进入配对
+        delay, value = plan_round(client, pacing.pacer_of(client.key, 1), cost, account.get("cost_per_day", 0))
+        scheduler.defer(entry, time.time() + delay)
+        plans.append((delay, value))
+        if enough:
+            finished.append((account, client, state))
+    for account, client, state in finished:
+        logger.info(f"{client.key} cost is enough, leave hedge pairing for today")
+        live_status.set_phase(client.key, "idle")
+        await wind_down(client, state)
+    if finished:
+        return finished
+    # 两条腿一起下单，按更落后的一边来：单量取大的；这一对最多占用 hold_time 等成交，之后释放回账户池
+    delay = min(delay for delay, _ in plans)
+    value = max(value for _, value in plans)
+    if await hedge_round(legs, symbols, dry_run, min(delay, hedge_hold_time), value):
+        for _, client, _ in legs:
+            pacing.pacer_of(client.key, 1).traded(value)
+    return finished
+
+
+async def hedge_slot(scheduler: HedgeScheduler, slot: str, symbols: list, dry_run: bool, use_user_stream: bool):
+    # 对冲模式的一个 slot 协程：每轮从调度器租一对剩余预算最多的账户，查成本、下单、等成交后归还
+    while True:
+        pair = scheduler.lease(slot)
+        if pair is None:
+            await asyncio.sleep(hedge_idle_wait)
+            continue
+        finished = []
+        try:
+            legs = []
+            for entry in pair:
+                client = scheduler.leg(entry)
+                legs.append((entry.account, client, await open_state(client, use_user_stream)))
+            finished = await hedge_turn(scheduler, pair, legs, symbols, dry_run)
+        except Exception as e:
+            logger.exception(e)
+            for entry in pair:
+                live_status.set_error(entry.key, e)
+            await asyncio.sleep(10)
+        finally:
+            for entry in pair:
+                if all(entry.account is not account for account, _, _ in finished):
+                    live_status.set_phase(entry.key, "pooled")
+            scheduler.release(pair)
+
+
+async def keep_running(name: str, factory, keys: tuple = ()):
+    # 对应线程版的 thread_function：协程异常退出后 1 秒重启
+    while True:
+        try:
+            logger.info(f"start run {name}")
+            await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"{name} caught exception: {e}")
+            for key in keys:
+                live_status.set_error(key, e)
+        await asyncio.sleep(1)
+
+
+class AsyncRegistry:
+    # 协程版的 WorkerRegistry + HedgePool：按配置维护运行中的账户任务和对冲 slot，重载时只停掉消失的、启动新增的，
+    # 保留下来的账户就地更新配置（cost_per_day 等），不断开推送、不丢缓存
+    def __init__(self, make_client, symbols: list, dry_run: bool, use_user_stream: bool):
+        self.make_client = make_client
+        self.symbols = symbols
+        self.dry_run = dry_run
+        self.use_user_stream = use_user_stream
+        # key -> (运行中共享的配置字典, client, task)
+        self.accounts = {}
+        self.scheduler = HedgeScheduler(make_client)
+        self.slots = []
+        self.count = 0
+
+    async def apply(self, accounts: list, hedge_mode: bool) -> dict:
+        # 对冲模式下所有账户交给调度器动态配对，否则每个账户一个任务；切换模式时先清空另一边
+        if hedge_mode:
+            removed = await self.apply_single([])
+            summary = await self.apply_hedge(accounts)
+        else:
+            removed = await self.apply_hedge([])
+            summary = await self.apply_single(accounts)
+        summary["removed"] = sorted(set(summary["removed"]) | set(removed["removed"]))
+        names = {account["key"]: account for account in accounts}
+        for key in summary["added"]:
+            live_status.register(key, names[key].get("name", ""), names[key].get("cost_per_day", 0))
+        # 停掉的账户关闭推送：删掉的不再需要，改了密钥或代理的下次按新的 client 重连
+        for key in summary["removed"]:
+            stream = user_streams.pop(key, None)
+            if stream is not None:
+                await stream.stop()
+            if key not in names:
+                live_status.remove(key)
+        return summary
+
+    async def apply_single(self, accounts: list) -> dict:
+        wanted = {account["key"]: account for account in accounts}
+        stopped = [key for key, (live, _, _) in self.accounts.items()
+                   if key not in wanted or any(live.get(field) != wanted[key].get(field) for field in restart_fields)]
+        for key in stopped:
+            live, client, task = self.accounts.pop(key)
+            logger.info(f"stopping account task {key[:8]}")
+            await stop_task(task)
+            # 先撤单平仓再启动新配置的任务，同一个账户不会同时被两个任务操作
+            await wind_down(client)
+        added = []
+        updated = 0
+        for key, account in wanted.items():
+            if key in self.accounts:
+                live = self.accounts[key][0]
+                if live != account:
+                    changes = {field: account.get(field) for field in account if live.get(field) != account.get(field)}
+                    logger.info(f"account {key[:8]} updated: {changes}")
+                    live.clear()
+                    live.update(account)
+                    updated += 1
+                continue
+            live = dict(account)
+            client = self.make_client(live)
+            task = asyncio.ensure_future(keep_running(key, lambda a=live, c=client: run_account(c, a, self.symbols, self.use_user_stream), (key,)))
+            self.accounts[key] = (live, client, task)
+            added.append(key)
+        return {"added": added, "removed": stopped, "updated": updated, "running": len(self.accounts)}
+
+    async def apply_hedge(self, accounts: list) -> dict:
+        # 与 HedgePool.apply 的顺序一致：停掉用着退役账户的 slot 和多出来的 slot，给它们的账户收尾，再加入新配置
+        holders = self.scheduler.retire(accounts)
+        wanted = len(accounts) // 2
+        stopped = [slot for slot in self.slots if slot[0] in holders]
+        surplus = len(self.slots) - len(stopped) - wanted
+        if surplus > 0:
+            stopped += [slot for slot in self.slots if slot not in stopped][-surplus:]
+        held = []
+        for name, task in stopped:
+            logger.info(f"stopping hedge slot {name}")
+            held += self.scheduler.held(name)
+            await stop_task(task)
+            self.slots.remove((name, task))
+        for entry in held:
+            if not entry.retired and entry.leg is not None:
+                await wind_down(entry.leg)
+        removed = []
+        for entry in self.scheduler.drop_retired():
+            if entry.leg is not None:
+                await wind_down(entry.leg)
+            removed.append(entry.key)
+        added = self.scheduler.add(accounts)
+        while len(self.slots) < wanted:
+            self.count += 1
+            name = f"hedge-{self.count}"
+            task = asyncio.ensure_future(keep_running(name, lambda n=name: hedge_slot(self.scheduler, n, self.symbols, self.dry_run, self.use_user_stream)))
+            self.slots.append((name, task))
+        return {"added": added, "removed": removed, "slots": len(self.slots), "accounts": len(self.scheduler.keys())}
+
+    async def stop_all(self):
+        # 进程退出：只取消任务，和线程版一样不在退出时撤单平仓
+        for _, _, task in self.accounts.values():
+            await stop_task(task)
+        for _, task in self.slots:
+            await stop_task(task)
+        self.accounts.clear()
+        self.slots.clear()
+
+
+async def stop_task(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.exception(e)
+
+
+async def watch_config(watcher, load_accounts, registry: AsyncRegistry):
+    # 对应线程版 main() 里的重载循环：SIGHUP 或文件修改后重新读配置，只增删变化的账户
+    while True:
+        deadline = time.time() + watcher.interval
+        while not watcher.triggered and time.time() < deadline:
+            await asyncio.sleep(0.2)
+        if not watcher.changed():
+            continue
+        try:
+            accounts, hedge_mode = load_accounts()
+        except Exception as e:
+            # 配置写了一半或格式错误时保持现状，下次修改再重试
+            logger.error(f"reload config failed, keep running accounts:{e}")
+            continue
+        summary = await registry.apply(accounts, hedge_mode)
+        logger.info(f"config reloaded: {summary}")
+
+
+async def reconcile_forever(interval: float = 30):
+    # 对应线程版的 commission_ledger.reconcile_forever：推送连着的账户每 reconcile_interval 秒拉一次流水修正估算；
+    # 推送断开的账户检查成本时自己会拉
+    while True:
+        await asyncio.sleep(interval)
+        for ledger in list(commission_ledger.ledgers.values()):
+            if not ledger.is_streaming() or time.time() - ledger.synced_at < commission_ledger.reconcile_interval:
+                continue
+            try:
+                await reconcile(ledger.client)
+            except Exception as e:
+                logger.exception(f"{ledger.api_key} reconcile commission failed:{e}")
+
+
+async def run_all(config: dict, symbols: list, watcher=None, load_accounts=None):
+    # watcher / load_accounts 由 main() 传入时支持配置重载：load_accounts() 返回 (accounts, hedge_mode)
+    use_user_stream = config.get("async_user_stream", True)
+    pool = SessionPool(pool_size=config.get("http_pool_size", 10))
+
+    def make_client(account: dict) -> AsyncClient:
+        return AsyncClient(account["key"], account["secret"], pool.get(account["proxy"]), account["proxy"], config.get("base_url", base_url))
+
+    registry = AsyncRegistry(make_client, symbols, config.get("dry_run", False), use_user_stream)
+    try:
+        await registry.apply(config["accounts"], config.get("hedge_mode", False))
+        tasks = [reconcile_forever()]
+        if watcher is not None:
+            tasks.append(watch_config(watcher, load_accounts, registry))
+        await asyncio.gather(*tasks)
+    finally:
+        await registry.stop_all()
+        for stream in list(user_streams.values()):
+            await stream.stop()
+        user_streams.clear()
+        await pool.close()
+
+
+def run_async(config: dict, symbols: list, watcher=None, load_accounts=None):
+    asyncio.run(run_all(config, symbols, watcher, load_accounts))
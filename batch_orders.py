@@ -0,0 +1,32 @@
+import json
+
+
+def format_batch_orders(batch_orders: list, symbol_limit: dict) -> str:
+    # 批量下单接口的参数是 JSON 数组，价格和数量需要按精度格式化成字符串
+    payload = []
+    for order in batch_orders:
+        item = dict(order)
+        item["quantity"] = f"{order['quantity']:.{symbol_limit['qty_precision']}f}"
+        item["price"] = f"{order['price']:.{symbol_limit['price_precision']}f}"
+        payload.append(item)
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def split_batch_results(batch_orders: list, responses: list):
+    # 按顺序一一对应，成功的返回订单信息，失败的返回 {"code": ..., "msg": ...}
+    placed = []
+    failed = []
+    for order, response in zip(batch_orders, responses):
+        if "orderId" in response:
+            placed.append(response)
+        else:
+            failed.append((order, response))
+    return placed, failed
+
+
+def leg_gap_ms(placed: list):
+    # 交易所侧两条腿的更新时间差，只有一条腿时返回 None
+    if len(placed) < 2:
+        return None
+    times = [int(response["updateTime"]) for response in placed]
+    return max(times) - min(times)
@@ -0,0 +1,416 @@
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import parse_qsl, urlparse
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from sim_engine import Exchange, decimals
+
+# 基准测试：用内置的假传输层回放按真实规模生成的响应（几百个交易对的 exchange_info / markPrice，
+# 数千条手续费流水），驱动 main.py 的交易循环和各个辅助函数，结果写成 JSON 方便跨提交对比
+
+output_dir = os.path.join("data", "bench")
+market_count = 300
+income_rows = 5000
+default_scale = [1, 10, 50, 100, 250, 500]
+
+
+class StopLoop(BaseException):
+    # 继承 BaseException，穿过 run() / hedge_slot() 里的 except Exception
+    pass
+
+
+def build_markets(count: int, symbols: list) -> dict:
+    rng = random.Random(7)
+    markets = {}
+    names = list(dict.fromkeys(symbols)) + [f"SYM{i:03d}USDT" for i in range(count - len(set(symbols)))]
+    for name in names:
+        price = 10 ** rng.uniform(-3, 4)
+        tick_size = 10 ** (int(f"{price:e}".split("e")[1]) - 4)
+        step_size = 10 ** -max(0, 3 - decimals(tick_size))
+        markets[name] = {"price": price, "tick_size": tick_size, "step_size": step_size, "volatility": 0.0005}
+    return markets
+
+
+def dumps(payload) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+class Payloads:
+    # 启动时一次性生成并序列化，回放时只做切片，不把假服务端的开销算进客户端
+    def __init__(self, symbols: list, markets: int = market_count, incomes: int = income_rows):
+        exchange = Exchange(build_markets(markets, symbols))
+        exchange.add_account("bench", "bench")
+        account = exchange.accounts["bench"]
+        self.exchange_info = dumps(exchange.exchange_info())
+        self.premium_index = dumps(exchange.premium_index())
+        self.book_tickers = {}
+        for market in exchange.markets.values():
+            # 价差 6 个 tick，保证中间价可下单
+            mid = market.round_price(market.mark_price)
+            self.book_tickers[market.symbol] = dumps({
+                "symbol": market.symbol,
+                "bidPrice": f"{mid - 3 * market.tick_size:.{market.price_precision}f}", "bidQty": "1000",
+                "askPrice": f"{mid + 3 * market.tick_size:.{market.price_precision}f}", "askQty": "1000",
+                "time": 0,
+            })
+        self.position_risk = dumps(exchange.position_risk(account))
+        self.account = dumps(exchange.account_info(account))
+        self.balance = dumps(exchange.balance(account))
+        market = next(iter(exchange.markets.values()))
+        order = exchange.order_view({
+            "orderId": 1, "symbol": market.symbol, "side": "BUY", "type": "LIMIT", "timeInForce": "GTC",
+            "clientOrderId": "bench", "orig_qty": 1.0, "price_value": market.mark_price, "reduce_only": False,
+            "executed": 0.0, "cum_quote": 0.0, "status": "NEW", "time": 0, "update_time": 0,
+        })
+        self.order = order
+        self.batch = dumps([dict(order, side="BUY"), dict(order, side="SELL", orderId=2)])
+        # 当天 0 点到现在均匀分布的手续费流水
+        start = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+        end = int(time.time() * 1000) - 1000
+        rng = random.Random(11)
+        times = sorted(rng.randint(start, end) for _ in range(incomes))
+        self.incomes = [{
+            "symbol": rng.choice(symbols), "incomeType": "COMMISSION", "income": f"{-rng.uniform(0.001, 0.1):.8f}",
+            "asset": rng.choice(["USDT", "USDT", "USDT", "ASTER"]), "info": "COMMISSION", "time": t,
+            "tranId": 9000000 + i, "tradeId": str(7000000 + i),
+        } for i, t in enumerate(times)]
+        self.income_times = times
+
+
+class FakeTransport(HTTPAdapter):
+    # 挂到 client.session 上替代真实连接，按路径返回预先生成的响应，并统计调用数和字节数
+    def __init__(self, payloads: Payloads):
+        super().__init__()
+        self.payloads = payloads
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.bytes = {}
+        self.cpu = 0.0
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes = {}
+            self.cpu = 0.0
+
+    def totals(self, key: str = None):
+        with self.lock:
+            if key is not None:
+                return self.calls.get(key, 0), self.bytes.get(key, 0)
+            return sum(self.calls.values()), sum(self.bytes.values())
+
+    def route(self, method: str, path: str, params: dict) -> bytes:
+        payloads = self.payloads
+        if path == "/fapi/v1/exchangeInfo":
+            return payloads.exchange_info
+        if path == "/fapi/v1/premiumIndex":
+            return payloads.premium_index
+        if path == "/fapi/v1/ticker/bookTicker":
+            return payloads.book_tickers[params["symbol"]]
+        if path == "/fapi/v2/positionRisk":
+            return payloads.position_risk
+        if path == "/fapi/v2/account":
+            return payloads.account
+        if path == "/fapi/v2/balance":
+            return payloads.balance
+        if path == "/fapi/v1/openOrders":
+            return b"[]"
+        if path == "/fapi/v1/income":
+            start = int(params.get("startTime", 0))
+            end = int(params.get("endTime", time.time() * 1000))
+            limit = int(params.get("limit", 100))
+            index = bisect.bisect_left(payloads.income_times, start)
+            return dumps([row for row in payloads.incomes[index:index + limit] if row["time"] <= end])
+        if path == "/fapi/v1/batchOrders":
+            return payloads.batch
+        if path in ("/fapi/v1/order", "/fapi/v1/allOpenOrders"):
+            return dumps(dict(payloads.order, symbol=params.get("symbol", payloads.order["symbol"])))
+        if path == "/fapi/v1/listenKey":
+            return b'{"listenKey":"bench"}'
+        return b"{}"
+
+    def send(self, request, **kwargs):
+        # thread_time 只算本线程，多账户并发时不会把别的线程算进假服务端
+        start = time.thread_time()
+        parsed = urlparse(request.url)
+        params = dict(parse_qsl(parsed.query))
+        content = self.route(request.method, parsed.path, params)
+        key = request.headers.get("X-MBX-APIKEY", "")
+        response = Response()
+        response.status_code = 200
+        response._content = content
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json", "X-MBX-USED-WEIGHT-1M": "1"})
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.bytes[key] = self.bytes.get(key, 0) + len(content)
+            self.cpu += time.thread_time() - start
+        return response
+
+
+class LoopClock:
+    # 替换 main 模块里的 time：sleep 视为一轮结束，数到上限后抛 StopLoop
+    def __init__(self, loops: int):
+        self.loops = loops
+        self.local = threading.local()
+        self.time = time.time
+        self.perf_counter = time.perf_counter
+
+    def start(self):
+        self.local.count = 0
+
+    def sleep(self, seconds: float = 0):
+        self.local.count = getattr(self.local, "count", 0) + 1
+        if self.local.count >= self.loops:
+            raise StopLoop()
+
+
+class Bench:
+    def __init__(self, loops: int):
+        import main
+        import market_data
+        import pricing
+        import symbol_limits
+        self.main = main
+        self.market_data = market_data
+        self.pricing = pricing
+        self.symbol_limits = symbol_limits
+        self.payloads = Payloads(main.symbols)
+        self.transport = FakeTransport(self.payloads)
+        self.clock = LoopClock(loops)
+        main.create_client = self.create_client
+        # 基准只测 REST 路径，不连推送
+        main.open_account_state = lambda client, key, proxy=None: None
+        main.time = self.clock
+        main.wait_for_fills = lambda sleep_time, fill_event, legs, worker=None: self.clock.sleep()
+
+    def create_client(self, key: str, secret: str, proxy: str = ""):
+        from aster.rest_api import Client
+        client = Client(key, secret, base_url="https://bench.invalid")
+        client.session.mount("https://", self.transport)
+        return client
+
+    def reset_caches(self):
+        import commission_ledger
+        commission_ledger.ledgers.clear()
+        self.symbol_limits.symbol_limits_service.limits = None
+        self.symbol_limits.symbol_limits_service.fetched_at = 0
+        self.market_data.mark_price_cache.prices = {}
+        self.market_data.mark_price_cache.updated_at = 0
+        self.market_data.book_ticker_feed.tickers = {}
+        for directory in (os.path.join("data", "ledger"), os.path.dirname(self.symbol_limits.cache_file)):
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if os.path.isfile(path):
+                        os.remove(path)
+
+    def measure(self, func, repeat: int, key: str = "k0") -> dict:
+        self.transport.reset()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for _ in range(repeat):
+            func()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu - self.transport.cpu
+        calls, size = self.transport.totals()
+        return {
+            "calls": calls / repeat,
+            "bytes": size / repeat,
+            "cpu_ms": cpu * 1000 / repeat,
+            "wall_ms": wall * 1000 / repeat,
+        }
+
+    def functions(self, repeat: int) -> dict:
+        main = self.main
+        client = self.create_client("k0", "s0")
+        results = {}
+        self.reset_caches()
+        results["build_symbol_limits_cold"] = self.measure(lambda: (self.reset_caches(), main.build_symbol_limits(client)), repeat)
+        results["build_symbol_limits_warm"] = self.measure(lambda: main.build_symbol_limits(client), repeat)
+
+        def calc_cost_cold():
+            self.reset_caches()
+            main.calc_cost(client, "k0", 1000)
+        results["calc_cost_cold"] = self.measure(calc_cost_cold, repeat)
+        results["calc_cost_warm"] = self.measure(lambda: main.calc_cost(client, "k0", 1000), repeat)
+
+        def net_balance():
+            self.market_data.mark_price_cache.updated_at = 0
+            main.get_net_balance(client, client.account())
+        results["get_net_balance"] = self.measure(net_balance, repeat)
+        symbol_limits = main.build_symbol_limits(client)
+
+        def symbol_and_qty():
+            self.market_data.book_ticker_feed.tickers = {}
+            main.compute_symbol_and_qty(client, symbol_limits)
+        results["compute_symbol_and_qty"] = self.measure(symbol_and_qty, repeat)
+        book_ticker = json.loads(self.payloads.book_tickers[main.symbols[0]])
+        values = [250] * 500
+        results["size_orders_500"] = self.measure(lambda: self.pricing.size_orders(book_ticker, symbol_limits[main.symbols[0]], values), repeat)
+        return results
+
+    def run_loops(self, count: int, hedge: bool = False) -> dict:
+        # count 个账户各跑 clock.loops 轮，返回吞吐和每轮开销
+        main = self.main
+        self.reset_caches()
+        self.transport.reset()
+        accounts = [{"key": f"k{i}", "secret": f"s{i}", "proxy": "", "cost_per_day": 1e9} for i in range(count)]
+
+        def target(*args):
+            self.clock.start()
+            try:
+                if hedge:
+                    main.hedge_slot(*args)
+                else:
+                    main.run(*args)
+            except StopLoop:
+                pass
+
+        if hedge:
+            # 与主程序一样：账户交给调度器，每两个账户一个 slot
+            scheduler = main.HedgeScheduler(main.prepare_leg)
+            # 基准不按 pacing 推迟下一轮，每轮都能租到一对，测的是下单路径而不是空等
+            scheduler.defer = lambda entry, due: None
+            scheduler.add(accounts)
+            jobs = [(scheduler, False) for _ in range(count // 2)]
+        else:
+            jobs = [(a["key"], a["secret"], a["proxy"], a["cost_per_day"]) for a in accounts]
+        threads = [threading.Thread(target=target, args=job) for job in jobs]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu - self.transport.cpu
+        loops = len(jobs) * self.clock.loops
+        calls, size = self.transport.totals()
+        return {
+            "accounts": count,
+            "loops": loops,
+            "loops_per_sec": loops / wall,
+            "calls_per_loop": calls / loops,
+            "bytes_per_loop": size / loops,
+            "cpu_ms_per_loop": cpu * 1000 / loops,
+            "wall_s": wall,
+        }
+
+    def scale(self, counts: list, memory: bool) -> list:
+        results = []
+        for count in counts:
+            result = self.run_loops(count)
+            if memory:
+                # 单独跑一遍测内存，tracemalloc 会拖慢吞吐
+                tracemalloc.start()
+                self.run_loops(count)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result["peak_kb_per_account"] = peak / 1024 / count
+            results.append(result)
+            print(f"  {count:>4} accounts: {result['loops_per_sec']:.1f} loops/s, {result['cpu_ms_per_loop']:.2f} cpu ms/loop", file=sys.stderr)
+        return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(result: dict, prefix: str = "") -> dict:
+    values = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                values.update(flatten(item, f"{name}[{item.get('accounts')}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(old: dict, new: dict) -> str:
+    old_values = flatten(old["results"])
+    new_values = flatten(new["results"])
+    lines = [f"{old['revision']} -> {new['revision']}"]
+    for name, value in new_values.items():
+        before = old_values.get(name)
+        if before is None or name.endswith(".accounts") or name.endswith(".loops"):
+            continue
+        change = (value - before) / before * 100 if before else 0
+        lines.append(f"{name:<55} {before:>14.3f} {value:>14.3f} {change:>+8.1f}%")
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="交易循环与批量脚本的基准测试")
+    parser.add_argument("--loops", type=int, default=20, help="每个账户跑几轮")
+    parser.add_argument("--repeat", type=int, default=20, help="单个函数重复次数")
+    parser.add_argument("--scale", default=",".join(map(str, default_scale)), help="逐级增加的账户数")
+    parser.add_argument("--no-memory", action="store_true", help="跳过内存测量")
+    parser.add_argument("--output", help="结果文件，默认 data/bench/bench-<revision>-<time>.json")
+    parser.add_argument("--compare", help="与之前的结果文件对比")
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    root = os.getcwd()
+    revision = git_revision()
+    # 在临时目录里跑，日志、账本、交易规则缓存都不落到工作目录
+    workdir = tempfile.mkdtemp(prefix="aster-bench-")
+    os.chdir(workdir)
+    try:
+        bench = Bench(args.loops)
+        print("functions", file=sys.stderr)
+        functions = bench.functions(args.repeat)
+        print("run / hedge_slot", file=sys.stderr)
+        loops = {"run": bench.run_loops(1), "hedge_run": bench.run_loops(2, hedge=True)}
+        print("scale", file=sys.stderr)
+        scale = bench.scale([int(n) for n in args.scale.split(",")], not args.no_memory)
+    finally:
+        os.chdir(root)
+    report = {
+        "revision": revision,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"loops": args.loops, "repeat": args.repeat, "markets": market_count, "income_rows": income_rows},
+        "results": {"functions": functions, "loops": loops, "scale": scale},
+    }
+    path = args.output or os.path.join(output_dir, f"bench-{revision}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {path}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print(compare(json.load(f), report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import subprocess
+import sys
+from datetime import datetime
+import os
+import yaml
+
+# 多进程模式下 supervisor 给每个分片指定单独的日志目录
+log_dir = os.environ.get("ASTER_LOG_DIR", "logs")
+# 压测时用 ASTER_CONFIG 指向模拟服务生成的配置
+config_path = os.environ.get("ASTER_CONFIG", "config.yaml")
+# 交易线程只往队列里放记录，队列满了直接丢弃并计数，不阻塞下单
+log_queue_size = 10000
+listeners = {}
+
+# 压缩在独立进程里做，写日志的线程只负责改名
+compress_script = """
+import gzip, os, shutil, sys
+src, dst = sys.argv[1], sys.argv[2]
+with open(src, "rb") as f_in, gzip.open(dst + ".tmp", "wb") as f_out:
+    shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+os.replace(dst + ".tmp", dst)
+os.remove(src)
+"""
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 还在压缩的子进程，下次滚动时回收已经结束的，不留僵尸进程
+        self.compressors = []
+
+    def doRollover(self):
+        # 调用父类的doRollover方法，进行日志文件滚动
+        super().doRollover()
+        
+        # # 获取滚动后的文件名
+        rotated_filename = self.baseFilename + ".1"
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        pending_filename = self.baseFilename + "." + stamp
+        index = 1
+        while os.path.exists(pending_filename) or os.path.exists(pending_filename + ".gz"):
+            pending_filename = f"{self.baseFilename}.{stamp}-{index}"
+            index += 1
+        target_filename = pending_filename + ".gz"
+        
+        # 先改成带时间戳的名字再交给子进程压缩，下次滚动不会覆盖还没压完的文件
+        self.compressors = [process for process in self.compressors if process.poll() is None]
+        if os.path.exists(rotated_filename):
+            os.replace(rotated_filename, pending_filename)
+            self.compressors.append(subprocess.Popen([sys.executable, "-c", compress_script, pending_filename, target_filename],
+                                                     stdin=subprocess.DEVNULL, close_fds=True))
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 在调用线程里把参数合进消息、异常堆栈转成文本，时间戳和行格式留给后台写线程。
+        # 不带 args 和 exc_info 入队：可变参数不会在写出前被改掉，堆栈帧和其中的局部变量也不会在队列里滞留
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogWriter(logging.handlers.QueueListener):
+    # 后台线程负责格式化和写文件，丢弃的条数在下一条日志前补记一行
+    def __init__(self, log_queue: queue.Queue, queue_handler: DroppingQueueHandler, *handlers):
+        super().__init__(log_queue, *handlers)
+        self.queue_handler = queue_handler
+        self.reported = 0
+
+    def handle(self, record):
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported:
+            warning = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                        "log queue full, dropped %d records", (dropped - self.reported,), None)
+            self.reported = dropped
+            super().handle(warning)
+        super().handle(record)
+
+    def stop(self):
+        # 队列满时 put_nowait 放不进结束标记会抛 queue.Full，这里等写线程腾出位置；
+        # 写线程卡住时放弃等待，它是守护线程，不会挡住进程退出
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=5)
+        except queue.Full:
+            self._thread = None
+            return
+        self._thread.join()
+        self._thread = None
+
+def dropped_records() -> dict:
+    return {name: listener.queue_handler.dropped for name, listener in listeners.items()}
+
+def stop_logging():
+    # 进程退出前把队列里剩下的记录写完
+    for listener in list(listeners.values()):
+        listener.stop()
+    listeners.clear()
+
+atexit.register(stop_logging)
+
+def get_logger(name) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False  # 禁止传播到根日志记录器
+    
+    # 如果已有处理器则先清除（避免重复添加）
+    if logger.handlers:
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+    if name in listeners:
+        listeners.pop(name).stop()
+    
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir, exist_ok=True)
+
+    # 文件处理器配置保持不变
+    single_file_size = 1 * 1024 * 1024 * 1024 # 1GB
+    monitorHandler = CompressedRotatingFileHandler(filename=os.path.join(log_dir, f"{name}.log"), maxBytes=single_file_size, backupCount=5)
+
+    monitorHandler.setLevel(logging.INFO)
+    monitorFormatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    monitorHandler.setFormatter(monitorFormatter)
+    
+    # 移除所有控制台处理器（如果有）
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        if isinstance(handler, logging.StreamHandler):
+            root_logger.removeHandler(handler)
+
+    log_queue = queue.Queue(maxsize=log_queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = LogWriter(log_queue, queue_handler, monitorHandler)
+    listener.start()
+    listeners[name] = listener
+    logger.addHandler(queue_handler)
+    return logger
+
+def load_config(path: str = config_path) -> dict:
+    with open(path, "r") as f:
+        config = yaml.safe_load(f)
+    # 兼容旧配置
+    if "hedge_mode" not in config:
+        config["hedge_mode"] = False
+    if "dry_run" not in config:
+        config["dry_run"] = False
+    if "engine" not in config:
+        config["engine"] = "thread"
+    return config
+
+def configure_endpoints(config: dict):
+    # base_url / stream_url 可以指向本地模拟服务（simulator.py），不配置时用正式地址
+    import market_data
+    if "stream_url" in config:
+        market_data.stream_url = config["stream_url"]
+    if "base_url" in config:
+        import http_pool
+        http_pool.base_url = config["base_url"]
+
+def create_client(account: dict, timeout: float = None):
+    # 延迟导入，只有真正需要 REST 的子命令才加载 aster / requests
+    from http_pool import create_pooled_client
+    return create_pooled_client(account["key"], account["secret"], account["proxy"], timeout=timeout)
+
+def use_disk_market_cache(ttl: float = 60):
+    # 短命令行进程之间复用落盘的标记价格，交易规则本身已经落盘
+    from market_data import mark_price_cache
+    mark_price_cache.use_disk_cache(ttl)
@@ -1,72 +1,14 @@
-import logging
-import logging.handlers
-from aster.rest_api import Client
-from aster.lib.utils import config_logging
-from aster.error import ClientError
-from aster.websocket.client.stream import WebsocketClient
-import time
-import random
-import yaml
-import threading
-from datetime import datetime
-import os
-import gzip
+from bootstrap import get_logger, use_disk_market_cache
+from fanout import fanout_main
+from http_pool import create_pooled_client
+from market_data import get_mark_price_dict
+import sys
 
 
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
-    def doRollover(self):
-        # 调用父类的doRollover方法，进行日志文件滚动
-        super().doRollover()
-
-        # # 获取滚动后的文件名
-        rotated_filename = self.baseFilename + ".1"
-        target_filename = self.baseFilename + "." + datetime.now().strftime("%Y%m%d-%H%M%S") + ".gz"
-
-        # 压缩滚动后的日志文件
-        if os.path.exists(rotated_filename):
-            with open(rotated_filename, 'rb') as f_in:
-                with gzip.open(target_filename, 'wb') as f_out:
-                    f_out.writelines(f_in)
-
-            # 删除未压缩的滚动文件
-            os.remove(rotated_filename)
-
-def get_logger(name) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.propagate = False  # 禁止传播到根日志记录器
-
-    # 如果已有处理器则先清除（避免重复添加）
-    if logger.handlers:
-        for handler in logger.handlers:
-            logger.removeHandler(handler)
-
-    # 文件处理器配置保持不变
-    single_file_size = 1 * 1024 * 1024 * 1024 # 1GB
-    monitorHandler = CompressedRotatingFileHandler(filename=os.path.join(log_dir, f"{name}.log"), maxBytes=single_file_size, backupCount=5)
-
-    monitorHandler.setLevel(logging.INFO)
-    monitorFormatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    monitorHandler.setFormatter(monitorFormatter)
-
-    # 移除所有控制台处理器（如果有）
-    root_logger = logging.getLogger()
-    for handler in root_logger.handlers[:]:
-        if isinstance(handler, logging.StreamHandler):
-            root_logger.removeHandler(handler)
-
-    logger.addHandler(monitorHandler)
-    return logger
-
 logger = get_logger("aster_balance")
 
-def run(key, secret, proxy, cost_per_day):
-    proxies = { 'https': proxy }
-    client = Client(key, secret,base_url="https://fapi.asterdex.com", proxies=proxies)
+def run(key, secret, proxy, cost_per_day, timeout: float = None):
+    client = create_pooled_client(key, secret, proxy, timeout=timeout)
     account = client.account()
     '''
     {
@@ -142,11 +84,8 @@ def run(key, secret, proxy, cost_per_day):
     }
     '''
     # print balance marginBalance and asset position
-    mark_price_dict = {}
-    mark_price_info = client.mark_price()
+    mark_price_dict = get_mark_price_dict(client)
     net_balance = 0
-    for mark_price_info in mark_price_info:
-        mark_price_dict[mark_price_info['symbol']] = mark_price_info
     #logger.info(f"mark_price: {mark_price_dict}")
     for asset in account['assets']:
         if abs(float(asset['marginBalance'])) <= 1e-10:
@@ -168,31 +107,17 @@ def run(key, secret, proxy, cost_per_day):
         # net_balance += float(position['notional'])/float(position['leverage'])
     # logger.info(f"{key}: totalWalletBalance: {account['totalWalletBalance']} totalMarginBalance: {account['totalMarginBalance']} totalCrossWalletBalance: {account['totalCrossWalletBalance']} account:{account}")
     logger.info(f"{key}: net_balance: {net_balance}")
+    return {"net_balance": round(net_balance, 4)}
 
 
-def thread_function(key, secret, proxy, cost_per_day):
-    try:
-        logger.info(f"start run {key} {proxy} {cost_per_day}")
-        run(key, secret, proxy, cost_per_day)
-    except Exception as e:
-        print(f"Caught exception: {e} key: {key} proxy:{proxy}")
-        # 此处可添加错误恢复逻辑（如重试、清理资源等）
-    # 异常处理后，循环继续，线程不会终止
-    time.sleep(1)  # 模拟后续操作
+def run_account(account: dict, timeout: float):
+    logger.info(f"start run {account['key']} {account['proxy']} {account['cost_per_day']}")
+    return run(account["key"], account["secret"], account["proxy"], account["cost_per_day"], timeout)
 
-def init_accounts():
-    with open("config.yaml", "r") as f:
-        config = yaml.safe_load(f)
-    return config["accounts"]
+def main(argv: list = None) -> int:
+    # 按代理限制并发，结果按配置顺序汇总输出，有失败的账户时返回非 0
+    use_disk_market_cache()
+    return fanout_main("查询所有账户的净值", run_account, argv)
 
 if __name__ == "__main__":
-    accounts = init_accounts()
-    threads = []
-    for account in accounts:
-        # run in parallel
-        thread = threading.Thread(target=thread_function, args=(account["key"], account["secret"], account["proxy"], account["cost_per_day"]))
-        thread.start()
-        threads.append(thread)
-    # wait for all threads to finish
-    for thread in threads:
-        thread.join()
\ No newline at end of file
+    sys.exit(main())
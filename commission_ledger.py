@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from market_data import get_mark_price_dict
+
+logger = logging.getLogger("aster")
+
+ledger_dir = os.path.join("data", "ledger")
+# 保留最近几天的流水文件，其余在换日时清理
+keep_days = 7
+page_limit = 1000
+# 有账户推送时成交实时按估算计入，后台每隔这么久用收支流水对一次账，修正估算的偏差
+reconcile_interval = 300
+# 成交推送里没有手续费字段时按费率 × 成交额估算
+maker_rate = 0.0002
+taker_rate = 0.0004
+# 推送这么久没有动静（收到消息或接收循环空转一圈）就不再信任，成本检查时当场拉流水
+stream_timeout = 90
+
+
+def configure(config: dict):
+    global reconcile_interval, maker_rate, taker_rate, stream_timeout
+    reconcile_interval = config.get("reconcile_interval", reconcile_interval)
+    stream_timeout = config.get("stream_timeout", stream_timeout)
+    maker_rate = config.get("maker_rate", maker_rate)
+    taker_rate = config.get("taker_rate", taker_rate)
+
+
+def day_range(now: datetime):
+    start_time = int(now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+    end_time = int(now.replace(hour=23, minute=59, second=59, microsecond=999999).timestamp() * 1000)
+    return start_time, end_time
+
+
+def row_id(income: dict):
+    return f"{income.get('tranId')}:{income.get('asset')}:{income.get('tradeId', '')}"
+
+
+def asset_price(mark_price_dict: dict, asset: str) -> float:
+    if asset == "USDT":
+        return 1
+    symbol = asset + "USDT"
+    if symbol in mark_price_dict:
+        return float(mark_price_dict[symbol]["markPrice"])
+    logger.error(f"symbol {symbol} not found in mark_price_dict")
+    return 0
+
+
+class CommissionLedger:
+    # 单账户的手续费流水：只增量拉取游标之后的新记录，并追加写入本地文件，重启后从文件恢复
+    def __init__(self, client, api_key: str, store_dir: str = ledger_dir):
+        self.client = client
+        self.api_key = api_key
+        self.store_dir = store_dir
+        self.account_id = hashlib.sha1(api_key.encode()).hexdigest()[:16]
+        # lock 只保护内存里的账本，持有时不走网络；sync_lock 保证同一时间只有一个线程在拉流水
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.day = None
+        self.day_end = 0
+        self.cursor_time = 0
+        # cursor_time 这一毫秒内已经记录过的流水，避免同一毫秒的记录重复计入
+        self.cursor_ids = set()
+        self.totals = {}
+        self.rows = 0
+        # 当天成本（USDT，与收支流水同号，为负数）= 上次对账时的流水合计 + 之后推送来的成交估算
+        self.settled_cost = 0
+        self.pending = {}
+        self.pending_cost = 0
+        self.synced_at = 0
+        # 账户推送连着时成交会实时计入，断开期间只能当场拉流水
+        self.streaming = False
+        self.stream_seen_at = 0
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir, exist_ok=True)
+
+    def store_path(self, day: str):
+        return os.path.join(self.store_dir, f"{self.account_id}-{day}.jsonl")
+
+    def roll_day(self):
+        day = datetime.now().strftime("%Y%m%d")
+        if day == self.day:
+            return
+        if self.day is not None:
+            logger.info(f"{self.api_key} commission ledger rollover {self.day} -> {day}")
+        self.day = day
+        self.day_end = day_range(datetime.now())[1]
+        self.cursor_time = 0
+        self.cursor_ids = set()
+        self.totals = {}
+        self.rows = 0
+        self.settled_cost = 0
+        self.pending = {}
+        self.pending_cost = 0
+        self.synced_at = 0
+        self.load()
+        self.cleanup()
+
+    def load(self):
+        path = self.store_path(self.day)
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    income = json.loads(line)
+                except ValueError:
+                    # 进程被杀时可能留下半行，忽略即可，下次同步会重新拉到
+                    logger.warning(f"{self.api_key} skip broken ledger line in {path}")
+                    continue
+                self.apply(income)
+        logger.info(f"{self.api_key} commission ledger loaded {self.rows} rows, cursor: {self.cursor_time}")
+
+    def cleanup(self):
+        oldest = (datetime.now() - timedelta(days=keep_days)).strftime("%Y%m%d")
+        prefix = self.account_id + "-"
+        for name in os.listdir(self.store_dir):
+            if not name.startswith(prefix) or not name.endswith(".jsonl"):
+                continue
+            if name[len(prefix):-len(".jsonl")] < oldest:
+                try:
+                    os.remove(os.path.join(self.store_dir, name))
+                except OSError as e:
+                    logger.error(f"remove ledger file {name} failed:{e}")
+
+    def is_seen(self, income: dict):
+        income_time = int(income["time"])
+        if income_time < self.cursor_time:
+            return True
+        return income_time == self.cursor_time and row_id(income) in self.cursor_ids
+
+    def apply(self, income: dict):
+        if self.is_seen(income):
+            return False
+        income_time = int(income["time"])
+        if income_time > self.cursor_time:
+            self.cursor_time = income_time
+            self.cursor_ids = set()
+        self.cursor_ids.add(row_id(income))
+        asset = income["asset"]
+        self.totals[asset] = self.totals.get(asset, 0) + float(income.get("income", 0))
+        self.rows += 1
+        return True
+
+    def begin_sync(self):
+        # 返回本次需要拉取的时间范围，调用方持有 lock
+        self.roll_day()
+        start_time, end_time = day_range(datetime.now())
+        return max(start_time, self.cursor_time), end_time
+
+    def ingest(self, items: list, start_time: int):
+        # 写入一页流水，返回下一页的 startTime，没有下一页时返回 None
+        new_rows = []
+        for income in items:
+            if income.get("incomeType", "COMMISSION") != "COMMISSION":
+                continue
+            if self.apply(income):
+                new_rows.append(income)
+        if new_rows:
+            self.append(new_rows)
+            logger.info(f"{self.api_key} commission ledger +{len(new_rows)} rows, total rows: {self.rows}")
+        if len(items) < page_limit:
+            return None
+        # 整页都在游标这一毫秒内时，往后推进 1ms，防止死循环
+        return self.cursor_time if new_rows else start_time + 1
+
+    def sync(self):
+        with self.sync_lock:
+            with self.lock:
+                start_time, end_time = self.begin_sync()
+            while start_time is not None:
+                try:
+                    items = self.client.get_income_history(startTime=start_time, endTime=end_time, incomeType="COMMISSION", limit=page_limit)
+                except Exception as e:
+                    # 保留已经落盘的部分，下一轮从游标继续
+                    logger.exception(f"get income history error:{e}")
+                    break
+                # 翻页节奏交给 http_pool 里的权重调度器控制
+                with self.lock:
+                    start_time = self.ingest(items, start_time)
+            with self.lock:
+                return dict(self.totals)
+
+    def settle(self, mark_price_dict: dict) -> float:
+        # 同步完流水后调用：流水合计按当前标记价格折成 USDT，已经出现在流水里的成交不再单独计入
+        with self.lock:
+            estimate = self.settled_cost + self.pending_cost
+            previous = self.synced_at
+            self.settled_cost = sum(income * asset_price(mark_price_dict, asset) for asset, income in self.totals.items())
+            self.pending = {trade: entry for trade, entry in self.pending.items() if entry[0] > self.cursor_time}
+            self.pending_cost = sum(cost for _, cost in self.pending.values())
+            self.synced_at = time.time()
+            cost = self.settled_cost + self.pending_cost
+        if previous and abs(cost - estimate) > 0.01:
+            logger.info(f"{self.api_key} commission reconciled, estimate: {estimate:.4f} actual: {cost:.4f}")
+        return cost
+
+    def reconcile(self, mark_price_dict: dict) -> float:
+        self.sync()
+        return self.settle(mark_price_dict)
+
+    def record_fill(self, order: dict, mark_price_dict: dict):
+        # ORDER_TRADE_UPDATE 里的一笔成交：手续费优先取推送里的 n / N，没有时按费率 × 成交额估算
+        trade_time = int(order.get("T") or time.time() * 1000)
+        trade = (order["s"], order.get("t"))
+        if order.get("N") and order.get("n") is not None:
+            asset, amount = order["N"], float(order["n"])
+        else:
+            asset = "USDT"
+            amount = float(order["l"]) * float(order["L"]) * (maker_rate if order.get("m") else taker_rate)
+        cost = -amount * asset_price(mark_price_dict, asset)
+        with self.lock:
+            self.roll_day()
+            # 昨天的成交、已经同步进流水的成交、重复推送都不再计入
+            if trade_time < day_range(datetime.now())[0] or trade_time <= self.cursor_time or trade in self.pending:
+                return
+            self.pending[trade] = (trade_time, cost)
+            self.pending_cost += cost
+
+    def attach_stream(self):
+        # 推送（重新）连上：断开期间漏掉的成交由下一次检查当场对账补上
+        with self.lock:
+            self.streaming = True
+            self.stream_seen_at = time.time()
+            self.synced_at = 0
+
+    def detach_stream(self):
+        with self.lock:
+            self.streaming = False
+
+    def touch_stream(self):
+        # 推送的接收循环还活着：每条消息和每次接收超时都调用一次
+        self.stream_seen_at = time.time()
+
+    def is_streaming(self) -> bool:
+        # 只标记了连上还不够，接收线程卡住或连接假活时 stream_seen_at 不再更新
+        return self.streaming and time.time() - self.stream_seen_at < stream_timeout
+
+    def needs_reconcile(self) -> bool:
+        # 推送活着且今天对过账时，成本直接读内存；否则检查时当场拉流水（换日也在拉流水时处理）
+        return not self.is_streaming() or not self.synced_at or time.time() * 1000 > self.day_end
+
+    def cost(self) -> float:
+        with self.lock:
+            return self.settled_cost + self.pending_cost
+
+    def append(self, rows: list):
+        with open(self.store_path(self.day), "a") as f:
+            for income in rows:
+                f.write(json.dumps({
+                    "time": int(income["time"]),
+                    "tranId": income.get("tranId"),
+                    "tradeId": income.get("tradeId", ""),
+                    "symbol": income.get("symbol", ""),
+                    "asset": income["asset"],
+                    "income": income.get("income", "0"),
+                }, separators=(",", ":")) + "\n")
+            f.flush()
+
+
+ledgers = {}
+ledgers_lock = threading.Lock()
+
+
+def reconcile_forever(get_mark_price_dict, interval: float = 30):
+    # 后台对账：推送连着的账户每 reconcile_interval 秒拉一次流水修正估算；推送断开的账户检查时自己会拉
+    while True:
+        time.sleep(interval)
+        for ledger in list(ledgers.values()):
+            if not ledger.is_streaming() or time.time() - ledger.synced_at < reconcile_interval:
+                continue
+            try:
+                ledger.reconcile(get_mark_price_dict(ledger.client))
+            except Exception as e:
+                logger.exception(f"{ledger.api_key} reconcile commission failed:{e}")
+
+
+def get_ledger(client, api_key: str) -> CommissionLedger:
+    # 每个账户进程内只保留一个账本，run() 重启后换了新的 client 也继续使用原游标
+    with ledgers_lock:
+        ledger = ledgers.get(api_key)
+        if ledger is None:
+            ledger = CommissionLedger(client, api_key)
+            ledgers[api_key] = ledger
+        else:
+            ledger.client = client
+        return ledger
+
+
+def calc_cost(client, api_key: str) -> float:
+    # 命令行用：没有账户推送，每次都增量拉取流水再按标记价格折成 USDT
+    return get_ledger(client, api_key).reconcile(get_mark_price_dict(client))
@@ -0,0 +1,127 @@
+import argparse
+import csv
+import io
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from bootstrap import config_path, configure_endpoints, load_config
+
+
+def run_fanout(accounts: list, task, concurrency: int = 4, timeout: float = 60, max_workers: int = 32) -> list:
+    # 按代理限制并发地对每个账户执行 task(account)，结果按 accounts 原顺序返回
+    results = [None] * len(accounts)
+    lock = threading.Lock()
+    wakeup = threading.Event()
+    pending = deque(range(len(accounts)))
+    running = {}
+    active = defaultdict(int)
+
+    def record(index: int, ok: bool, start: float, result=None, error: str = ""):
+        account = accounts[index]
+        with lock:
+            if results[index] is not None:
+                # 已经判定超时的账户，迟到的结果直接丢弃
+                return
+            results[index] = {
+                "index": index,
+                "name": account.get("name", ""),
+                "key": account["key"],
+                "proxy": account.get("proxy", ""),
+                "ok": ok,
+                "latency_ms": round((time.time() - start) * 1000, 1),
+                "result": result or {},
+                "error": error,
+            }
+        wakeup.set()
+
+    def worker(index: int, start: float):
+        try:
+            record(index, True, start, task(accounts[index]))
+        except Exception as e:
+            record(index, False, start, error=str(e))
+
+    while pending or running:
+        for index in list(pending):
+            if len(running) >= max_workers:
+                break
+            proxy = accounts[index].get("proxy", "")
+            if active[proxy] >= concurrency:
+                continue
+            pending.remove(index)
+            active[proxy] += 1
+            start = time.time()
+            # 守护线程：超时的账户不再等待，也不会阻止进程退出
+            thread = threading.Thread(target=worker, args=(index, start), daemon=True)
+            running[index] = start
+            thread.start()
+        wakeup.wait(0.2)
+        wakeup.clear()
+        now = time.time()
+        for index, start in list(running.items()):
+            if results[index] is None and now - start > timeout:
+                record(index, False, start, error=f"timeout after {timeout}s")
+            if results[index] is not None:
+                del running[index]
+                active[accounts[index].get("proxy", "")] -= 1
+    return results
+
+
+def result_columns(results: list) -> list:
+    columns = []
+    for item in results:
+        for column in item["result"]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def format_results(results: list, fmt: str = "table") -> str:
+    if fmt == "json":
+        return json.dumps(results, ensure_ascii=False, indent=2)
+    columns = ["index", "name", "key", "ok", "latency_ms"] + result_columns(results) + ["error"]
+    rows = []
+    for item in results:
+        row = dict(item["result"])
+        row.update({column: item[column] for column in ("index", "name", "key", "ok", "latency_ms", "error")})
+        rows.append([row.get(column, "") for column in columns])
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        return buffer.getvalue()
+    cells = [[str(value) for value in row] for row in [columns] + rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    lines = ["  ".join(value.ljust(widths[i]) for i, value in enumerate(row)).rstrip() for row in cells]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    failed = sum(1 for item in results if not item["ok"])
+    lines.append(f"\n{len(results)} accounts, {failed} failed")
+    return "\n".join(lines)
+
+
+def build_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--config", default=config_path)
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个代理同时处理的账户数")
+    parser.add_argument("--timeout", type=float, default=60, help="单个账户的超时时间（秒）")
+    parser.add_argument("--output", help="结果写入文件，默认输出到终端")
+    return parser
+
+
+def fanout_main(description: str, task, argv: list = None) -> int:
+    # task(account, timeout) -> dict；全部成功返回 0，否则返回 1
+    args = build_parser(description).parse_args(argv)
+    config = load_config(args.config)
+    configure_endpoints(config)
+    accounts = config["accounts"]
+    results = run_fanout(accounts, lambda account: task(account, args.timeout), args.concurrency, args.timeout)
+    text = format_results(results, args.format)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if all(item["ok"] for item in results) else 1
@@ -0,0 +1,199 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+
+from workers import Worker, restart_fields, stop_timeout
+
+logger = logging.getLogger("aster")
+
+# 没有可配对的账户（都在用、还没到 pacing 安排的时间、或都已达到当天预算）时，空闲的 slot 隔这么久再看一次
+idle_wait = 10
+# 一对账户下单后最多占用这么久等成交，之后释放回账户池；各账户下次什么时候再配对由 pacing 决定
+hold_time = 300
+
+
+def today() -> str:
+    # 与手续费账本的换日一致
+    return datetime.now().strftime("%Y%m%d")
+
+
+class Entry:
+    # 账户池里的一个账户。remaining 是当天还能花的手续费，没查过成本前按整份预算算，会被优先选中去查
+    def __init__(self, account: dict):
+        self.account = account
+        self.leg = None
+        self.remaining = account.get("cost_per_day", 0)
+        self.day = None
+        self.holder = None
+        self.retired = False
+        # pacing 安排的下一轮时间，之前不会被选中
+        self.due = 0
+
+    @property
+    def key(self) -> str:
+        return self.account["key"]
+
+    @property
+    def proxy(self) -> str:
+        return self.account.get("proxy", "")
+
+
+class HedgeScheduler:
+    # 对冲账户池：每一轮按剩余预算重新配对。预算用完的账户立即退出配对，不会被对手拖着继续超支；
+    # 对手和其它空出来的账户组成新的对，整个账户池尽量都在跑
+    def __init__(self, prepare):
+        # prepare(account) -> (client, state)，每个账户第一次被选中时建一次
+        self.prepare = prepare
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def retire(self, accounts: list) -> list:
+        # 配置重载第一步：删掉的账户、密钥或代理变了的账户标记退役，不再被选中。返回正在使用退役账户的 slot
+        wanted = {account["key"]: account for account in accounts}
+        holders = []
+        with self.lock:
+            for key, entry in self.entries.items():
+                account = wanted.get(key)
+                if account is None or any(entry.account.get(field) != account.get(field) for field in restart_fields):
+                    entry.retired = True
+                if entry.retired and entry.holder is not None and entry.holder not in holders:
+                    holders.append(entry.holder)
+        return holders
+
+    def drop_retired(self) -> list:
+        # 持有它们的 slot 已经收尾退出，空闲的退役账户移出账户池，交给调用方撤单平仓
+        with self.lock:
+            dropped = [entry for entry in self.entries.values() if entry.retired and entry.holder is None]
+            for entry in dropped:
+                del self.entries[entry.key]
+        return dropped
+
+    def add(self, accounts: list) -> list:
+        # 新账户加入；保留的账户就地更新配置（cost_per_day 等），下一次配对生效
+        added = []
+        with self.lock:
+            for account in accounts:
+                entry = self.entries.get(account["key"])
+                if entry is None:
+                    self.entries[account["key"]] = Entry(dict(account))
+                    added.append(account["key"])
+                elif not entry.retired and entry.account != account:
+                    entry.account.clear()
+                    entry.account.update(account)
+        return added
+
+    def lease(self, holder) -> list:
+        # 剩余预算最多的账户先出，对手选剩余预算最多且代理不同的：两条腿不从同一个出口下单，
+        # 请求权重也分摊到两个代理上。只剩同一代理的账户时才和同代理配对
+        day = today()
+        now = time.time()
+        with self.lock:
+            heap = []
+            for entry in self.entries.values():
+                if entry.holder is not None or entry.retired or entry.due > now:
+                    continue
+                if entry.day != day:
+                    # 跨天后手续费重新计，先按整份预算排队，查过成本再修正
+                    entry.remaining = entry.account.get("cost_per_day", 0)
+                    entry.day = day
+                if entry.remaining > 0:
+                    heap.append((-entry.remaining, entry.key, entry))
+            if len(heap) < 2:
+                return None
+            heapq.heapify(heap)
+            first = heapq.heappop(heap)[2]
+            partner = None
+            fallback = None
+            while heap:
+                entry = heapq.heappop(heap)[2]
+                if entry.proxy != first.proxy:
+                    partner = entry
+                    break
+                if fallback is None:
+                    fallback = entry
+            partner = partner or fallback
+            first.holder = holder
+            partner.holder = holder
+            return [first, partner]
+
+    def leg(self, entry: Entry) -> tuple:
+        # 只有持有该账户的 slot 会调用，不用加锁
+        if entry.leg is None:
+            entry.leg = self.prepare(entry.account)
+        return entry.leg
+
+    def record(self, entry: Entry, cost: float):
+        with self.lock:
+            entry.remaining = entry.account.get("cost_per_day", 0) - abs(cost)
+            entry.day = today()
+
+    def defer(self, entry: Entry, due: float):
+        with self.lock:
+            entry.due = due
+
+    def held(self, holder) -> list:
+        # 某个 slot 当前租着的账户，协程版停掉 slot 之前用来记下要收尾的账户
+        with self.lock:
+            return [entry for entry in self.entries.values() if entry.holder is holder]
+
+    def release(self, pair: list):
+        with self.lock:
+            for entry in pair:
+                entry.holder = None
+
+    def keys(self) -> set:
+        with self.lock:
+            return {key for key, entry in self.entries.items() if not entry.retired}
+
+
+class HedgePool:
+    # 对冲模式的 worker 管理：slot 线程数等于最多能同时成对的数量，每个 slot 每轮从调度器租一对账户
+    def __init__(self, scheduler: HedgeScheduler, start, wind_down):
+        # start(worker) 启动一个 slot 线程；wind_down(client, state) 给退役的空闲账户撤单平仓
+        self.scheduler = scheduler
+        self.start = start
+        self.wind_down = wind_down
+        self.slots = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def apply(self, accounts: list) -> dict:
+        with self.lock:
+            holders = self.scheduler.retire(accounts)
+            wanted = len(accounts) // 2
+            # 正在用退役账户的 slot 和多出来的 slot 停掉：当前这一轮撤单平仓、释放账户后退出
+            stopped = [slot for slot in self.slots if slot in holders]
+            surplus = len(self.slots) - len(stopped) - wanted
+            if surplus > 0:
+                stopped += [slot for slot in self.slots if slot not in stopped][-surplus:]
+            for slot in stopped:
+                logger.info(f"stopping hedge slot {slot.name}")
+                slot.request_stop()
+            for slot in stopped:
+                self.slots.remove(slot)
+                if slot.thread is not None:
+                    slot.thread.join(stop_timeout)
+                    if slot.thread.is_alive():
+                        logger.error(f"hedge slot {slot.name} did not stop within {stop_timeout}s")
+            # 先给退役账户收尾再加入新配置，同一个账户不会同时被新旧两份配置操作
+            removed = []
+            for entry in self.scheduler.drop_retired():
+                if entry.leg is not None:
+                    self.wind_down(*entry.leg)
+                removed.append(entry.key)
+            added = self.scheduler.add(accounts)
+            while len(self.slots) < wanted:
+                self.count += 1
+                slot = Worker([])
+                slot.name = f"hedge-{self.count}"
+                self.slots.append(slot)
+                self.start(slot)
+            return {"added": added, "removed": removed, "slots": len(self.slots), "accounts": len(self.scheduler.keys())}
+
+    def keys(self) -> set:
+        return self.scheduler.keys()
+
+    def stop_all(self):
+        self.apply([])
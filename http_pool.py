@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from aster.rest_api import Client
+import metrics
+import tracing
+from rate_limiter import endpoint_weight, is_priority, request_weight, scheduler
+
+logger = logging.getLogger("aster")
+
+base_url = "https://fapi.asterdex.com"
+
+# 每个代理一个连接池，同代理的账户共用已经建好的 TCP/TLS/CONNECT 连接
+pool_size = 10
+adapters = {}
+adapters_lock = threading.Lock()
+# 签名请求在签名前已经排过队，adapter 发送时不再重复扣权重
+prepaid = threading.local()
+
+
+def configure(size: int):
+    global pool_size
+    pool_size = size
+
+
+class ScheduledAdapter(HTTPAdapter):
+    # 发送前按权重向全局调度器排队，收到响应后用响应头校准已用权重
+    def __init__(self, proxy: str, **kwargs):
+        self.proxy = proxy
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        account = request.headers.get("X-MBX-APIKEY", "")
+        if getattr(prepaid, "active", False):
+            prepaid.active = False
+        else:
+            scheduler.acquire(self.proxy, account, endpoint_weight(request.method, request.url))
+        start = time.time()
+        try:
+            with tracing.span("http", method=request.method, path=request.path_url.split("?", 1)[0]):
+                response = super().send(request, **kwargs)
+        except Exception:
+            metrics.observe_request(request.method, request.url, self.proxy, 0, (time.time() - start) * 1000, error_code="network")
+            raise
+        scheduler.on_response(self.proxy, account, response.status_code, response.headers)
+        metrics.observe_request(request.method, request.url, self.proxy, response.status_code, (time.time() - start) * 1000,
+                                response.headers, metrics.error_code_of(response.status_code, response.json))
+        return response
+
+
+def get_adapter(proxy: str) -> HTTPAdapter:
+    with adapters_lock:
+        adapter = adapters.get(proxy)
+        if adapter is None:
+            adapter = ScheduledAdapter(proxy, pool_connections=4, pool_maxsize=pool_size)
+            adapters[proxy] = adapter
+        return adapter
+
+
+def create_pooled_client(key: str, secret: str, proxy: str, url: str = None, timeout: float = None) -> Client:
+    client = Client(key, secret, base_url=url or base_url, proxies={'https': proxy}, timeout=timeout)
+    # Session 里带着各自账户的 API key 头，只共享下面的 adapter（连接池），不共享 Session
+    adapter = get_adapter(proxy)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    for name in ("sign_request", "limited_encoded_sign_request"):
+        if hasattr(client, name):
+            setattr(client, name, scheduled(getattr(client, name), proxy, key))
+    return client
+
+
+def scheduled(sign_request, proxy: str, key: str):
+    # 先按权重排队再交给 Client 加 timestamp 签名：排队或 418/429 退避再久，发出去的请求也还在 recvWindow 内
+    def wrapper(http_method, url_path, payload=None, *args, **kwargs):
+        scheduler.acquire(proxy, key, request_weight(http_method, url_path, payload), is_priority(http_method, payload))
+        prepaid.active = True
+        try:
+            return sign_request(http_method, url_path, payload, *args, **kwargs)
+        finally:
+            prepaid.active = False
+    return wrapper
+
+
+def iter_pools(adapter: HTTPAdapter):
+    managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+    for manager in managers:
+        for pool_key in list(manager.pools.keys()):
+            pool = manager.pools.get(pool_key)
+            if pool is not None:
+                yield pool
+
+
+def pool_stats() -> dict:
+    # connections 为新建连接数（每次都要握手），requests - connections 即复用次数
+    stats = {}
+    with adapters_lock:
+        items = list(adapters.items())
+    for proxy, adapter in items:
+        connections = 0
+        requests = 0
+        for pool in iter_pools(adapter):
+            connections += pool.num_connections
+            requests += pool.num_requests
+        stats[proxy] = {
+            "connections": connections,
+            "requests": requests,
+            "reused": max(requests - connections, 0),
+        }
+    return stats
+
+
+def log_pool_stats_forever(interval: float = 600):
+    while True:
+        time.sleep(interval)
+        for proxy, stat in pool_stats().items():
+            logger.info(f"http pool {proxy}: handshakes: {stat['connections']} requests: {stat['requests']} reused: {stat['reused']}")
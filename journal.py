@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+# 定长二进制事件日志：每条 72 字节，按天一个文件，追加写入，读取时 mmap 后按步长扫描
+journal_dir = os.path.join("data", "journal")
+
+# event, side, code, latency_us, time_ms, order_id, account, symbol, price, qty, value
+record_struct = struct.Struct("<BBhIqq8s16sddd")
+record_size = record_struct.size
+# 超出字段范围的值截到边界，不让一个异常值把整条记录丢掉
+code_range = (-2 ** 15, 2 ** 15 - 1)
+latency_range = (0, 2 ** 32 - 1)
+
+QUOTE = 1
+ORDER_SENT = 2
+ORDER_ACK = 3
+CANCEL = 4
+FLATTEN = 5
+COST_CHECK = 6
+
+event_names = {
+    QUOTE: "quote",
+    ORDER_SENT: "order_sent",
+    ORDER_ACK: "order_ack",
+    CANCEL: "cancel",
+    FLATTEN: "flatten",
+    COST_CHECK: "cost_check",
+}
+event_codes = {name: code for code, name in event_names.items()}
+
+sides = {"": 0, "BUY": 1, "SELL": 2}
+side_names = {code: name for name, code in sides.items()}
+
+fields = ("event", "side", "code", "latency_us", "time_ms", "order_id", "account", "symbol", "price", "qty", "value")
+
+
+def account_id(api_key: str) -> bytes:
+    # 不落明文 key，和手续费账本一样取 sha1 前 8 字节
+    return hashlib.sha1(api_key.encode()).digest()[:8]
+
+
+def journal_path(now: float = None, directory: str = None) -> str:
+    day = datetime.fromtimestamp(now if now is not None else time.time()).strftime("%Y%m%d")
+    return os.path.join(directory or journal_dir, f"{day}.journal")
+
+
+class Journal:
+    # 多个线程、多个进程共用同一个按天的文件，O_APPEND 保证每条记录整条写入
+    def __init__(self, directory: str = journal_dir):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.path = None
+        self.fd = None
+        self.account_ids = {}
+        # 打包失败（字段类型不对等）丢弃的记录数
+        self.dropped = 0
+
+    def open(self, now: float):
+        path = journal_path(now, self.directory)
+        if path == self.path:
+            return
+        if self.fd is not None:
+            os.close(self.fd)
+        os.makedirs(self.directory, exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.path = path
+
+    def record(self, event: int, api_key: str, symbol: str = "", side: str = "", price: float = 0, qty: float = 0,
+               value: float = 0, order_id: int = 0, code: int = 0, latency_ms: float = 0):
+        now = time.time()
+        account = self.account_ids.get(api_key)
+        if account is None:
+            account = account_id(api_key)
+            self.account_ids[api_key] = account
+        try:
+            data = record_struct.pack(event, sides.get(side, 0), clamp(int(code), code_range), clamp(int(latency_ms * 1000), latency_range),
+                                      int(now * 1000), order_id, account, symbol.encode(), float(price), float(qty), float(value))
+        except (struct.error, TypeError, ValueError) as e:
+            # 和写失败一样，记录不了就算了，不能把异常抛进交易循环
+            self.dropped += 1
+            sys.stderr.write(f"pack journal record failed:{e}\n")
+            return
+        try:
+            with self.lock:
+                self.open(now)
+                os.write(self.fd, data)
+        except OSError as e:
+            # 事件日志只是旁路记录，写失败不能影响下单
+            sys.stderr.write(f"write journal failed:{e}\n")
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+            self.fd = None
+            self.path = None
+
+
+def clamp(value: int, bounds: tuple) -> int:
+    return min(max(value, bounds[0]), bounds[1])
+
+
+journal = Journal()
+
+
+def record(event: int, api_key: str, **kwargs):
+    journal.record(event, api_key, **kwargs)
+
+
+def decode(values: tuple) -> dict:
+    item = dict(zip(fields, values))
+    item["event"] = event_names.get(item["event"], str(item["event"]))
+    item["side"] = side_names.get(item["side"], "")
+    item["account"] = item["account"].hex()
+    item["symbol"] = item["symbol"].rstrip(b"\0").decode()
+    item["latency_ms"] = item.pop("latency_us") / 1000
+    return item
+
+
+def read_journal(path: str, event: str = None, api_key: str = None, symbol: str = None,
+                 since_ms: int = None, until_ms: int = None):
+    # 先在原始元组上过滤，命中的记录才解码成 dict
+    event_code = event_codes[event] if event else None
+    account = account_id(api_key) if api_key else None
+    symbol_bytes = symbol.encode().ljust(16, b"\0") if symbol else None
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        # 别的进程可能正在追加，只读完整的记录
+        size -= size % record_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            for values in record_struct.iter_unpack(mm):
+                if event_code is not None and values[0] != event_code:
+                    continue
+                if since_ms is not None and values[4] < since_ms:
+                    continue
+                if until_ms is not None and values[4] > until_ms:
+                    continue
+                if account is not None and values[6] != account:
+                    continue
+                if symbol_bytes is not None and values[7] != symbol_bytes:
+                    continue
+                yield decode(values)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="读取事件日志")
+    parser.add_argument("paths", nargs="*", help="默认读取当天的日志")
+    parser.add_argument("--event", choices=sorted(event_codes))
+    parser.add_argument("--key", help="只看这个 API key 的事件")
+    parser.add_argument("--symbol")
+    parser.add_argument("--since", type=int, help="起始时间戳（毫秒）")
+    parser.add_argument("--until", type=int, help="结束时间戳（毫秒）")
+    parser.add_argument("--count", action="store_true", help="只输出各类事件的条数")
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    paths = args.paths or [journal_path()]
+    counts = {}
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"{path} not found", file=sys.stderr)
+            continue
+        for item in read_journal(path, args.event, args.key, args.symbol, args.since, args.until):
+            if args.count:
+                counts[item["event"]] = counts.get(item["event"], 0) + 1
+                continue
+            print(" ".join(f"{name}={item[name]}" for name in item))
+    for name, count in sorted(counts.items()):
+        print(f"{name}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
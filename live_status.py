@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import account_label
+
+logger = logging.getLogger("aster")
+
+# 每个交易进程把各账户的运行状态写成一个小 JSON 文件（分片模式一个分片一个文件），
+# app.py 只用一个线程读这个目录，再通过 SSE 推给所有打开的页面
+status_dir = os.path.join("data", "live")
+status_file = os.path.join(status_dir, "status.json")
+publish_interval = 1
+# 没有变化时也定期重写一次，app.py 据此判断进程是否还活着
+heartbeat_interval = 10
+# 页面只展示最近的几笔挂单
+max_orders = 10
+
+# 循环阶段：cost_check 查手续费、cancel 撤超时挂单、quote 取盘口、order 下单、wait 等成交、
+# idle 今日预算已用完、pooled 对冲模式下在账户池里等待配对、stopping 撤单平仓退出中
+phases = ("starting", "cost_check", "cancel", "quote", "order", "wait", "idle", "pooled", "stopping")
+
+
+class LiveStatus:
+    # 按账户保存最新状态，交易线程每个阶段更新一次；version 变了发布线程才重写文件
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.accounts = {}
+        self.version = 0
+
+    def update(self, api_key: str, **fields):
+        # 按完整 key 区分账户，文件里只写前 8 位
+        with self.lock:
+            entry = self.accounts.get(api_key)
+            if entry is None:
+                entry = {"account": account_label(api_key), "name": "", "phase": "starting", "loop": 0, "open_orders": 0, "orders": [],
+                         "positions": [], "cost": 0, "cost_per_day": 0, "last_error": None, "updated_at": 0}
+                self.accounts[api_key] = entry
+            entry.update(fields)
+            entry["updated_at"] = time.time()
+            self.version += 1
+
+    def remove(self, api_key: str):
+        with self.lock:
+            if self.accounts.pop(api_key, None) is not None:
+                self.version += 1
+
+    def snapshot(self) -> tuple:
+        with self.lock:
+            return self.version, [dict(entry) for entry in self.accounts.values()]
+
+
+current = LiveStatus()
+
+
+def register(api_key: str, name: str = "", cost_per_day: float = 0):
+    current.update(api_key, name=name, cost_per_day=cost_per_day, phase="starting")
+
+
+def remove(api_key: str):
+    current.remove(api_key)
+
+
+def set_phase(api_key: str, phase: str):
+    current.update(api_key, phase=phase)
+
+
+def begin_loop(api_key: str):
+    current.update(api_key, phase="cost_check", loop=current.accounts.get(api_key, {}).get("loop", 0) + 1)
+
+
+def set_cost(api_key: str, cost: float, cost_per_day: float):
+    current.update(api_key, cost=round(abs(cost), 4), cost_per_day=cost_per_day)
+
+
+def set_orders(api_key: str, orders: list):
+    # REST 和推送维护的挂单格式一致，只留页面要看的字段
+    compact = [{"symbol": order["symbol"], "side": order["side"], "price": order.get("price"), "qty": order.get("origQty"),
+                "time": order.get("updateTime")} for order in orders[:max_orders]]
+    current.update(api_key, open_orders=len(orders), orders=compact)
+
+
+def set_positions(api_key: str, positions: list):
+    compact = [{"symbol": position["symbol"], "amount": position["positionAmt"], "entry": position["entryPrice"],
+                "notional": position.get("notional")}
+               for position in positions if float(position["positionAmt"]) != 0]
+    current.update(api_key, positions=compact)
+
+
+def set_plan(api_key: str, next_at: float, order_value: float):
+    current.update(api_key, next_at=next_at, order_value=round(order_value, 2))
+
+
+def set_error(api_key: str, message):
+    # 阶段照常往下走，最近一次错误一直保留到下一次出错
+    current.update(api_key, last_error={"time": time.time(), "message": str(message)[:300]})
+
+
+def write(path: str = status_file, shard=None):
+    version, accounts = current.snapshot()
+    status = {"pid": os.getpid(), "shard": shard, "time": time.time(), "accounts": accounts}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    # 原子替换，app.py 不会读到写了一半的文件
+    os.replace(tmp_path, path)
+    return version
+
+
+def publish_forever(path: str = status_file, shard=None):
+    published = None
+    last_write = 0
+    while True:
+        now = time.time()
+        if current.version != published or now - last_write >= heartbeat_interval:
+            try:
+                published = write(path, shard)
+                last_write = now
+            except OSError as e:
+                logger.error(f"write live status failed:{e}")
+        time.sleep(publish_interval)
+
+
+def start_publisher(path: str = status_file, shard=None):
+    threading.Thread(target=publish_forever, args=(path, shard), daemon=True, name="live-status").start()
+    logger.info(f"live status published to {path}")
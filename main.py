@@ -1,74 +1,136 @@
-import logging
-import logging.handlers
 from aster.rest_api import Client
-from aster.lib.utils import config_logging
 from aster.error import ClientError
-from aster.websocket.client.stream import WebsocketClient
+from bootstrap import config_path, configure_endpoints, get_logger, load_config, use_disk_market_cache
+import http_pool
+import rate_limiter
+from http_pool import create_pooled_client
+from market_data import get_book_ticker, get_mark_price_dict, start_market_streams
+from user_stream import close_user_stream, get_user_stream
+from symbol_limits import get_symbol_limits
+from batch_orders import format_batch_orders, leg_gap_ms, split_batch_results
+from pricing import calc_net_balance, size_orders
 import time
 import random
-import yaml
-import threading
-from datetime import datetime
+import argparse
 import os
-import gzip
+import signal
+import sys
+import threading
+import commission_ledger
+from commission_ledger import get_ledger
+from workers import ConfigWatcher, WorkerRegistry
+from hedge_scheduler import HedgePool, HedgeScheduler, hold_time as hedge_hold_time, idle_wait as hedge_idle_wait
+from supervisor import parse_shard, run_supervisor, shard_accounts, shard_path
+import journal
+import live_status
+import metrics
+import pacing
+import tracing
 
 symbols = ["ASTERUSDT", "ASTERUSDT", "ASTERUSDT"]
 random.seed(time.time())
 
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
-    def doRollover(self):
-        # 调用父类的doRollover方法，进行日志文件滚动
-        super().doRollover()
-        
-        # # 获取滚动后的文件名
-        rotated_filename = self.baseFilename + ".1"
-        target_filename = self.baseFilename + "." + datetime.now().strftime("%Y%m%d-%H%M%S") + ".gz"
-        
-        # 压缩滚动后的日志文件
-        if os.path.exists(rotated_filename):
-            with open(rotated_filename, 'rb') as f_in:
-                with gzip.open(target_filename, 'wb') as f_out:
-                    f_out.writelines(f_in)
-            
-            # 删除未压缩的滚动文件
-            os.remove(rotated_filename)
-
-def get_logger(name) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.propagate = False  # 禁止传播到根日志记录器
-    
-    # 如果已有处理器则先清除（避免重复添加）
-    if logger.handlers:
-        for handler in logger.handlers:
-            logger.removeHandler(handler)
-    
-    # 文件处理器配置保持不变
-    single_file_size = 1 * 1024 * 1024 * 1024 # 1GB
-    monitorHandler = CompressedRotatingFileHandler(filename=os.path.join(log_dir, f"{name}.log"), maxBytes=single_file_size, backupCount=5)
-
-    monitorHandler.setLevel(logging.INFO)
-    monitorFormatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    monitorHandler.setFormatter(monitorFormatter)
-    
-    # 移除所有控制台处理器（如果有）
-    root_logger = logging.getLogger()
-    for handler in root_logger.handlers[:]:
-        if isinstance(handler, logging.StreamHandler):
-            root_logger.removeHandler(handler)
-            
-    logger.addHandler(monitorHandler)
-    return logger
-
 logger = get_logger("aster")
 
-def close_position(client: Client, force: bool = False):
+def api_key_of(client: Client) -> str:
+    return client.session.headers.get("X-MBX-APIKEY", "")
+
+def open_account_state(client: Client, key: str, proxy: str = None):
+    # 推送连不上时返回 None，调用方退回 REST 轮询
+    try:
+        return get_user_stream(client, key, proxy).state
+    except Exception as e:
+        logger.exception(f"{key} start user data stream failed, fall back to REST:{e}")
+        return None
+
+def pause(worker, seconds: float) -> bool:
+    # 没有 worker（单独调用、基准测试）时就是普通 sleep；返回 True 表示 worker 被要求停止
+    if worker is None:
+        time.sleep(seconds)
+        return False
+    return worker.pause(seconds)
+
+def stopping(worker) -> bool:
+    return worker is not None and worker.stopping()
+
+@tracing.traced("get_orders")
+def get_open_orders(client: Client, state=None):
+    orders = state.open_orders() if state is not None else client.get_orders()
+    live_status.set_orders(api_key_of(client), orders)
+    return orders
+
+def get_balances(client: Client, state=None):
+    # 推送维护的可用余额只在没有新成交时可信，成交后走一次 REST 刷新
+    if state is None:
+        return client.balance()
+    balances, version = state.fresh_balances()
+    if balances is None:
+        balances = client.balance()
+        state.set_balances(balances, version)
+    return balances
+
+@tracing.traced("sleep")
+def wait_for_fills(sleep_time: float, fill_event, legs: list, worker=None):
+    # 每个账户线程仍然阻塞在这里等下一轮（REST 调用是同步的），但不再自己定时轮询：只在三种情况下醒来——
+    # pacing 的定时堆到点、成交后的仓位推送、配置重载停掉 worker。等待期间一旦所有挂单都已成交，立即平掉残留仓位
+    wake = fill_event if fill_event is not None else threading.Event()
+    timer = pacing.clock.schedule(sleep_time, wake)
+    if worker is not None:
+        worker.waiting = wake
+    flattened = False
     try:
-        positions = client.get_position_risk()
+        while not stopping(worker):
+            wake.wait()
+            wake.clear()
+            if timer.fired:
+                return
+            # 只平一次：平仓单自己的成交也会推仓位变化，那时另一条腿的持仓可能还没更新，再平就会多下一笔只减仓单；
+            # 剩下的交给下一轮开头的 close_position
+            if not flattened and all(len(state.open_orders()) == 0 for _, state in legs):
+                for client, state in legs:
+                    close_position(client, force=True, state=state)
+                flattened = True
+    finally:
+        if worker is not None:
+            worker.waiting = None
+        pacing.clock.cancel(timer)
+
+@tracing.traced()
+def place_batch_orders(client: Client, batch_orders: list, symbol_limit: dict):
+    # 两条腿一次请求提交，任一条失败就撤掉另一条，避免单边挂单
+    key = api_key_of(client)
+    for order in batch_orders:
+        journal.record(journal.ORDER_SENT, key, symbol=order["symbol"], side=order["side"], price=order["price"], qty=order["quantity"])
+    start = time.time()
+    responses = client.sign_request("POST", "/fapi/v1/batchOrders", {"batchOrders": format_batch_orders(batch_orders, symbol_limit)})
+    round_trip = (time.time() - start) * 1000
+    placed, failed = split_batch_results(batch_orders, responses)
+    metrics.inc_orders_placed(key, len(placed))
+    for response in placed:
+        journal.record(journal.ORDER_ACK, key, symbol=response["symbol"], side=response["side"], order_id=response["orderId"], latency_ms=round_trip)
+    for order, response in failed:
+        journal.record(journal.ORDER_ACK, key, symbol=order["symbol"], side=order["side"], code=response.get("code", 0), latency_ms=round_trip)
+        logger.error("batch order failed: %s %s code: %s msg: %s", order['side'], order['symbol'], response.get('code'), response.get('msg'))
+        live_status.set_error(key, f"batch order failed: {order['side']} {order['symbol']} code: {response.get('code')} msg: {response.get('msg')}")
+    if failed:
+        for response in placed:
+            try:
+                cancel = client.cancel_order(symbol=response["symbol"], orderId=response["orderId"])
+                journal.record(journal.CANCEL, key, symbol=response["symbol"], side=response["side"], order_id=response["orderId"])
+                logger.info("cancel surviving leg response: %s", cancel)
+            except ClientError as error:
+                # 可能已经成交，残留仓位交给 close_position 处理
+                logger.error(f"cancel surviving leg {response['orderId']} failed: {error.error_message}")
+    logger.info("batch order placed: %d failed: %d round_trip: %.1fms leg_gap: %sms", len(placed), len(failed), round_trip, leg_gap_ms(placed))
+    for response in placed:
+        logger.info("new order response: %s", response)
+    return placed, failed
+
+@tracing.traced()
+def close_position(client: Client, force: bool = False, state=None):
+    try:
+        positions = state.get_positions() if state is not None else client.get_position_risk()
+        live_status.set_positions(api_key_of(client), positions)
         for position in positions:
             if time.time() * 1000 - position["updateTime"] <= 100 and not force:
                 continue
@@ -76,157 +138,128 @@ def close_position(client: Client, force: bool = False):
                 side = "SELL" if float(position["positionAmt"]) > 0 else "BUY"
                 amount = abs(float(position["positionAmt"]))
                 logger.info(f"symbol: {position['symbol']} quantity: {amount} price: {position['entryPrice']}")
+                start = time.time()
                 response = client.new_order(symbol=position["symbol"], side=side, type="MARKET", quantity=amount, reduceOnly=True)
+                journal.record(journal.FLATTEN, api_key_of(client), symbol=position["symbol"], side=side, price=position["entryPrice"],
+                               qty=amount, order_id=response.get("orderId", 0), latency_ms=(time.time() - start) * 1000)
             elif abs(float(position["notional"])) > 0:
                 logger.info(f"position {position['symbol']} notional: {position['notional']} updateTime: {position['updateTime']}")
     except Exception as e:
         logger.exception(e)
 
-def get_income_history(client: Client, start_time: int, end_time: int):
-    income_history = []
-    while True:
-        try:
-            items = client.get_income_history(startTime=start_time, endTime=end_time, incomeType="COMMISSION")
-            if len(items) == 0:
-                break
-            income_history.extend(items)
-            start_time = int(items[-1]["time"]) + 1
-            time.sleep(0.1)
-        except Exception as e:
-            logger.exception(f"get income history error:{e}")
-    return income_history
-
-def get_mark_price(mark_price_dict: dict, symbol: str):
-    if symbol in mark_price_dict:
-        return mark_price_dict[symbol]['markPrice']
-    if symbol == "USDTUSDT":
-        return 1
-    logger.error(f"symbol {symbol} not found in mark_price_dict")
-    return 0
-    
-
-def calc_cost(client: Client, api_key: str, cost_per_day: float):
-    # 计算当天整点的时间戳
-    start_time = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
-    end_time = int(datetime.now().replace(hour=23, minute=59, second=59, microsecond=999999).timestamp() * 1000)
-    income_history = get_income_history(client, start_time, end_time)
-    # logger.info(f"income_history: {income_history}")
-    cost = 0
-    mark_price_dict = {}
+def wind_down(client: Client, state=None):
+    # worker 被停掉时先撤掉所有挂单再平仓，不留单边敞口
     try:
-        mark_price_info = client.mark_price()
+        for symbol in {order["symbol"] for order in get_open_orders(client, state)}:
+            response = client.cancel_open_orders(symbol=symbol)
+            journal.record(journal.CANCEL, api_key_of(client), symbol=symbol)
+            logger.info("cancel order response: %s", response)
     except Exception as e:
-        logger.error(f"get mark price failed:{e}")
-    for mark_price_info in mark_price_info:
-        mark_price_dict[mark_price_info['symbol']] = mark_price_info
-    for income in income_history:
-        if income["incomeType"] != "COMMISSION":
-            continue
-        symbol = income["asset"]+"USDT"
-        mark_price = get_mark_price(mark_price_dict, symbol)
-        cost += float(income.get("income", 0)) * float(mark_price)
-    # logger.info(f"{api_key} cost: {cost}")
-    return cost 
+        logger.exception(e)
+    close_position(client, force=True, state=state)
 
-def is_cost_enough(client: Client, api_key: str, cost_per_day: float):
+def calc_cost(client: Client, api_key: str, cost_per_day: float):
+    # 推送连着时成交已经实时计入账本，直接读内存里的当天成本，不走网络；
+    # 推送断开或今天还没对过账时才当场增量拉取流水
+    ledger = get_ledger(client, api_key)
+    if ledger.needs_reconcile():
+        return ledger.reconcile(get_mark_price_dict(client))
+    return ledger.cost()
+
+@tracing.traced("is_cost_enough")
+def check_cost(client: Client, api_key: str, cost_per_day: float):
    cost = calc_cost(client, api_key, cost_per_day)
-   return abs(cost) >= cost_per_day
+   enough = abs(cost) >= cost_per_day
+   metrics.set_cost(api_key, cost, cost_per_day)
+   live_status.set_cost(api_key, cost, cost_per_day)
+   journal.record(journal.COST_CHECK, api_key, price=cost_per_day, value=cost, code=int(enough))
+   return cost, enough
 
-def run(key, secret, proxy, cost_per_day):
-    proxies = { 'https': proxy }
-    client = Client(key, secret,base_url="https://fapi.asterdex.com", proxies=proxies)
+def is_cost_enough(client: Client, api_key: str, cost_per_day: float):
+   return check_cost(client, api_key, cost_per_day)[1]
+
+def run(key, secret, proxy, cost_per_day, worker=None):
+    client = create_client(key, secret, proxy)
     
-    market_info = client.exchange_info()
-    # logger.info(f"market_info: {market_info}")
-    symbol_limits = {}
-    for symbol in symbols:
-        for symbol_info in market_info["symbols"]:
-            if symbol_info["symbol"] == symbol:
-                qty_precision = symbol_info["quantityPrecision"]
-                price_precision = symbol_info["pricePrecision"]
-                tick_size = 0
-                min_qty = 0
-                max_qty = 0
-                step_size = 0
-                for filter in symbol_info["filters"]:
-                    if filter["filterType"] == "LOT_SIZE":
-                        min_qty = filter["minQty"]
-                        max_qty = filter["maxQty"]
-                        step_size = filter["stepSize"]
-                    elif filter["filterType"] == "PRICE_FILTER":
-                        tick_size = filter["tickSize"]
-                symbol_limits[symbol] = {
-                    "qty_precision": int(qty_precision),
-                    "price_precision": int(price_precision),
-                    "min_qty": float(min_qty),
-                    "max_qty": float(max_qty),
-                    "tick_size": float(tick_size),
-                    "step_size": float(step_size),
-                }
+    symbol_limits = build_symbol_limits(client)
 
-    while True:
+    state = open_account_state(client, key, proxy)
+    fill_event = None
+    if state is not None:
+        fill_event = threading.Event()
+        state.add_fill_listener(fill_event)
+    # 买卖两单都在这个账户上
+    pacer = pacing.pacer_of(key, 2)
+
+    while not stopping(worker):
         try:
-            sleep_time = random.randint(600, 1200)
-            logger.info(f"sleep_time: {sleep_time}")
-            if is_cost_enough(client, key, cost_per_day):
+            sleep_time = pacing.min_delay
+            if worker is not None:
+                # cost_per_day 随配置重载更新
+                cost_per_day = worker.accounts[0].get("cost_per_day", cost_per_day)
+            metrics.inc_loop(key)
+            tracing.begin_loop(key)
+            live_status.begin_loop(key)
+            cost, enough = check_cost(client, key, cost_per_day)
+            # 按剩余预算、离换日的时间和实际成交率决定下一轮的间隔和单量
+            pacer.observe(cost)
+            sleep_time, value = pacer.plan(cost, cost_per_day)
+            live_status.set_plan(key, time.time() + sleep_time, value)
+            logger.info("sleep_time: %.0f value: %.1f", sleep_time, value)
+            if enough:
                 logger.info("cost is enough, not trading")
-                close_position(client, force=True)
-                time.sleep(sleep_time)
+                live_status.set_phase(key, "idle")
+                close_position(client, force=True, state=state)
+                pause(worker, sleep_time)
                 continue
             order_timeout = 1000
-            orders = client.get_orders()
+            orders = get_open_orders(client, state)
             # logger.info(orders)
             if len(orders) > 0:
-                for order in orders:
-                    # 30s还没有成交修改价格，里面成交
-                    logger.info(f"order symbol {order['symbol']} updateTime: {order['updateTime']} time: {time.time()} diff: {time.time() * 1000 - order['updateTime']}")
-                    if time.time() * 1000 - order['updateTime'] > order_timeout:
-                        response = client.cancel_open_orders(symbol=order['symbol'])
-                        logger.info(f"cancel order response: {response}")
-                        close_position(client, force=True)
-                time.sleep(10)
+                live_status.set_phase(key, "cancel")
+                with tracing.span("cancel_loop"):
+                    for order in orders:
+                        # 30s还没有成交修改价格，里面成交
+                        logger.info("order symbol %s updateTime: %s diff: %.0f", order['symbol'], order['updateTime'], time.time() * 1000 - order['updateTime'])
+                        if time.time() * 1000 - order['updateTime'] > order_timeout:
+                            response = client.cancel_open_orders(symbol=order['symbol'])
+                            journal.record(journal.CANCEL, key, symbol=order['symbol'], side=order['side'], order_id=order['orderId'])
+                            logger.info("cancel order response: %s", response)
+                            close_position(client, force=True, state=state)
+                pause(worker, 10)
                 continue
-            close_position(client)
-            response = client.balance(recvWindow=6000)
-            # logger.info(response)
+            close_position(client, state=state)
             symbol = random.choice(symbols)
-            book_ticker = client.book_ticker(symbol)
-            logger.info(f"book_ticker: {book_ticker}")
-            balances = client.balance()
+            live_status.set_phase(key, "quote")
+            with tracing.span("get_book_ticker", symbol=symbol):
+                book_ticker = get_book_ticker(client, symbol)
+            journal.record(journal.QUOTE, key, symbol=symbol, price=book_ticker["bidPrice"], value=book_ticker["askPrice"],
+                           latency_ms=(time.time() - book_ticker["received"]) * 1000)
+            logger.info("book_ticker: %s", book_ticker)
+            balances = get_balances(client, state)
             net_balance = 0
             for balance in balances:
                 if balance["asset"] == "USDT":
                     net_balance = balance["availableBalance"]
             if float(net_balance) < 0.001:
                 logger.info("net_balance is less than 0.001, not trading")
+                live_status.set_phase(key, "idle")
+                pause(worker, sleep_time)
                 continue
             symbol_limit = symbol_limits[symbol]
-            bid_price = book_ticker["bidPrice"]
-            ask_price = book_ticker["askPrice"]
-            mid_price = (float(bid_price) + float(ask_price)) / 2
-            mid_price = int(mid_price / float(symbol_limit["tick_size"])) * float(symbol_limit["tick_size"])
-            mid_price = round(mid_price, symbol_limit["price_precision"])
-            if abs(mid_price - float(bid_price)) <= 0.0000000000001 or abs(float(ask_price) - mid_price) <= 0.0000000000001:
-                # 价格波动太小，不交易
-                time.sleep(10)
-                continue
-            value = 250
             if float(net_balance) < value:
                 value = 20 * float(net_balance) / 2
-            # 一笔价值50usdt
-            times = random.randint(1, 5)
-            min_qty = symbol_limit["min_qty"]
-            max_qty = symbol_limit["max_qty"]
-            quantity = value/mid_price
-            quantity = quantity + times * min_qty
-            quantity = int(quantity / float(symbol_limit["step_size"])) * float(symbol_limit["step_size"])
-            quantity = round(quantity, int(symbol_limit["qty_precision"]))
-            if quantity > float(max_qty):
-                quantity = float(max_qty)
-            if quantity * mid_price < 5:
-                logger.info(f"quantity * mid_price < 5, not trading")
+            mid_price, (quantity,) = size_orders(book_ticker, symbol_limit, [value])
+            if mid_price is None:
+                # 价格波动太小，不交易
+                pause(worker, 10)
+                continue
+            if quantity is None:
+                logger.info("quantity * mid_price < 5, not trading")
+                live_status.set_phase(key, "idle")
+                pause(worker, sleep_time)
                 continue
-            logger.info(f"symbol: {symbol} quantity: {quantity} price: {mid_price}")
+            logger.info("symbol: %s quantity: %s price: %s", symbol, quantity, mid_price)
             batch_orders = []
             batch_orders.append({
                 "symbol":symbol,
@@ -244,17 +277,25 @@ def run(key, secret, proxy, cost_per_day):
                 "timeInForce":"GTC",
                 "type":"LIMIT"
             })
-            for order in batch_orders:
-                response = client.new_order(symbol=order["symbol"], side=order["side"], type=order["type"], quantity=order["quantity"], price=order["price"], timeInForce=order["timeInForce"])
-                logger.info(f"new order response: {response}")
+            live_status.set_phase(key, "order")
+            place_batch_orders(client, batch_orders, symbol_limit)
+            pacer.traded(value)
         except ClientError as error:
             logger.exception(
                 "Found error. status: {}, error code: {}, error message: {}".format(
                     error.status_code, error.error_code, error.error_message
             )
         )
-        close_position(client)
-        time.sleep(sleep_time)
+            live_status.set_error(key, f"error code: {error.error_code}, error message: {error.error_message}")
+        close_position(client, state=state)
+        live_status.set_phase(key, "wait")
+        wait_for_fills(sleep_time, fill_event, [(client, state)], worker)
+
+    logger.info(f"{key} worker stopping, cancel orders and flatten")
+    live_status.set_phase(key, "stopping")
+    if state is not None:
+        state.remove_fill_listener(fill_event)
+    wind_down(client, state)
 
 
 
@@ -263,224 +304,330 @@ def run(key, secret, proxy, cost_per_day):
     # logger.info("closing ws connection")
     # ws_client.stop()
 
-def thread_function(key, secret, proxy, cost_per_day):
-    while True:  # 循环确保线程持续运行
+def thread_function(key, secret, proxy, cost_per_day, worker=None):
+    while not stopping(worker):  # 循环确保线程持续运行，直到配置重载停掉这个账户
         try:
             logger.info(f"start run {key} {proxy} {cost_per_day}")    
-            run(key, secret, proxy, cost_per_day)
+            run(key, secret, proxy, cost_per_day, worker)
         except Exception as e:
             print(f"Caught exception: {e}")
+            live_status.set_error(key, e)
             # 此处可添加错误恢复逻辑（如重试、清理资源等）
         # 异常处理后，循环继续，线程不会终止
-        time.sleep(1)  # 模拟后续操作
+        pause(worker, 1)
 
 def init_config():
-    with open("config.yaml", "r") as f:
-        config = yaml.safe_load(f)
-    # 兼容旧配置
-    if "hedge_mode" not in config:
-        config["hedge_mode"] = False
-    if "dry_run" not in config:
-        config["dry_run"] = False
-    return config
+    return load_config()
 
 def create_client(key: str, secret: str, proxy: str) -> Client:
-    proxies = { 'https': proxy }
-    return Client(key, secret, base_url="https://fapi.asterdex.com", proxies=proxies)
+    return create_pooled_client(key, secret, proxy)
 
 def build_symbol_limits(client: Client):
-    market_info = client.exchange_info()
-    symbol_limits = {}
-    for symbol in symbols:
-        for symbol_info in market_info["symbols"]:
-            if symbol_info["symbol"] == symbol:
-                qty_precision = symbol_info["quantityPrecision"]
-                price_precision = symbol_info["pricePrecision"]
-                tick_size = 0
-                min_qty = 0
-                max_qty = 0
-                step_size = 0
-                for filter in symbol_info["filters"]:
-                    if filter["filterType"] == "LOT_SIZE":
-                        min_qty = filter["minQty"]
-                        max_qty = filter["maxQty"]
-                        step_size = filter["stepSize"]
-                    elif filter["filterType"] == "PRICE_FILTER":
-                        tick_size = filter["tickSize"]
-                symbol_limits[symbol] = {
-                    "qty_precision": int(qty_precision),
-                    "price_precision": int(price_precision),
-                    "min_qty": float(min_qty),
-                    "max_qty": float(max_qty),
-                    "tick_size": float(tick_size),
-                    "step_size": float(step_size),
-                }
-    return symbol_limits
+    # 全进程共用一份已解析的交易规则，run() 重启也不会重新下载
+    return get_symbol_limits(client)
 
 def get_net_balance(client: Client, account: dict):
-    mark_price_dict = {}
-    mark_price_info = client.mark_price()
-    net_balance = 0
-    for mark_price_info in mark_price_info:
-        mark_price_dict[mark_price_info['symbol']] = mark_price_info
-    #logger.info(f"mark_price: {mark_price_dict}")
-    for asset in account['assets']:
-        if abs(float(asset['marginBalance'])) <= 1e-10:
-            continue
-        symbol = asset['asset'] + "USDT"
-        mark_price = 0
-        if symbol in mark_price_dict:
-            mark_price_info = mark_price_dict[symbol]
-            mark_price = mark_price_info['markPrice']
-        # logger.info(f"{key}: asset: {asset['asset']} walletBalance: {asset['walletBalance']} marginBalance: {asset['marginBalance']} crossWalletBalance: {asset['crossWalletBalance']} markPrice: {mark_price} asset:{asset}")
-        value = float(asset['marginBalance']) * float(mark_price)
-        if asset['asset'] == "USDT" or asset['asset'] == "BUSD" or asset['asset'] == "USDC" or asset['asset'] == "USDF":
-            value =  float(asset['marginBalance'])
-        net_balance += value
-    for position in account['positions']:
-        if position['notional'] == "0":
-            continue
-        #logger.info(f"{key}: position: {position['symbol']} positionAmt: {position['positionAmt']} entryPrice: {position['entryPrice']} leverage: {position['leverage']} isolated: {position['isolated']} positionSide: {position['positionSide']} notional: {position['notional']}")
-        # net_balance += float(position['notional'])/float(position['leverage'])
-    # logger.info(f"{key}: totalWalletBalance: {account['totalWalletBalance']} totalMarginBalance: {account['totalMarginBalance']} totalCrossWalletBalance: {account['totalCrossWalletBalance']} account:{account}")
-    return net_balance
+    return calc_net_balance(account, get_mark_price_dict(client))
 
-def compute_symbol_and_qty(client: Client, symbol_limits: dict):
+@tracing.traced()
+def compute_symbol_and_qty(client: Client, symbol_limits: dict, value: float = 250):
     symbol = random.choice(symbols)
-    book_ticker = client.book_ticker(symbol)
-    logger.info(f"book_ticker: {book_ticker}")
+    book_ticker = get_book_ticker(client, symbol)
+    journal.record(journal.QUOTE, api_key_of(client), symbol=symbol, price=book_ticker["bidPrice"], value=book_ticker["askPrice"],
+                   latency_ms=(time.time() - book_ticker["received"]) * 1000)
+    logger.info("book_ticker: %s", book_ticker)
     account = client.account()
     net_balance = get_net_balance(client, account)
     if float(net_balance) < 0.001:
         return None, None, None
-    symbol_limit = symbol_limits[symbol]
-    bid_price = book_ticker["bidPrice"]
-    ask_price = book_ticker["askPrice"]
-    mid_price = (float(bid_price) + float(ask_price)) / 2
-    mid_price = int(mid_price / float(symbol_limit["tick_size"])) * float(symbol_limit["tick_size"])
-    mid_price = round(mid_price, symbol_limit["price_precision"])
-    if abs(mid_price - float(bid_price)) <= 0.0000000000001 or abs(float(ask_price) - mid_price) <= 0.0000000000001:
-        return None, None, None
-    value = 250
-    times = random.randint(1, 5)
-    min_qty = symbol_limit["min_qty"]
-    max_qty = symbol_limit["max_qty"]
-    quantity = value / mid_price
-    quantity = quantity + times * min_qty
-    quantity = int(quantity / float(symbol_limit["step_size"])) * float(symbol_limit["step_size"])
-    quantity = round(quantity, int(symbol_limit["qty_precision"]))
-    if quantity > float(max_qty):
-        quantity = float(max_qty)
-    if quantity * mid_price < 5:
+    # 两条腿同一个盘口快照、同一个数量
+    mid_price, (quantity,) = size_orders(book_ticker, symbol_limits[symbol], [value])
+    if mid_price is None or quantity is None:
         return None, None, None
     return symbol, quantity, mid_price
 
-def hedge_run(account_a: dict, account_b: dict, dry_run: bool):
-    client_a = create_client(account_a["key"], account_a["secret"], account_a["proxy"])
-    client_b = create_client(account_b["key"], account_b["secret"], account_b["proxy"])
-
+def hedge_round(legs: list, symbol_limits: dict, dry_run: bool, sleep_time: float, value: float, worker=None) -> bool:
+    # legs 是两条 (account, client, state)：撤超时挂单、平残留仓位、两边反向各挂一单，然后等成交。返回是否下了单
+    (account_a, client_a, state_a), (account_b, client_b, state_b) = legs
+    logger.info("sleep_time: %.0f value: %.1f", sleep_time, value)
+    placed = False
     try:
-        symbol_limits = build_symbol_limits(client_a)
-    except Exception as e:
-        logger.exception(f"build symbol limits failed:{e}")
-        time.sleep(100)
-        return
-
-    while True:
-        try:
-            sleep_time = random.randint(100, 300)
-            logger.info(f"sleep_time: {sleep_time}")
-
-            # 成本控制：两个账户都达到阈值则不交易
-            enough_a = is_cost_enough(client_a, account_a["key"], account_a.get("cost_per_day", 0))
-            enough_b = is_cost_enough(client_b, account_b["key"], account_b.get("cost_per_day", 0))
-            if enough_a and enough_b:
-                logger.info("cost is enough for both accounts, not trading")
-                # close_position(client_a)
-                # close_position(client_b)
-                time.sleep(sleep_time)
-                continue
-
-            order_timeout = 300 + random.randint(0, 60 * 10)
-            # 两边清理超时订单
-            for c in (client_a, client_b):
-                orders = c.get_orders()
-                if len(orders) > 0:
+        order_timeout = 300 + random.randint(0, 60 * 10)
+        # 两边清理超时订单；任何一边还有挂单，这一轮两边都不下新单
+        has_orders = False
+        for account, c, state in legs:
+            orders = get_open_orders(c, state)
+            if len(orders) > 0:
+                has_orders = True
+                live_status.set_phase(account["key"], "cancel")
+                with tracing.span("cancel_loop"):
                     for order in orders:
-                        logger.info(f"order symbol {order['symbol']} updateTime: {order['updateTime']} diff: {time.time() * 1000 - order['updateTime']}")
+                        logger.info("order symbol %s updateTime: %s diff: %.0f", order['symbol'], order['updateTime'], time.time() * 1000 - order['updateTime'])
                         if time.time() * 1000 - order['updateTime'] > order_timeout:
                             response = c.cancel_open_orders(symbol=order['symbol'])
-                            logger.info(f"cancel order response: {response}")
-                            close_position(c)
-                    time.sleep(10)
-                    # 有挂单则等待下次循环
-                    continue
-
-            # 平掉残留仓位
-            close_position(client_a)
-            close_position(client_b)
-
-            symbol, quantity, price = compute_symbol_and_qty(client_a, symbol_limits)
-            if symbol is None:
-                time.sleep(10)
-                continue
-
-            logger.info(f"hedge plan -> symbol: {symbol} qty: {quantity} price: {price}")
-
-            if dry_run:
-                logger.info("dry_run enabled, skip placing orders")
-            else:
-                # side 随机
-                sideA = random.choice(["BUY", "SELL"])
-                sideB = "SELL" if sideA == "BUY" else "BUY"
-                # A 买，B 卖
-                resp_a = client_a.new_order(symbol=symbol, side=sideA, type="LIMIT", quantity=quantity, price=price, timeInForce="GTC")
-                logger.info(f"A new order response: {resp_a}")
-                resp_b = client_b.new_order(symbol=symbol, side=sideB, type="LIMIT", quantity=quantity, price=price, timeInForce="GTC")
-                logger.info(f"B new order response: {resp_b}")
-
-        except ClientError as error:
-            logger.exception(
-                "Found error. status: {}, error code: {}, error message: {}".format(
-                    error.status_code, error.error_code, error.error_message
-            )
-            )
-            close_position(client_a, force=True)
-            close_position(client_b, force=True)
+                            journal.record(journal.CANCEL, account["key"], symbol=order['symbol'], side=order['side'], order_id=order['orderId'])
+                            logger.info("cancel order response: %s", response)
+                            close_position(c, state=state)
+        if has_orders:
+            # 有挂单则等待下次循环
+            pause(worker, 10)
+            return placed
+
+        # 平掉残留仓位
+        close_position(client_a, state=state_a)
+        close_position(client_b, state=state_b)
+
+        live_status.set_phase(account_a["key"], "quote")
+        symbol, quantity, price = compute_symbol_and_qty(client_a, symbol_limits, value)
+        if symbol is None:
+            pause(worker, 10)
+            return placed
+
+        logger.info("hedge plan -> symbol: %s qty: %s price: %s", symbol, quantity, price)
+
+        if dry_run:
+            logger.info("dry_run enabled, skip placing orders")
+        else:
+            # side 随机
+            sideA = random.choice(["BUY", "SELL"])
+            sideB = "SELL" if sideA == "BUY" else "BUY"
+            # A 买，B 卖
+            for (account, client, _), side, name in zip(legs, (sideA, sideB), ("A", "B")):
+                live_status.set_phase(account["key"], "order")
+                journal.record(journal.ORDER_SENT, account["key"], symbol=symbol, side=side, price=price, qty=quantity)
+                start = time.time()
+                with tracing.span("new_order", symbol=symbol, side=side):
+                    response = client.new_order(symbol=symbol, side=side, type="LIMIT", quantity=quantity, price=price, timeInForce="GTC")
+                journal.record(journal.ORDER_ACK, account["key"], symbol=symbol, side=side, order_id=response.get("orderId", 0),
+                               latency_ms=(time.time() - start) * 1000)
+                metrics.inc_orders_placed(account["key"])
+                logger.info("%s new order response: %s", name, response)
+                placed = True
+
+    except ClientError as error:
+        logger.exception(
+            "Found error. status: {}, error code: {}, error message: {}".format(
+                error.status_code, error.error_code, error.error_message
+        )
+        )
+        for account in (account_a, account_b):
+            live_status.set_error(account["key"], f"error code: {error.error_code}, error message: {error.error_message}")
+        close_position(client_a, force=True, state=state_a)
+        close_position(client_b, force=True, state=state_b)
+    except Exception as e:
+        logger.exception(e)
+        for account in (account_a, account_b):
+            live_status.set_error(account["key"], e)
+        close_position(client_a, force=True, state=state_a)
+        close_position(client_b, force=True, state=state_b)
+
+    for account in (account_a, account_b):
+        live_status.set_phase(account["key"], "wait")
+    fill_event = None
+    if state_a is not None and state_b is not None:
+        fill_event = threading.Event()
+        state_a.add_fill_listener(fill_event)
+        state_b.add_fill_listener(fill_event)
+    try:
+        wait_for_fills(sleep_time, fill_event, [(client_a, state_a), (client_b, state_b)], worker)
+    finally:
+        if fill_event is not None:
+            state_a.remove_fill_listener(fill_event)
+            state_b.remove_fill_listener(fill_event)
+    return placed
+
+def hedge_turn(scheduler: HedgeScheduler, pair: list, legs: list, dry_run: bool, worker=None) -> list:
+    # 先查两边当天成本：达到预算的账户撤单平仓、退出配对，另一边回到账户池等下一次配对。返回达到预算的账户
+    tracing.begin_loop(legs[0][0]["key"])
+    finished = []
+    plans = []
+    now = time.time()
+    for entry, (account, client, state) in zip(pair, legs):
+        metrics.inc_loop(account["key"])
+        live_status.begin_loop(account["key"])
+        cost, enough = check_cost(client, account["key"], account.get("cost_per_day", 0))
+        scheduler.record(entry, cost)
+        # 每个账户只挂一条腿；各自按自己的进度决定下次什么时候再进入配对
+        pacer = pacing.pacer_of(account["key"], 1)
+        pacer.observe(cost)
+        delay, value = pacer.plan(cost, account.get("cost_per_day", 0), now)
+        scheduler.defer(entry, now + delay)
+        live_status.set_plan(account["key"], now + delay, value)
+        plans.append((delay, value))
+        if enough:
+            finished.append((account, client, state))
+    for account, client, state in finished:
+        logger.info(f"{account['key']} cost is enough, leave hedge pairing for today")
+        live_status.set_phase(account["key"], "idle")
+        wind_down(client, state)
+    if finished:
+        return finished
+    # 两条腿一起下单，按更落后的一边来：单量取大的；这一对最多占用 hold_time 等成交，之后释放回账户池
+    delay = min(delay for delay, _ in plans)
+    value = max(value for _, value in plans)
+    if hedge_round(legs, build_symbol_limits(legs[0][1]), dry_run, min(delay, hedge_hold_time), value, worker):
+        for account, _, _ in legs:
+            pacing.pacer_of(account["key"], 1).traded(value)
+    return finished
+
+def hedge_slot(scheduler: HedgeScheduler, dry_run: bool, worker=None):
+    # 对冲模式的一个 slot：每轮从调度器租一对剩余预算最多的账户，查成本、下单、等成交后归还
+    while not stopping(worker):
+        pair = scheduler.lease(worker)
+        if pair is None:
+            pause(worker, hedge_idle_wait)
+            continue
+        legs = []
+        finished = []
+        try:
+            legs = [(entry.account,) + scheduler.leg(entry) for entry in pair]
+            finished = hedge_turn(scheduler, pair, legs, dry_run, worker)
         except Exception as e:
             logger.exception(e)
-            close_position(client_a, force=True)
-            close_position(client_b, force=True)
+            for entry in pair:
+                live_status.set_error(entry.key, e)
+            pause(worker, 10)
+        finally:
+            if stopping(worker):
+                # slot 被停掉（配置重载删了其中一个账户或 slot 多了）：这对账户撤单平仓后再释放
+                for account, client, state in legs:
+                    live_status.set_phase(account["key"], "stopping")
+                    wind_down(client, state)
+            else:
+                for entry in pair:
+                    if all(entry.account is not account for account, _, _ in finished):
+                        live_status.set_phase(entry.key, "pooled")
+            scheduler.release(pair)
 
-        time.sleep(sleep_time)
 
-if __name__ == "__main__":
+def prepare_leg(account: dict) -> tuple:
+    client = create_client(account["key"], account["secret"], account["proxy"])
+    return client, open_account_state(client, account["key"], account["proxy"])
+
+def start_slot(worker, scheduler: HedgeScheduler, dry_run: bool):
+    worker.thread = threading.Thread(target=hedge_slot, args=(scheduler, dry_run, worker), name=worker.name)
+    worker.thread.start()
+
+def worker_main(worker, target, args):
+    try:
+        target(*args)
+    finally:
+        # 被重载停掉的账户从页面上消失
+        for account in worker.accounts:
+            live_status.remove(account["key"])
+
+def start_worker(worker):
+    account = worker.accounts[0]
+    args = (account["key"], account["secret"], account["proxy"], account.get("cost_per_day", 0), worker)
+    live_status.register(account["key"], account.get("name", ""), account.get("cost_per_day", 0))
+    worker.thread = threading.Thread(target=worker_main, args=(worker, thread_function, args), name=worker.name)
+    worker.thread.start()
+
+def apply_accounts(registry: WorkerRegistry, pool: HedgePool, accounts: list, hedge_mode: bool) -> dict:
+    # 对冲模式下所有账户交给调度器动态配对，否则每个账户一个 worker；切换模式时先清空另一边
+    if hedge_mode:
+        registry.apply([], False)
+        summary = pool.apply(accounts)
+    else:
+        summary = pool.apply([])
+        summary = dict(registry.apply(accounts, False), removed=summary["removed"])
+    names = {account["key"]: account for account in accounts}
+    for key in summary.get("added", []):
+        live_status.register(key, names[key].get("name", ""), names[key].get("cost_per_day", 0))
+    for key in summary["removed"]:
+        live_status.remove(key)
+    return summary
+
+def select_accounts(config: dict, shard=None) -> list:
+    # 分片模式下只运行分到本进程的账户
+    if shard is None:
+        return config.get("accounts") or []
+    index, count = shard
+    return shard_accounts(config, count, index)
+
+def reload_accounts(registry: WorkerRegistry, pool: HedgePool, shard=None):
+    try:
+        config = load_config(config_path)
+    except Exception as e:
+        # 配置写了一半或格式错误时保持现状，下次修改再重试
+        logger.error(f"reload config failed, keep running workers:{e}")
+        return
+    accounts = select_accounts(config, shard)
+    running = registry.keys() | pool.keys()
+    summary = apply_accounts(registry, pool, accounts, config.get("hedge_mode", False))
+    # 重新配对的账户推送继续复用，只有彻底删掉的账户才关闭
+    for key in running - {account["key"] for account in accounts}:
+        close_user_stream(key)
+    logger.info(f"config reloaded: {summary}")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="启动刷量主程序")
+    parser.add_argument("--supervise", action="store_true", help="按代理把账户分到多个子进程运行，子进程异常退出单独重启")
+    parser.add_argument("--processes", type=int, help="子进程数，默认读配置里的 processes，没有配置时为 CPU 核数")
+    parser.add_argument("--shard", help="只运行第 i/n 个分片，由 supervisor 传入")
+    return parser
+
+def main(argv: list = None):
+    args = build_parser().parse_args(argv)
     config = init_config()
-    accounts = config["accounts"]
+    if args.supervise:
+        return run_supervisor(config, args.processes or config.get("processes") or os.cpu_count() or 1)
+    shard = parse_shard(args.shard) if args.shard else None
+    accounts = select_accounts(config, shard)
     hedge_mode = config.get("hedge_mode", False)
     dry_run = config.get("dry_run", False)
 
-    threads = []
-    if hedge_mode and len(accounts) >= 2:
-        # 两两成对运行
-        for i in range(0, len(accounts) - 1, 2):
-            acc_a = accounts[i]
-            acc_b = accounts[i + 1]
-            thread = threading.Thread(target=hedge_run, args=(acc_a, acc_b, dry_run))
-            thread.start()
-            threads.append(thread)
-        # 如果为奇数，最后一个账户仍按单账户策略
-        if len(accounts) % 2 == 1:
-            last = accounts[-1]
-            thread = threading.Thread(target=thread_function, args=(last["key"], last["secret"], last["proxy"], last.get("cost_per_day", 0)))
-            thread.start()
-            threads.append(thread)
-    else:
-        # 兼容原有单账户并行
-        for account in accounts:
-            thread = threading.Thread(target=thread_function, args=(account["key"], account["secret"], account["proxy"], account["cost_per_day"]))
-            thread.start()
-            threads.append(thread)
-
-    for thread in threads:
-        thread.join()
\ No newline at end of file
+    configure_endpoints(config)
+    http_pool.configure(config.get("http_pool_size", 10))
+    threading.Thread(target=http_pool.log_pool_stats_forever, daemon=True).start()
+    rate_limiter.configure(config.get("rate_limit", {}))
+    threading.Thread(target=rate_limiter.log_headroom_forever, daemon=True).start()
+    tracing.configure(config.get("tracing", {}))
+    pacing.configure(config.get("pacing", {}))
+    commission_ledger.configure(config.get("commission", {}))
+    metrics_path = config.get("metrics_socket", metrics.socket_path)
+    status_path = live_status.status_file
+    if shard is not None:
+        # 同一台机器上的分片共用落盘的标记价格；supervisor 通过各自的 socket 检查存活并汇总指标
+        use_disk_market_cache()
+        metrics_path = shard_path(metrics_path, shard[0])
+        status_path = shard_path(status_path, shard[0])
+    try:
+        metrics.start_server(metrics_path)
+    except OSError as e:
+        logger.error(f"start metrics server failed:{e}")
+    # 各账户的循环阶段、挂单、持仓和当天成本，app.py 读这个文件推给页面
+    live_status.start_publisher(status_path, shard[0] if shard is not None else None)
+
+    # 全进程共享一份标记价格和盘口，由 markPrice / bookTicker 推送维护
+    start_market_streams(symbols)
+
+    watcher = ConfigWatcher(config_path)
+    # app.py 改完配置会发 SIGHUP，立即重载；手工修改靠轮询修改时间
+    signal.signal(signal.SIGHUP, watcher.trigger)
+
+    if config["engine"] == "async":
+        # 协程模式：所有账户在一个事件循环里跑，同代理共用连接池；重载和后台对账由事件循环里的任务负责
+        from async_runner import run_async
+
+        def load_accounts():
+            reloaded = load_config(config_path)
+            return select_accounts(reloaded, shard), reloaded.get("hedge_mode", False)
+
+        run_async(dict(config, accounts=accounts), symbols, watcher, load_accounts)
+        return 0
+
+    # 推送连着的账户手续费按成交实时估算，后台定期用收支流水校正
+    threading.Thread(target=commission_ledger.reconcile_forever, args=(get_mark_price_dict,), daemon=True).start()
+
+    # 对冲模式由调度器每轮按剩余预算重新配对；config.yaml 修改后只增删变化的账户
+    registry = WorkerRegistry(start_worker)
+    scheduler = HedgeScheduler(prepare_leg)
+    pool = HedgePool(scheduler, lambda worker: start_slot(worker, scheduler, dry_run), wind_down)
+    apply_accounts(registry, pool, accounts, hedge_mode)
+    while True:
+        if watcher.wait():
+            reload_accounts(registry, pool, shard)
+
+if __name__ == "__main__":
+    sys.exit(main())
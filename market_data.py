@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("aster")
+
+stream_url = "wss://fstream.asterdex.com"
+cache_file = os.path.join("data", "mark_price.json")
+
+
+def create_ws_client():
+    # 只有常驻进程才会订阅推送，命令行子命令不需要加载 websocket 依赖
+    from aster.websocket.client.stream import WebsocketClient
+    return WebsocketClient(stream_url=stream_url)
+
+
+def parse_stream_message(message):
+    # 兼容原始字符串、单流消息和组合流 {"stream":..., "data":...} 三种格式
+    if isinstance(message, (bytes, bytearray)):
+        message = message.decode("utf8")
+    if isinstance(message, str):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return None
+    if isinstance(message, dict) and "stream" in message and "data" in message:
+        message = message["data"]
+    return message
+
+
+class MarkPriceCache:
+    # 进程内共享的标记价格缓存：优先由全市场 markPrice 推送更新，推送过期时回落到 REST
+    def __init__(self, ttl: float = 10):
+        self.ttl = ttl
+        # 每次更新都换成新的 dict，读者拿到的快照不会被并发修改
+        self.prices = {}
+        self.updated_at = 0
+        self.stream_updated_at = 0
+        self.refresh_lock = threading.Lock()
+        self.ws_client = None
+        self.cache_path = None
+
+    def use_disk_cache(self, ttl: float, path: str = cache_file):
+        # 短命令行进程没有推送，ttl 内的价格直接从文件读，过期再拉 REST 并写回
+        self.ttl = ttl
+        self.cache_path = path
+
+    def load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"load mark price cache failed:{e}")
+            return False
+        if time.time() - cached["saved_at"] > self.ttl:
+            return False
+        self.prices = cached["prices"]
+        self.updated_at = cached["saved_at"]
+        return True
+
+    def save(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # 多个命令行进程可能同时写，临时文件带上 pid
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"saved_at": self.updated_at, "prices": self.prices}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def start_stream(self):
+        if self.ws_client is not None:
+            return
+        try:
+            self.ws_client = create_ws_client()
+            self.ws_client.start()
+            self.ws_client.live_subscribe(stream="!markPrice@arr@1s", id=1, callback=self.on_message)
+            logger.info("mark price stream started")
+        except Exception as e:
+            logger.exception(f"start mark price stream failed:{e}")
+            self.ws_client = None
+
+    def stop_stream(self):
+        if self.ws_client is None:
+            return
+        try:
+            self.ws_client.stop()
+        except Exception as e:
+            logger.error(f"stop mark price stream failed:{e}")
+        self.ws_client = None
+
+    def on_message(self, message):
+        items = parse_stream_message(message)
+        if not isinstance(items, list):
+            # 订阅回包等非行情消息
+            return
+        prices = dict(self.prices)
+        for item in items:
+            if item.get("e") != "markPriceUpdate":
+                continue
+            prices[item["s"]] = {
+                "symbol": item["s"],
+                "markPrice": item["p"],
+                "indexPrice": item.get("i"),
+                "lastFundingRate": item.get("r"),
+                "nextFundingTime": item.get("T"),
+                "time": item.get("E"),
+            }
+        now = time.time()
+        self.prices = prices
+        self.updated_at = now
+        self.stream_updated_at = now
+
+    def is_stale(self):
+        return time.time() - self.updated_at > self.ttl
+
+    def refresh(self, client):
+        # 多个线程同时发现过期时只让一个去拉 REST，其余等它完成后直接读缓存
+        with self.refresh_lock:
+            if not self.is_stale():
+                return
+            if self.load():
+                return
+            try:
+                mark_price_info = client.mark_price()
+            except Exception as e:
+                logger.error(f"get mark price failed:{e}")
+                return
+            self.update(mark_price_info)
+            if self.cache_path is not None:
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.error(f"save mark price cache failed:{e}")
+
+    def update(self, mark_price_info: list):
+        prices = dict(self.prices)
+        for info in mark_price_info:
+            prices[info["symbol"]] = info
+        self.prices = prices
+        self.updated_at = time.time()
+        if self.ws_client is not None:
+            logger.warning(f"mark price stream stale for {time.time() - self.stream_updated_at:.1f}s, refreshed by REST")
+
+    def get_all(self, client=None) -> dict:
+        if self.is_stale() and client is not None:
+            self.refresh(client)
+        return self.prices
+
+
+class BookTickerFeed:
+    # 所有账户线程共用一条组合流连接，订阅 symbols 的 bookTicker，读取时检查时效
+    def __init__(self, max_age: float = 3):
+        self.max_age = max_age
+        self.tickers = {}
+        self.ws_client = None
+
+    def start_stream(self, symbols: list):
+        if self.ws_client is not None:
+            return
+        streams = [f"{symbol.lower()}@bookTicker" for symbol in sorted(set(symbols))]
+        try:
+            self.ws_client = create_ws_client()
+            self.ws_client.start()
+            self.ws_client.live_subscribe(stream=streams, id=2, callback=self.on_message)
+            logger.info(f"book ticker stream started: {streams}")
+        except Exception as e:
+            logger.exception(f"start book ticker stream failed:{e}")
+            self.ws_client = None
+
+    def stop_stream(self):
+        if self.ws_client is None:
+            return
+        try:
+            self.ws_client.stop()
+        except Exception as e:
+            logger.error(f"stop book ticker stream failed:{e}")
+        self.ws_client = None
+
+    def on_message(self, message):
+        item = parse_stream_message(message)
+        if not isinstance(item, dict) or item.get("e") != "bookTicker":
+            return
+        # 单个 symbol 的整体替换是原子的，不需要加锁
+        self.tickers[item["s"]] = {
+            "symbol": item["s"],
+            "bidPrice": item["b"],
+            "bidQty": item["B"],
+            "askPrice": item["a"],
+            "askQty": item["A"],
+            "time": item.get("T"),
+            "received": time.time(),
+        }
+
+    def get(self, symbol: str, client=None, max_age: float = None):
+        max_age = self.max_age if max_age is None else max_age
+        ticker = self.tickers.get(symbol)
+        if ticker is not None and time.time() - ticker["received"] <= max_age:
+            return ticker
+        if client is None:
+            return None
+        # 推送过期或还没收到，退回 REST
+        return self.update(client.book_ticker(symbol))
+
+    def update(self, book_ticker: dict):
+        ticker = dict(book_ticker)
+        ticker["received"] = time.time()
+        self.tickers[ticker["symbol"]] = ticker
+        return ticker
+
+
+mark_price_cache = MarkPriceCache()
+book_ticker_feed = BookTickerFeed()
+
+
+def get_mark_price_dict(client=None) -> dict:
+    return mark_price_cache.get_all(client)
+
+
+def get_book_ticker(client, symbol: str, max_age: float = None) -> dict:
+    return book_ticker_feed.get(symbol, client, max_age)
+
+
+def start_market_streams(symbols: list = None):
+    mark_price_cache.start_stream()
+    if symbols:
+        book_ticker_feed.start_stream(symbols)
@@ -0,0 +1,207 @@
+import bisect
+import logging
+import os
+import socket
+import socketserver
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger("aster")
+
+# 主进程在本地 Unix socket 上输出 Prometheus 文本，app.py 的 /metrics 读取后转发
+socket_path = os.path.join("data", "metrics.sock")
+
+# 毫秒，覆盖从同机房到跨洲代理的延迟
+latency_buckets = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+help_texts = {
+    "aster_rest_latency_ms": "REST request latency in milliseconds",
+    "aster_rest_requests_total": "REST requests by endpoint and status",
+    "aster_rest_errors_total": "REST errors by endpoint and exchange error code",
+    "aster_used_weight": "X-MBX-USED-WEIGHT-1M reported by the exchange",
+    "aster_loop_iterations_total": "Trading loop iterations",
+    "aster_orders_placed_total": "Orders accepted by the exchange",
+    "aster_orders_filled_total": "Trade executions from the user data stream",
+    "aster_commission_today": "Today's commission in USDT",
+    "aster_cost_per_day": "Configured commission budget per day",
+}
+
+
+def account_label(api_key: str) -> str:
+    # 只暴露 key 前 8 位
+    return api_key[:8]
+
+
+def proxy_label(proxy: str) -> str:
+    # 代理地址里可能带账号密码，只保留 host:port
+    if not proxy:
+        return "direct"
+    parsed = urlparse(proxy)
+    return parsed.netloc.rsplit("@", 1)[-1] or proxy
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # 计数和直方图都是按 (指标名, 标签) 累加的纯内存结构，一把锁，热路径上只有几次 dict 操作
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, labels: tuple, value: float):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def render(self) -> str:
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self.histograms.items())
+        lines = []
+        declared = set()
+
+        def declare(name: str, kind: str):
+            if name in declared:
+                return
+            declared.add(name)
+            lines.append(f"# HELP {name} {help_texts.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.3f}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+registry = Registry()
+# 额外的文本来源，比如 supervisor 汇总的各子进程指标，每次请求时调用
+collectors = []
+
+
+def render_all() -> str:
+    parts = [registry.render()]
+    for collect in collectors:
+        try:
+            parts.append(collect())
+        except Exception as e:
+            logger.error(f"collect metrics failed:{e}")
+    return "".join(parts)
+
+
+def observe_request(method: str, url: str, proxy: str, status: int, elapsed_ms: float, headers=None, error_code=None):
+    endpoint = f"{method.upper()} {urlparse(url).path}"
+    registry.observe("aster_rest_latency_ms", (("endpoint", endpoint),), elapsed_ms)
+    registry.inc("aster_rest_requests_total", (("endpoint", endpoint), ("status", str(status))))
+    if error_code is not None:
+        registry.inc("aster_rest_errors_total", (("endpoint", endpoint), ("code", str(error_code))))
+    used = headers.get("X-MBX-USED-WEIGHT-1M") if headers is not None else None
+    if used is not None:
+        registry.set("aster_used_weight", (("proxy", proxy_label(proxy)),), int(used))
+
+
+def error_code_of(status: int, body) -> object:
+    # 只有出错的响应才解析包体取交易所错误码
+    if status < 400:
+        return None
+    try:
+        return body().get("code", status)
+    except Exception:
+        return status
+
+
+def inc_loop(api_key: str):
+    registry.inc("aster_loop_iterations_total", (("account", account_label(api_key)),))
+
+
+def inc_orders_placed(api_key: str, count: int = 1):
+    registry.inc("aster_orders_placed_total", (("account", account_label(api_key)),), count)
+
+
+def inc_fills(api_key: str):
+    registry.inc("aster_orders_filled_total", (("account", account_label(api_key)),))
+
+
+def set_cost(api_key: str, cost: float, cost_per_day: float):
+    labels = (("account", account_label(api_key)),)
+    registry.set("aster_commission_today", labels, abs(cost))
+    registry.set("aster_cost_per_day", labels, cost_per_day)
+
+
+class MetricsHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(render_all().encode())
+
+
+def start_server(path: str = socket_path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        # 上次进程没清理的 socket 文件
+        os.remove(path)
+    server = socketserver.ThreadingUnixStreamServer(path, MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"metrics server listening on {path}")
+    return server
+
+
+def fetch(path: str = socket_path, timeout: float = 2) -> str:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode()
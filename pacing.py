@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+import commission_ledger
+
+logger = logging.getLogger("aster")
+
+# 按剩余预算、距离换日的时间和实际花费的手续费安排每个账户的下单节奏，把 cost_per_day 摊到一整天
+min_delay = 60
+max_delay = 3600
+# 计划在换日前这么久花完当天预算，留出余量应对后面成交率变差
+finish_margin = 3600
+# 每轮的间隔上下随机浮动，账户之间不会踩着同一个节拍
+jitter = 0.2
+# 每笔订单的基准价值（USDT），按进度在 min_scale ~ max_scale 倍之间调整
+base_value = 250
+min_scale = 0.5
+max_scale = 2
+# 观测值的平滑系数
+alpha = 0.3
+# 定时堆同一时刻到期的多个账户，每隔这么久叫醒一个，避免一起打交易所
+spacing = 0.05
+
+
+def configure(config: dict):
+    global min_delay, max_delay, finish_margin, jitter, base_value, min_scale, max_scale, spacing
+    min_delay = config.get("min_delay", min_delay)
+    max_delay = config.get("max_delay", max_delay)
+    finish_margin = config.get("finish_margin", finish_margin)
+    jitter = config.get("jitter", jitter)
+    base_value = config.get("base_value", base_value)
+    min_scale = config.get("min_scale", min_scale)
+    max_scale = config.get("max_scale", max_scale)
+    spacing = config.get("spacing", spacing)
+
+
+def day_end(now: float) -> float:
+    # 与手续费账本的换日时间一致
+    return commission_ledger.day_range(datetime.fromtimestamp(now))[1] / 1000
+
+
+class Pacer:
+    # 单个账户的节奏。unit_cost 是每 1 USDT 计划下单额实际产生的手续费，没成交的轮次也算在分母里，
+    # 所以它同时反映了费率和成交率；还没观测到之前按 taker 费率估算
+    def __init__(self, orders_per_round: int):
+        self.orders_per_round = orders_per_round
+        self.unit_cost = None
+        self.last_spent = None
+        self.planned = 0
+
+    def observe(self, cost: float):
+        # 每次查完成本调用：两次检查之间新增的手续费 / 这期间计划下单的总额
+        spent = abs(cost)
+        if self.last_spent is not None and spent < self.last_spent:
+            # 换日，重新累计
+            self.planned = 0
+        elif self.last_spent is not None and self.planned > 0:
+            sample = (spent - self.last_spent) / self.planned
+            self.unit_cost = sample if self.unit_cost is None else self.unit_cost + alpha * (sample - self.unit_cost)
+            self.planned = 0
+        self.last_spent = spent
+
+    def traded(self, value: float):
+        self.planned += value * self.orders_per_round
+
+    def plan(self, cost: float, cost_per_day: float, now: float = None) -> tuple:
+        # 返回 (距离下一轮的秒数, 这一轮每笔订单的价值)
+        now = now or time.time()
+        remaining = cost_per_day - abs(cost)
+        if remaining <= 0:
+            # 今天的预算已经用完，睡到换日；最长 max_delay 醒来看一次配置有没有改
+            return min(max(day_end(now) - now, min_delay), max_delay), base_value
+        time_left = day_end(now) - now - finish_margin
+        unit_cost = self.unit_cost if self.unit_cost else commission_ledger.taker_rate
+        if time_left <= min_delay:
+            # 已经过了计划花完的时间，最大单量、最快节奏追赶
+            return self.jittered(min_delay), base_value * max_scale
+        # 保持当前单量时，把剩余预算均匀花到计划时间内每轮需要间隔多久
+        interval = time_left * unit_cost * base_value * self.orders_per_round / remaining
+        scale = 1
+        if interval < min_delay:
+            # 最快节奏也来不及：加大单量
+            scale = min(max_scale, min_delay / interval)
+        elif interval > max_delay:
+            # 时间很充裕：减小单量，多分几轮，成本检查也不会隔得太久
+            scale = max(min_scale, max_delay / interval)
+        delay = min(max(interval * scale, min_delay), max_delay)
+        return self.jittered(delay), base_value * scale
+
+    def jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+pacers = {}
+pacers_lock = threading.Lock()
+
+
+def pacer_of(api_key: str, orders_per_round: int) -> Pacer:
+    # 每个账户一个，worker 重启后沿用已经观测到的成交率
+    with pacers_lock:
+        pacer = pacers.get(api_key)
+        if pacer is None or pacer.orders_per_round != orders_per_round:
+            pacer = Pacer(orders_per_round)
+            pacers[api_key] = pacer
+        return pacer
+
+
+class Timer:
+    __slots__ = ("due", "event", "fired", "cancelled")
+
+    def __init__(self, due: float, event: threading.Event):
+        self.due = due
+        self.event = event
+        self.fired = False
+        self.cancelled = False
+
+
+class TimerHeap:
+    # 全进程所有账户的下一轮都放在一个堆里，由一个线程按到期顺序叫醒；
+    # 账户线程只在自己的 Event 上等，到点、成交推送、配置重载停掉 worker 都能把它叫醒
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = itertools.count()
+        self.cancelled = 0
+        self.next_fire = 0
+        self.thread = None
+
+    def schedule(self, delay: float, event: threading.Event) -> Timer:
+        timer = Timer(time.time() + delay, event)
+        with self.cond:
+            heapq.heappush(self.heap, (timer.due, next(self.seq), timer))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name="pacing-timers")
+                self.thread.start()
+            self.cond.notify()
+        return timer
+
+    def cancel(self, timer: Timer):
+        # 惰性删除：到期时跳过；取消的太多时整理一次堆
+        with self.cond:
+            if timer.fired or timer.cancelled:
+                return
+            timer.cancelled = True
+            self.cancelled += 1
+            if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+                self.heap = [item for item in self.heap if not item[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.heap) - self.cancelled
+
+    def run(self):
+        with self.cond:
+            while True:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                due, _, timer = self.heap[0]
+                if timer.cancelled:
+                    heapq.heappop(self.heap)
+                    self.cancelled -= 1
+                    continue
+                now = time.time()
+                at = max(due, self.next_fire)
+                if at > now:
+                    self.cond.wait(at - now)
+                    continue
+                heapq.heappop(self.heap)
+                timer.fired = True
+                timer.event.set()
+                self.next_fire = now + spacing
+
+
+clock = TimerHeap()
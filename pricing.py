@@ -0,0 +1,110 @@
+import random
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
+
+# 价格和数量全部换成定点整数计算：价格以 10^-price_digits 为单位，数量以 10^-qty_digits 为单位，
+# 取整、比较和最小名义价值判断都是精确的整数运算，最后才转回 float 交给下单接口
+value_scale = 10 ** 8
+default_min_notional = 5
+
+TickLimit = namedtuple("TickLimit", ["price_digits", "price_scale", "tick", "qty_digits", "qty_scale", "step", "min_qty", "max_qty",
+                                     "min_notional"])
+
+
+def digits_of(step: float) -> int:
+    exponent = Decimal(repr(step)).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+
+def to_units(value, digits: int) -> int:
+    # 字符串去掉小数点直接转整数，不经过 float；科学计数法或位数超出精度的少见情况交给 Decimal 四舍五入
+    text = value if isinstance(value, str) else repr(value)
+    point = text.find(".")
+    if point < 0:
+        if "e" in text or "E" in text:
+            return int(Decimal(text).scaleb(digits).to_integral_value())
+        return int(text) * 10 ** digits
+    places = len(text) - point - 1
+    if places > digits or "e" in text or "E" in text:
+        return int(Decimal(text).scaleb(digits).to_integral_value())
+    return int(text[:point] + text[point + 1:]) * 10 ** (digits - places)
+
+
+@lru_cache(maxsize=4096)
+def compile_limit(tick_size: float, step_size: float, min_qty: float, max_qty: float, min_notional: float) -> TickLimit:
+    # 每组过滤器只解析一次；交易规则刷新后值没变就直接命中缓存
+    price_digits = digits_of(tick_size)
+    qty_digits = digits_of(step_size)
+    return TickLimit(
+        price_digits=price_digits,
+        price_scale=10 ** price_digits,
+        tick=to_units(tick_size, price_digits),
+        qty_digits=qty_digits,
+        qty_scale=10 ** qty_digits,
+        step=to_units(step_size, qty_digits),
+        min_qty=to_units(min_qty, qty_digits),
+        max_qty=to_units(max_qty, qty_digits),
+        min_notional=to_units(min_notional, price_digits + qty_digits),
+    )
+
+
+def tick_limit_of(symbol_limit: dict) -> TickLimit:
+    return compile_limit(symbol_limit["tick_size"], symbol_limit["step_size"], symbol_limit["min_qty"],
+                         symbol_limit["max_qty"], symbol_limit.get("min_notional", default_min_notional))
+
+
+def mid_price_units(book_ticker: dict, limit: TickLimit):
+    # 中间价按 tick 向下取整，落在买一或卖一上时返回 None（价差太小，不交易）
+    bid = to_units(book_ticker["bidPrice"], limit.price_digits)
+    ask = to_units(book_ticker["askPrice"], limit.price_digits)
+    mid = (bid + ask) // (2 * limit.tick) * limit.tick
+    if mid <= bid or mid >= ask:
+        return None
+    return mid
+
+
+def quantity_units(value: float, mid: int, limit: TickLimit, times: int):
+    # value / mid 加上 times 个最小下单量，按 step 向下取整，超过上限截断，名义价值不足返回 None
+    denominator = mid * value_scale
+    numerator = round(value * value_scale) * limit.price_scale * limit.qty_scale + times * limit.min_qty * denominator
+    quantity = numerator // denominator // limit.step * limit.step
+    if quantity > limit.max_qty:
+        quantity = limit.max_qty
+    if quantity * mid < limit.min_notional:
+        return None
+    return quantity
+
+
+def size_orders(book_ticker: dict, symbol_limit: dict, values: list, times: list = None):
+    # 同一个盘口快照给多个账户一次性定价和定量：中间价只算一次，返回 (mid_price, [quantity or None, ...])
+    limit = tick_limit_of(symbol_limit)
+    mid = mid_price_units(book_ticker, limit)
+    if mid is None:
+        return None, [None] * len(values)
+    if times is None:
+        times = [random.randint(1, 5) for _ in values]
+    qty_scale = limit.qty_scale
+    quantities = []
+    for value, count in zip(values, times):
+        quantity = quantity_units(value, mid, limit, count)
+        quantities.append(None if quantity is None else quantity / qty_scale)
+    return mid / limit.price_scale, quantities
+
+
+def calc_net_balance(account: dict, mark_price_dict: dict):
+    # 多资产模式下按标记价格折算各资产的保证金余额，稳定币按 1 计
+    net_balance = 0
+    for asset in account['assets']:
+        if abs(float(asset['marginBalance'])) <= 1e-10:
+            continue
+        symbol = asset['asset'] + "USDT"
+        mark_price = 0
+        if symbol in mark_price_dict:
+            mark_price_info = mark_price_dict[symbol]
+            mark_price = mark_price_info['markPrice']
+        value = float(asset['marginBalance']) * float(mark_price)
+        if asset['asset'] == "USDT" or asset['asset'] == "BUSD" or asset['asset'] == "USDC" or asset['asset'] == "USDF":
+            value =  float(asset['marginBalance'])
+        net_balance += value
+    return net_balance
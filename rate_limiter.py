@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger("aster")
+
+# 交易所按 IP 统计每分钟权重，这里同时给每个账户一个上限，避免单个账户回补流水时挤占同 IP 的其它账户
+ip_weight_per_minute = 2400
+account_weight_per_minute = 1200
+# 每个桶留出这一部分额度，只有撤单和只减仓单（平仓）能用，限频时也能先把风险收掉
+reserve_ratio = 0.1
+
+# (method, path) -> (带 symbol 时的权重, 不带 symbol 时的权重)
+endpoint_weights = {
+    ("GET", "/fapi/v1/exchangeInfo"): (1, 1),
+    ("GET", "/fapi/v1/ticker/bookTicker"): (2, 5),
+    ("GET", "/fapi/v1/premiumIndex"): (1, 10),
+    ("GET", "/fapi/v2/account"): (5, 5),
+    ("GET", "/fapi/v2/balance"): (5, 5),
+    ("GET", "/fapi/v1/openOrders"): (1, 40),
+    ("DELETE", "/fapi/v1/allOpenOrders"): (1, 1),
+    ("GET", "/fapi/v2/positionRisk"): (5, 5),
+    ("GET", "/fapi/v1/income"): (30, 30),
+    ("POST", "/fapi/v1/order"): (1, 1),
+    ("DELETE", "/fapi/v1/order"): (1, 1),
+    ("POST", "/fapi/v1/batchOrders"): (5, 5),
+    ("GET", "/fapi/v1/userTrades"): (5, 5),
+}
+
+
+def request_weight(method: str, path: str, params: dict = None) -> int:
+    weights = endpoint_weights.get((method.upper(), path))
+    if weights is None:
+        return 1
+    return weights[0] if params and "symbol" in params else weights[1]
+
+
+def endpoint_weight(method: str, url: str) -> int:
+    parsed = urlparse(url)
+    return request_weight(method, parsed.path, parse_qs(parsed.query))
+
+
+def is_priority(method: str, params: dict = None) -> bool:
+    # 撤单和只减仓单可以用预留额度
+    if method.upper() == "DELETE":
+        return True
+    return str((params or {}).get("reduceOnly", "")).lower() == "true"
+
+
+class TokenBucket:
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.time()
+        self.used_weight = 0
+        self.banned_until = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def wait_time(self, weight: float, now: float, priority: bool = False) -> float:
+        if now < self.banned_until:
+            return self.banned_until - now
+        # 普通请求不动预留的那部分
+        floor = 0 if priority else self.capacity * reserve_ratio
+        # 账户额度被压到比单个请求的权重还小时，按桶能装下的最大值排队，等桶满了就放行（扣成负数，之后慢慢补回），不会永远等下去
+        weight = min(weight, self.capacity - floor)
+        if self.tokens - floor >= weight:
+            return 0
+        return (weight + floor - self.tokens) * 60 / self.capacity
+
+
+class WeightScheduler:
+    # 按 IP（代理）和账户两级令牌桶排队发出 REST 请求，用响应头里的已用权重校准，429/418 时整体退避
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ip_buckets = {}
+        self.account_buckets = {}
+        # proxy -> {account: 最近一次收到响应的时间}，用来算同一 IP 上有几个活跃账户
+        self.active = {}
+
+    def buckets(self, proxy: str, account: str):
+        ip_bucket = self.ip_buckets.get(proxy)
+        if ip_bucket is None:
+            ip_bucket = TokenBucket(ip_weight_per_minute)
+            self.ip_buckets[proxy] = ip_bucket
+        account_bucket = self.account_buckets.get(account)
+        if account_bucket is None:
+            account_bucket = TokenBucket(account_weight_per_minute)
+            self.account_buckets[account] = account_bucket
+        return ip_bucket, account_bucket
+
+    def reserve(self, proxy: str, account: str, weight: float, priority: bool = False) -> float:
+        # 额度够就直接扣掉并返回 0，否则返回需要等待的秒数，不阻塞
+        with self.lock:
+            now = time.time()
+            ip_bucket, account_bucket = self.buckets(proxy, account)
+            ip_bucket.refill(now)
+            account_bucket.refill(now)
+            wait = max(ip_bucket.wait_time(weight, now, priority), account_bucket.wait_time(weight, now, priority))
+            if wait > 0:
+                return wait
+            ip_bucket.tokens -= weight
+            account_bucket.tokens -= weight
+            return 0
+
+    def acquire(self, proxy: str, account: str, weight: float, priority: bool = False):
+        # 调用方要在加 timestamp 签名之前排队，等多久都不会超出 recvWindow
+        while True:
+            wait = self.reserve(proxy, account, weight, priority)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 5))
+
+    def on_response(self, proxy: str, account: str, status_code: int, headers):
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        with self.lock:
+            now = time.time()
+            ip_bucket, account_bucket = self.buckets(proxy, account)
+            active = self.active.setdefault(proxy, {})
+            active[account] = now
+            if used is not None:
+                ip_bucket.used_weight = int(used)
+                ip_bucket.refill(now)
+                ip_bucket.tokens = min(ip_bucket.tokens, ip_bucket.capacity - int(used))
+                # 账户额度跟着 IP 的实际用量走：IP 宽裕时最多 account_weight_per_minute，
+                # IP 紧张时只保证同 IP 活跃账户平分的那一份，回补流水的账户挤不掉别的账户
+                for key in [key for key, seen in active.items() if now - seen > 60]:
+                    del active[key]
+                share = ip_bucket.capacity / len(active)
+                account_bucket.refill(now)
+                account_bucket.capacity = min(account_weight_per_minute, max(share, ip_bucket.capacity - int(used)))
+                account_bucket.tokens = min(account_bucket.tokens, account_bucket.capacity)
+            if status_code in (418, 429):
+                retry_after = headers.get("Retry-After")
+                backoff = float(retry_after) if retry_after else (120 if status_code == 418 else 60)
+                ip_bucket.banned_until = max(ip_bucket.banned_until, now + backoff)
+                ip_bucket.tokens = 0
+                logger.warning(f"rate limited on {proxy}, status: {status_code}, backoff: {backoff}s")
+
+    def headroom(self) -> dict:
+        report = {}
+        with self.lock:
+            now = time.time()
+            for proxy, bucket in self.ip_buckets.items():
+                bucket.refill(now)
+                report[proxy] = {
+                    "used_weight": bucket.used_weight,
+                    "capacity": ip_weight_per_minute,
+                    "tokens": int(bucket.tokens),
+                    "banned_for": max(bucket.banned_until - now, 0),
+                }
+        return report
+
+
+scheduler = WeightScheduler()
+
+
+def configure(config: dict):
+    global ip_weight_per_minute, account_weight_per_minute
+    ip_weight_per_minute = config.get("ip_weight_per_minute", ip_weight_per_minute)
+    account_weight_per_minute = config.get("account_weight_per_minute", account_weight_per_minute)
+
+
+def log_headroom_forever(interval: float = 600):
+    while True:
+        time.sleep(interval)
+        for proxy, report in scheduler.headroom().items():
+            logger.info(f"rate limit {proxy}: used_weight: {report['used_weight']}/{report['capacity']} tokens: {report['tokens']} banned_for: {report['banned_for']:.0f}s")
@@ -0,0 +1,735 @@
+import bisect
+import hashlib
+import hmac
+import math
+import random
+import secrets
+import time
+from collections import deque
+
+# 本地模拟交易所的撮合与账户逻辑，不涉及网络，由 simulator.py 对外提供 fapi 接口
+
+maker_fee_rate = 0.0002
+taker_fee_rate = 0.0004
+initial_balance = 10000
+min_notional = 5
+
+default_markets = {
+    "BTCUSDT": {"price": 60000, "tick_size": 0.1, "step_size": 0.001, "volatility": 0.0004},
+    "ETHUSDT": {"price": 3000, "tick_size": 0.01, "step_size": 0.001, "volatility": 0.0005},
+    "ASTERUSDT": {"price": 1.2, "tick_size": 0.0001, "step_size": 1, "volatility": 0.001},
+    "SOLUSDT": {"price": 150, "tick_size": 0.01, "step_size": 0.01, "volatility": 0.0006},
+    "XRPUSDT": {"price": 0.6, "tick_size": 0.0001, "step_size": 0.1, "volatility": 0.0006},
+    "DOGEUSDT": {"price": 0.15, "tick_size": 0.00001, "step_size": 1, "volatility": 0.0008},
+}
+
+
+class ExchangeError(Exception):
+    def __init__(self, code: int, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def decimals(step: float) -> int:
+    return max(0, -int(math.floor(math.log10(step) + 1e-9)))
+
+
+def fmt(value: float, digits: int = 8) -> str:
+    return f"{value:.{digits}f}"
+
+
+def sign(secret: str, payload: str) -> str:
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+class Market:
+    # 外部流动性：围绕标记价格随机游走的一档报价，数量无限，价差 2~8 个 tick
+    def __init__(self, symbol: str, price: float, tick_size: float, step_size: float, volatility: float):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.price_precision = decimals(tick_size)
+        self.qty_precision = decimals(step_size)
+        self.volatility = volatility
+        self.mark_price = price
+        self.bid = price
+        self.ask = price
+        self.book = OrderBook()
+        self.step(0)
+
+    def round_price(self, price: float) -> float:
+        return round(round(price / self.tick_size) * self.tick_size, self.price_precision)
+
+    def step(self, volatility: float = None):
+        volatility = self.volatility if volatility is None else volatility
+        self.mark_price *= math.exp(random.gauss(0, volatility))
+        half_spread = random.randint(1, 4) * self.tick_size
+        self.bid = self.round_price(self.mark_price - half_spread)
+        self.ask = self.round_price(self.mark_price + half_spread)
+
+    def top(self):
+        # 账户挂单可能比外部报价更优
+        bid, ask = self.bid, self.ask
+        best_bid = self.book.best("BUY")
+        best_ask = self.book.best("SELL")
+        if best_bid is not None and best_bid > bid:
+            bid = best_bid
+        if best_ask is not None and best_ask < ask:
+            ask = best_ask
+        return bid, ask
+
+
+class OrderBook:
+    # 价格优先、时间优先：每个价位一个 FIFO 队列，价位列表保持有序
+    def __init__(self):
+        self.levels = {"BUY": {}, "SELL": {}}
+        self.prices = {"BUY": [], "SELL": []}
+
+    def best(self, side: str):
+        prices = self.prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == "BUY" else prices[0]
+
+    def add(self, order: dict):
+        side = order["side"]
+        price = order["price_value"]
+        level = self.levels[side].get(price)
+        if level is None:
+            level = deque()
+            self.levels[side][price] = level
+            bisect.insort(self.prices[side], price)
+        level.append(order)
+
+    def remove(self, order: dict):
+        side = order["side"]
+        price = order["price_value"]
+        level = self.levels[side].get(price)
+        if level is None:
+            return
+        try:
+            level.remove(order)
+        except ValueError:
+            return
+        if not level:
+            del self.levels[side][price]
+            self.prices[side].remove(price)
+
+    def crossing(self, side: str, limit: float = None):
+        # 按价格时间优先依次返回可与 side 方向成交的对手挂单
+        opposite = "SELL" if side == "BUY" else "BUY"
+        while True:
+            price = self.best(opposite)
+            if price is None:
+                return
+            if limit is not None and ((side == "BUY" and price > limit) or (side == "SELL" and price < limit)):
+                return
+            level = self.levels[opposite][price]
+            yield level[0]
+
+
+class Account:
+    def __init__(self, key: str, secret: str, balance: float = initial_balance):
+        self.key = key
+        self.secret = secret
+        self.wallet = balance
+        self.positions = {}
+        self.orders = {}
+        self.income = []
+        self.trades = []
+        self.leverage = {}
+        self.multi_assets = False
+        self.updated_at = now_ms()
+
+    def position(self, symbol: str) -> dict:
+        position = self.positions.get(symbol)
+        if position is None:
+            position = {"amt": 0.0, "entry": 0.0, "updated_at": 0}
+            self.positions[symbol] = position
+        return position
+
+
+class Exchange:
+    def __init__(self, markets: dict = None, recv_window: int = 5000):
+        self.markets = {symbol: Market(symbol, **spec) for symbol, spec in (markets or default_markets).items()}
+        self.accounts = {}
+        self.listen_keys = {}
+        self.recv_window = recv_window
+        self.next_order_id = 1
+        self.next_trade_id = 1
+        self.next_tran_id = 1
+        # 推送回调：(account_key, event) 与 (stream_name, payload)
+        self.on_user_event = None
+        self.on_market_event = None
+
+    # ---- 账户与签名 ----
+
+    def add_account(self, key: str, secret: str, balance: float = initial_balance):
+        self.accounts[key] = Account(key, secret, balance)
+
+    def authenticate(self, key: str, query: str, params: dict, signed: bool) -> Account:
+        account = self.accounts.get(key)
+        if account is None:
+            raise ExchangeError(-2014, "API-key format invalid.", 401)
+        if not signed:
+            return account
+        signature = params.get("signature")
+        # 签名总是最后一个参数，签的是它前面的整个 query string
+        payload = query.rsplit("&signature=", 1)[0]
+        if signature is None or not hmac.compare_digest(sign(account.secret, payload), signature):
+            raise ExchangeError(-1022, "Signature for this request is not valid.")
+        timestamp = int(params.get("timestamp", 0))
+        recv_window = int(params.get("recvWindow", self.recv_window))
+        if abs(now_ms() - timestamp) > recv_window:
+            raise ExchangeError(-1021, "Timestamp for this request is outside of the recvWindow.")
+        return account
+
+    def market(self, symbol: str) -> Market:
+        market = self.markets.get(symbol)
+        if market is None:
+            raise ExchangeError(-1121, "Invalid symbol.")
+        return market
+
+    # ---- 行情 ----
+
+    def tick(self):
+        # 外部价格游走一步，穿价的账户挂单按挂单价成交（账户为 maker）
+        for market in self.markets.values():
+            market.step()
+            for side, limit in (("SELL", market.ask), ("BUY", market.bid)):
+                # 外部卖盘吃掉价格 >= ask 的买单，外部买盘吃掉价格 <= bid 的卖单；每次全部成交，挂单随即出簿
+                for resting in market.book.crossing(side, limit):
+                    self.fill(market, resting, resting["price_value"], resting["remaining"], maker=True)
+            if self.on_market_event is not None:
+                self.on_market_event(f"{market.symbol.lower()}@bookTicker", self.book_ticker_event(market))
+
+    def mark_price_event(self) -> list:
+        now = now_ms()
+        return [{
+            "e": "markPriceUpdate",
+            "E": now,
+            "s": market.symbol,
+            "p": fmt(market.mark_price, market.price_precision + 2),
+            "i": fmt(market.mark_price, market.price_precision + 2),
+            "P": fmt(market.mark_price, market.price_precision + 2),
+            "r": "0.00010000",
+            "T": (now // 28800000 + 1) * 28800000,
+        } for market in self.markets.values()]
+
+    def book_ticker_event(self, market: Market) -> dict:
+        bid, ask = market.top()
+        now = now_ms()
+        return {"e": "bookTicker", "u": now, "E": now, "T": now, "s": market.symbol,
+                "b": fmt(bid, market.price_precision), "B": "1000",
+                "a": fmt(ask, market.price_precision), "A": "1000"}
+
+    def exchange_info(self) -> dict:
+        symbols = []
+        for market in self.markets.values():
+            symbols.append({
+                "symbol": market.symbol,
+                "pair": market.symbol,
+                "contractType": "PERPETUAL",
+                "status": "TRADING",
+                "baseAsset": market.symbol[:-4],
+                "quoteAsset": "USDT",
+                "marginAsset": "USDT",
+                "pricePrecision": market.price_precision,
+                "quantityPrecision": market.qty_precision,
+                "filters": [
+                    {"filterType": "PRICE_FILTER", "minPrice": fmt(market.tick_size, market.price_precision),
+                     "maxPrice": "1000000", "tickSize": fmt(market.tick_size, market.price_precision)},
+                    {"filterType": "LOT_SIZE", "minQty": fmt(market.step_size, market.qty_precision),
+                     "maxQty": "1000000", "stepSize": fmt(market.step_size, market.qty_precision)},
+                    {"filterType": "MARKET_LOT_SIZE", "minQty": fmt(market.step_size, market.qty_precision),
+                     "maxQty": "1000000", "stepSize": fmt(market.step_size, market.qty_precision)},
+                    {"filterType": "MIN_NOTIONAL", "notional": str(min_notional)},
+                ],
+                "orderTypes": ["LIMIT", "MARKET"],
+                "timeInForce": ["GTC", "IOC", "FOK", "GTX"],
+            })
+        return {"timezone": "UTC", "serverTime": now_ms(), "rateLimits": [], "assets": [{"asset": "USDT", "marginAvailable": True}],
+                "symbols": symbols}
+
+    def book_ticker(self, symbol: str = None):
+        if symbol is None:
+            return [self.book_ticker(market.symbol) for market in self.markets.values()]
+        market = self.market(symbol)
+        bid, ask = market.top()
+        return {"symbol": symbol, "bidPrice": fmt(bid, market.price_precision), "bidQty": "1000",
+                "askPrice": fmt(ask, market.price_precision), "askQty": "1000", "time": now_ms()}
+
+    def premium_index(self, symbol: str = None):
+        items = self.mark_price_event()
+        result = [{"symbol": item["s"], "markPrice": item["p"], "indexPrice": item["i"], "estimatedSettlePrice": item["P"],
+                   "lastFundingRate": item["r"], "interestRate": "0.00010000", "nextFundingTime": item["T"],
+                   "time": item["E"]} for item in items]
+        if symbol is None:
+            return result
+        self.market(symbol)
+        return next(item for item in result if item["symbol"] == symbol)
+
+    # ---- 下单与撮合 ----
+
+    def validate(self, account: Account, market: Market, order: dict):
+        qty = order["orig_qty"]
+        steps = qty / market.step_size
+        if qty <= 0 or abs(steps - round(steps)) > 1e-6:
+            raise ExchangeError(-1111, "Precision is over the maximum defined for this asset.")
+        if order["type"] == "LIMIT":
+            ticks = order["price_value"] / market.tick_size
+            if order["price_value"] <= 0 or abs(ticks - round(ticks)) > 1e-6:
+                raise ExchangeError(-4014, "Price not increased by tick size.")
+        if order["reduce_only"]:
+            return
+        price = order["price_value"] if order["type"] == "LIMIT" else market.mark_price
+        notional = price * qty
+        if notional < min_notional:
+            raise ExchangeError(-4164, f"Order's notional must be no smaller than {min_notional} (unless you choose reduce only).")
+        if notional / account.leverage.get(market.symbol, 20) > self.available_balance(account):
+            raise ExchangeError(-2019, "Margin is insufficient.")
+
+    def new_order(self, account: Account, params: dict) -> dict:
+        symbol = params.get("symbol")
+        market = self.market(symbol)
+        side = params.get("side")
+        order_type = params.get("type")
+        if side not in ("BUY", "SELL"):
+            raise ExchangeError(-1117, "Invalid side.")
+        if order_type not in ("LIMIT", "MARKET"):
+            raise ExchangeError(-1116, "Invalid orderType.")
+        if "quantity" not in params:
+            raise ExchangeError(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        if order_type == "LIMIT" and "price" not in params:
+            raise ExchangeError(-1102, "Mandatory parameter 'price' was not sent, was empty/null, or malformed.")
+        now = now_ms()
+        order = {
+            "orderId": self.next_order_id,
+            "symbol": symbol,
+            "side": side,
+            "type": order_type,
+            "timeInForce": params.get("timeInForce", "GTC") if order_type == "LIMIT" else "GTC",
+            "clientOrderId": params.get("newClientOrderId") or secrets.token_hex(11),
+            "orig_qty": float(params["quantity"]),
+            "price_value": float(params.get("price", 0)),
+            "reduce_only": str(params.get("reduceOnly", "false")).lower() == "true",
+            "executed": 0.0,
+            "cum_quote": 0.0,
+            "status": "NEW",
+            "account": account.key,
+            "time": now,
+            "update_time": now,
+        }
+        self.validate(account, market, order)
+        if order["reduce_only"]:
+            position = account.position(symbol)["amt"]
+            reducible = -position if side == "BUY" else position
+            if reducible <= 0:
+                raise ExchangeError(-2022, "ReduceOnly Order is rejected.")
+            order["orig_qty"] = min(order["orig_qty"], round(reducible, market.qty_precision))
+        self.next_order_id += 1
+        order["remaining"] = order["orig_qty"]
+        self.push_order(account, order, "NEW")
+        self.match(market, order)
+        if order["remaining"] > 1e-12:
+            if order_type == "LIMIT" and order["timeInForce"] == "GTC":
+                account.orders[order["orderId"]] = order
+                market.book.add(order)
+            else:
+                order["status"] = "EXPIRED"
+                self.push_order(account, order, "EXPIRED")
+        return self.order_view(order)
+
+    def match(self, market: Market, order: dict):
+        limit = order["price_value"] if order["type"] == "LIMIT" else None
+        for resting in market.book.crossing(order["side"], limit):
+            if order["remaining"] <= 1e-12:
+                return
+            # 每次至少有一方完全成交：挂单成交完会出簿，否则本单已成交完
+            qty = min(order["remaining"], resting["remaining"])
+            price = resting["price_value"]
+            self.fill(market, resting, price, qty, maker=True)
+            self.fill(market, order, price, qty, maker=False)
+        if order["remaining"] <= 1e-12:
+            return
+        # 账户挂单吃完后与外部报价成交
+        external = market.ask if order["side"] == "BUY" else market.bid
+        if limit is None or (order["side"] == "BUY" and limit >= external) or (order["side"] == "SELL" and limit <= external):
+            self.fill(market, order, external, order["remaining"], maker=False)
+
+    def fill(self, market: Market, order: dict, price: float, qty: float, maker: bool):
+        account = self.accounts[order["account"]]
+        now = now_ms()
+        order["remaining"] = round(order["remaining"] - qty, market.qty_precision + 4)
+        order["executed"] += qty
+        order["cum_quote"] += price * qty
+        order["update_time"] = now
+        order["status"] = "FILLED" if order["remaining"] <= 1e-12 else "PARTIALLY_FILLED"
+        if order["status"] == "FILLED" and order["orderId"] in account.orders:
+            del account.orders[order["orderId"]]
+            market.book.remove(order)
+
+        position = account.position(market.symbol)
+        signed_qty = qty if order["side"] == "BUY" else -qty
+        realized = 0.0
+        amt, entry = position["amt"], position["entry"]
+        if amt == 0 or (amt > 0) == (signed_qty > 0):
+            position["entry"] = (abs(amt) * entry + qty * price) / (abs(amt) + qty)
+            position["amt"] = amt + signed_qty
+        else:
+            closed = min(abs(amt), qty)
+            realized = closed * (price - entry) * (1 if amt > 0 else -1)
+            position["amt"] = amt + signed_qty
+            if abs(position["amt"]) < 1e-12:
+                position["amt"] = 0.0
+                position["entry"] = 0.0
+            elif (position["amt"] > 0) != (amt > 0):
+                # 反手，剩余部分以成交价开仓
+                position["entry"] = price
+        position["amt"] = round(position["amt"], market.qty_precision + 4)
+        position["updated_at"] = now
+
+        commission = price * qty * (maker_fee_rate if maker else taker_fee_rate)
+        account.wallet += realized - commission
+        account.updated_at = now
+        trade_id = self.next_trade_id
+        self.next_trade_id += 1
+        account.trades.append({
+            "buyer": order["side"] == "BUY",
+            "commission": fmt(-commission),
+            "commissionAsset": "USDT",
+            "id": trade_id,
+            "maker": maker,
+            "orderId": order["orderId"],
+            "price": fmt(price, market.price_precision),
+            "qty": fmt(qty, market.qty_precision),
+            "quoteQty": fmt(price * qty),
+            "realizedPnl": fmt(realized),
+            "side": order["side"],
+            "positionSide": "BOTH",
+            "symbol": market.symbol,
+            "time": now,
+        })
+        self.add_income(account, market.symbol, "COMMISSION", -commission, now, trade_id)
+        if realized:
+            self.add_income(account, market.symbol, "REALIZED_PNL", realized, now, trade_id)
+        self.push_order(account, order, "TRADE", price, qty, commission, maker, realized)
+        self.push_account(account, market.symbol)
+
+    def add_income(self, account: Account, symbol: str, income_type: str, income: float, now: int, trade_id: int):
+        account.income.append({
+            "symbol": symbol,
+            "incomeType": income_type,
+            "income": fmt(income),
+            "asset": "USDT",
+            "info": income_type,
+            "time": now,
+            "tranId": self.next_tran_id,
+            "tradeId": str(trade_id),
+        })
+        self.next_tran_id += 1
+
+    def cancel(self, account: Account, order: dict) -> dict:
+        market = self.markets[order["symbol"]]
+        market.book.remove(order)
+        account.orders.pop(order["orderId"], None)
+        order["status"] = "CANCELED"
+        order["update_time"] = now_ms()
+        self.push_order(account, order, "CANCELED")
+        return self.order_view(order)
+
+    def cancel_order(self, account: Account, params: dict) -> dict:
+        self.market(params.get("symbol"))
+        order = None
+        if "orderId" in params:
+            order = account.orders.get(int(params["orderId"]))
+        elif "origClientOrderId" in params:
+            order = next((o for o in account.orders.values() if o["clientOrderId"] == params["origClientOrderId"]), None)
+        if order is None or order["symbol"] != params.get("symbol"):
+            raise ExchangeError(-2011, "Unknown order sent.")
+        return self.cancel(account, order)
+
+    def cancel_all(self, account: Account, symbol: str) -> dict:
+        self.market(symbol)
+        for order in [o for o in account.orders.values() if o["symbol"] == symbol]:
+            self.cancel(account, order)
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def open_orders(self, account: Account, symbol: str = None) -> list:
+        return [self.order_view(order) for order in account.orders.values() if symbol is None or order["symbol"] == symbol]
+
+    def order_view(self, order: dict) -> dict:
+        market = self.markets[order["symbol"]]
+        avg = order["cum_quote"] / order["executed"] if order["executed"] else 0
+        return {
+            "orderId": order["orderId"],
+            "symbol": order["symbol"],
+            "status": order["status"],
+            "clientOrderId": order["clientOrderId"],
+            "price": fmt(order["price_value"], market.price_precision),
+            "avgPrice": fmt(avg, market.price_precision),
+            "origQty": fmt(order["orig_qty"], market.qty_precision),
+            "executedQty": fmt(order["executed"], market.qty_precision),
+            "cumQty": fmt(order["executed"], market.qty_precision),
+            "cumQuote": fmt(order["cum_quote"]),
+            "timeInForce": order["timeInForce"],
+            "type": order["type"],
+            "reduceOnly": order["reduce_only"],
+            "closePosition": False,
+            "side": order["side"],
+            "positionSide": "BOTH",
+            "stopPrice": "0",
+            "workingType": "CONTRACT_PRICE",
+            "priceProtect": False,
+            "origType": order["type"],
+            "time": order["time"],
+            "updateTime": order["update_time"],
+        }
+
+    # ---- 账户查询 ----
+
+    def unrealized(self, account: Account) -> float:
+        return sum(p["amt"] * (self.markets[s].mark_price - p["entry"]) for s, p in account.positions.items() if p["amt"])
+
+    def available_balance(self, account: Account) -> float:
+        used = 0.0
+        for symbol, position in account.positions.items():
+            used += abs(position["amt"]) * self.markets[symbol].mark_price / account.leverage.get(symbol, 20)
+        for order in account.orders.values():
+            used += order["remaining"] * order["price_value"] / account.leverage.get(order["symbol"], 20)
+        return account.wallet + self.unrealized(account) - used
+
+    def position_risk(self, account: Account, symbol: str = None) -> list:
+        result = []
+        for market in self.markets.values():
+            if symbol is not None and market.symbol != symbol:
+                continue
+            position = account.positions.get(market.symbol, {"amt": 0.0, "entry": 0.0, "updated_at": 0})
+            amt = position["amt"]
+            result.append({
+                "symbol": market.symbol,
+                "positionAmt": fmt(amt, market.qty_precision),
+                "entryPrice": fmt(position["entry"], market.price_precision + 2),
+                "markPrice": fmt(market.mark_price, market.price_precision + 2),
+                "unRealizedProfit": fmt(amt * (market.mark_price - position["entry"]) if amt else 0),
+                "liquidationPrice": "0",
+                "leverage": str(account.leverage.get(market.symbol, 20)),
+                "maxNotionalValue": "1000000",
+                "marginType": "cross",
+                "isolatedMargin": "0.00000000",
+                "isAutoAddMargin": "false",
+                "positionSide": "BOTH",
+                "notional": fmt(amt * market.mark_price),
+                "isolatedWallet": "0",
+                "updateTime": position["updated_at"],
+            })
+        return result
+
+    def balance(self, account: Account) -> list:
+        unrealized = self.unrealized(account)
+        return [{
+            "accountAlias": "sim",
+            "asset": "USDT",
+            "balance": fmt(account.wallet),
+            "crossWalletBalance": fmt(account.wallet),
+            "crossUnPnl": fmt(unrealized),
+            "availableBalance": fmt(self.available_balance(account)),
+            "maxWithdrawAmount": fmt(self.available_balance(account)),
+            "marginAvailable": True,
+            "updateTime": account.updated_at,
+        }]
+
+    def account_info(self, account: Account) -> dict:
+        unrealized = self.unrealized(account)
+        available = self.available_balance(account)
+        margin_balance = account.wallet + unrealized
+        positions = []
+        for item in self.position_risk(account):
+            positions.append({
+                "symbol": item["symbol"],
+                "initialMargin": "0",
+                "maintMargin": "0",
+                "unrealizedProfit": item["unRealizedProfit"],
+                "positionInitialMargin": "0",
+                "openOrderInitialMargin": "0",
+                "leverage": item["leverage"],
+                "isolated": False,
+                "entryPrice": item["entryPrice"],
+                "maxNotional": item["maxNotionalValue"],
+                "positionSide": "BOTH",
+                "positionAmt": item["positionAmt"],
+                "notional": item["notional"] if float(item["positionAmt"]) else "0",
+                "updateTime": item["updateTime"],
+            })
+        return {
+            "feeTier": 0,
+            "canTrade": True,
+            "canDeposit": True,
+            "canWithdraw": True,
+            "updateTime": 0,
+            "multiAssetsMargin": account.multi_assets,
+            "totalInitialMargin": "0.00000000",
+            "totalMaintMargin": "0.00000000",
+            "totalWalletBalance": fmt(account.wallet),
+            "totalUnrealizedProfit": fmt(unrealized),
+            "totalMarginBalance": fmt(margin_balance),
+            "totalPositionInitialMargin": "0.00000000",
+            "totalOpenOrderInitialMargin": "0.00000000",
+            "totalCrossWalletBalance": fmt(account.wallet),
+            "totalCrossUnPnl": fmt(unrealized),
+            "availableBalance": fmt(available),
+            "maxWithdrawAmount": fmt(available),
+            "assets": [{
+                "asset": "USDT",
+                "walletBalance": fmt(account.wallet),
+                "unrealizedProfit": fmt(unrealized),
+                "marginBalance": fmt(margin_balance),
+                "maintMargin": "0.00000000",
+                "initialMargin": "0.00000000",
+                "positionInitialMargin": "0.00000000",
+                "openOrderInitialMargin": "0.00000000",
+                "crossWalletBalance": fmt(account.wallet),
+                "crossUnPnl": fmt(unrealized),
+                "availableBalance": fmt(available),
+                "maxWithdrawAmount": fmt(available),
+                "marginAvailable": True,
+                "updateTime": account.updated_at,
+            }],
+            "positions": positions,
+        }
+
+    def income_history(self, account: Account, params: dict) -> list:
+        start = int(params.get("startTime", 0))
+        end = int(params.get("endTime", now_ms()))
+        limit = min(int(params.get("limit", 100)), 1000)
+        income_type = params.get("incomeType")
+        symbol = params.get("symbol")
+        # 按时间升序存放，二分定位起点
+        index = bisect.bisect_left(account.income, start, key=lambda item: item["time"])
+        result = []
+        for item in account.income[index:]:
+            if item["time"] > end or len(result) >= limit:
+                break
+            if income_type and item["incomeType"] != income_type:
+                continue
+            if symbol and item["symbol"] != symbol:
+                continue
+            result.append(item)
+        return result
+
+    def account_trades(self, account: Account, params: dict) -> list:
+        symbol = params.get("symbol")
+        self.market(symbol)
+        start = int(params.get("startTime", 0))
+        end = int(params.get("endTime", now_ms()))
+        from_id = int(params.get("fromId", 0))
+        limit = min(int(params.get("limit", 500)), 1000)
+        result = []
+        for trade in account.trades:
+            if trade["symbol"] != symbol or trade["id"] < from_id or not start <= trade["time"] <= end:
+                continue
+            result.append(trade)
+            if len(result) >= limit:
+                break
+        return result
+
+    def change_leverage(self, account: Account, params: dict) -> dict:
+        symbol = params.get("symbol")
+        self.market(symbol)
+        leverage = int(params.get("leverage", 0))
+        if not 1 <= leverage <= 125:
+            raise ExchangeError(-4028, "Leverage is not valid.")
+        account.leverage[symbol] = leverage
+        return {"leverage": leverage, "maxNotionalValue": "1000000", "symbol": symbol}
+
+    def change_multi_asset_mode(self, account: Account, params: dict) -> dict:
+        enabled = str(params.get("multiAssetsMargin", "false")).lower() == "true"
+        if enabled == account.multi_assets:
+            raise ExchangeError(-4171, "Adjusted Multi-Assets mode is same as current.")
+        account.multi_assets = enabled
+        return {"code": 200, "msg": "success"}
+
+    # ---- listenKey 与账户推送 ----
+
+    def new_listen_key(self, account: Account) -> dict:
+        for listen_key, key in self.listen_keys.items():
+            if key == account.key:
+                return {"listenKey": listen_key}
+        listen_key = secrets.token_hex(32)
+        self.listen_keys[listen_key] = account.key
+        return {"listenKey": listen_key}
+
+    def close_listen_key(self, account: Account, listen_key: str):
+        if self.listen_keys.get(listen_key) == account.key:
+            del self.listen_keys[listen_key]
+        return {}
+
+    def push_order(self, account: Account, order: dict, execution: str, price: float = 0, qty: float = 0,
+                   commission: float = 0, maker: bool = False, realized: float = 0):
+        if self.on_user_event is None:
+            return
+        market = self.markets[order["symbol"]]
+        now = now_ms()
+        avg = order["cum_quote"] / order["executed"] if order["executed"] else 0
+        self.on_user_event(account.key, {
+            "e": "ORDER_TRADE_UPDATE",
+            "E": now,
+            "T": now,
+            "o": {
+                "s": order["symbol"],
+                "c": order["clientOrderId"],
+                "S": order["side"],
+                "o": order["type"],
+                "f": order["timeInForce"],
+                "q": fmt(order["orig_qty"], market.qty_precision),
+                "p": fmt(order["price_value"], market.price_precision),
+                "ap": fmt(avg, market.price_precision),
+                "sp": "0",
+                "x": execution,
+                "X": order["status"],
+                "i": order["orderId"],
+                "l": fmt(qty, market.qty_precision),
+                "z": fmt(order["executed"], market.qty_precision),
+                "L": fmt(price, market.price_precision),
+                "N": "USDT",
+                "n": fmt(commission),
+                "T": order["update_time"],
+                "t": self.next_trade_id - 1 if execution == "TRADE" else 0,
+                "m": maker,
+                "R": order["reduce_only"],
+                "ps": "BOTH",
+                "rp": fmt(realized),
+            },
+        })
+
+    def push_account(self, account: Account, symbol: str):
+        if self.on_user_event is None:
+            return
+        market = self.markets[symbol]
+        position = account.position(symbol)
+        now = now_ms()
+        self.on_user_event(account.key, {
+            "e": "ACCOUNT_UPDATE",
+            "E": now,
+            "T": now,
+            "a": {
+                "m": "ORDER",
+                "B": [{"a": "USDT", "wb": fmt(account.wallet), "cw": fmt(account.wallet), "bc": "0"}],
+                "P": [{
+                    "s": symbol,
+                    "pa": fmt(position["amt"], market.qty_precision),
+                    "ep": fmt(position["entry"], market.price_precision + 2),
+                    "cr": "0",
+                    "up": fmt(position["amt"] * (market.mark_price - position["entry"]) if position["amt"] else 0),
+                    "mt": "cross",
+                    "iw": "0",
+                    "ps": "BOTH",
+                }],
+            },
+        })
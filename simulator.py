@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl
+
+import yaml
+from aiohttp import WSMsgType, web
+
+from rate_limiter import endpoint_weight
+from sim_engine import Exchange, ExchangeError
+
+# 本地 fapi 模拟服务：HTTP 接口与行情/账户推送共用一个端口，
+# 把配置里的 base_url / stream_url 指向这里即可离线压测 main.py
+
+routes = {
+    # (method, path) -> (handler 名, 是否需要签名)
+    ("GET", "/fapi/v1/ping"): ("ping", False),
+    ("GET", "/fapi/v1/time"): ("server_time", False),
+    ("GET", "/fapi/v1/exchangeInfo"): ("exchange_info", False),
+    ("GET", "/fapi/v1/ticker/bookTicker"): ("book_ticker", False),
+    ("GET", "/fapi/v1/premiumIndex"): ("premium_index", False),
+    ("POST", "/fapi/v1/order"): ("new_order", True),
+    ("DELETE", "/fapi/v1/order"): ("cancel_order", True),
+    ("POST", "/fapi/v1/batchOrders"): ("batch_orders", True),
+    ("GET", "/fapi/v1/openOrders"): ("open_orders", True),
+    ("DELETE", "/fapi/v1/allOpenOrders"): ("cancel_open_orders", True),
+    ("GET", "/fapi/v2/positionRisk"): ("position_risk", True),
+    ("GET", "/fapi/v2/account"): ("account", True),
+    ("GET", "/fapi/v2/balance"): ("balance", True),
+    ("GET", "/fapi/v1/income"): ("income", True),
+    ("POST", "/fapi/v1/leverage"): ("leverage", True),
+    ("POST", "/fapi/v1/multiAssetsMargin"): ("multi_assets_margin", True),
+    ("GET", "/fapi/v1/userTrades"): ("user_trades", True),
+    ("POST", "/fapi/v1/listenKey"): ("new_listen_key", False),
+    ("PUT", "/fapi/v1/listenKey"): ("renew_listen_key", False),
+    ("DELETE", "/fapi/v1/listenKey"): ("close_listen_key", False),
+}
+
+public = {"ping", "server_time", "exchange_info", "book_ticker", "premium_index"}
+
+
+class Simulator:
+    def __init__(self, exchange: Exchange, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 ban_rate: float = 0, weight_limit: int = 2400, tick_interval: float = 0.2):
+        self.exchange = exchange
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.ban_rate = ban_rate
+        self.weight_limit = weight_limit
+        self.tick_interval = tick_interval
+        # 每个来源地址最近一分钟的 (时间, 权重)
+        self.weights = defaultdict(deque)
+        # 订阅名 -> 连接；连接 -> 发送队列
+        self.subscribers = defaultdict(set)
+        self.queues = {}
+        self.combined = {}
+        exchange.on_user_event = self.publish_user_event
+        exchange.on_market_event = self.publish
+
+    # ---- HTTP ----
+
+    def used_weight(self, remote: str, weight: int) -> int:
+        now = time.time()
+        window = self.weights[remote]
+        window.append((now, weight))
+        while window and window[0][0] < now - 60:
+            window.popleft()
+        return sum(item[1] for item in window)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        route = routes.get((request.method, request.path))
+        if route is None:
+            return error_response(404, -1000, f"Unknown endpoint {request.method} {request.path}")
+        name, signed = route
+        used = self.used_weight(request.remote or "", endpoint_weight(request.method, str(request.rel_url)))
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if used > self.weight_limit or random.random() < self.ban_rate:
+            headers["Retry-After"] = "5"
+            return error_response(429, -1003, "Too many requests; please use the websocket for live updates.", headers)
+        if random.random() < self.error_rate:
+            return error_response(503, -1001, "Internal error; unable to process your request. Please try again.", headers)
+        query = request.rel_url.raw_query_string
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        if request.method in ("POST", "PUT", "DELETE") and request.can_read_body:
+            body = await request.text()
+            if body:
+                params.update(parse_qsl(body, keep_blank_values=True))
+                query = f"{query}&{body}" if query else body
+        try:
+            account = None
+            if name not in public:
+                account = self.exchange.authenticate(request.headers.get("X-MBX-APIKEY", ""), query, params, signed)
+            result = getattr(self, f"on_{name}")(account, params)
+        except ExchangeError as e:
+            return error_response(e.status, e.code, e.msg, headers)
+        except (KeyError, ValueError, TypeError) as e:
+            return error_response(400, -1102, f"Mandatory parameter was not sent, was empty/null, or malformed: {e}", headers)
+        return web.json_response(result, headers=headers, dumps=compact_dumps)
+
+    def on_ping(self, account, params):
+        return {}
+
+    def on_server_time(self, account, params):
+        return {"serverTime": int(time.time() * 1000)}
+
+    def on_exchange_info(self, account, params):
+        return self.exchange.exchange_info()
+
+    def on_book_ticker(self, account, params):
+        return self.exchange.book_ticker(params.get("symbol"))
+
+    def on_premium_index(self, account, params):
+        return self.exchange.premium_index(params.get("symbol"))
+
+    def on_new_order(self, account, params):
+        return self.exchange.new_order(account, params)
+
+    def on_cancel_order(self, account, params):
+        return self.exchange.cancel_order(account, params)
+
+    def on_batch_orders(self, account, params):
+        orders = json.loads(params["batchOrders"])
+        if len(orders) > 5:
+            raise ExchangeError(-1130, "Data sent for parameter 'batchOrders' is not valid.")
+        results = []
+        for order in orders:
+            try:
+                results.append(self.exchange.new_order(account, order))
+            except ExchangeError as e:
+                results.append({"code": e.code, "msg": e.msg})
+        return results
+
+    def on_open_orders(self, account, params):
+        return self.exchange.open_orders(account, params.get("symbol"))
+
+    def on_cancel_open_orders(self, account, params):
+        return self.exchange.cancel_all(account, params["symbol"])
+
+    def on_position_risk(self, account, params):
+        return self.exchange.position_risk(account, params.get("symbol"))
+
+    def on_account(self, account, params):
+        return self.exchange.account_info(account)
+
+    def on_balance(self, account, params):
+        return self.exchange.balance(account)
+
+    def on_income(self, account, params):
+        return self.exchange.income_history(account, params)
+
+    def on_leverage(self, account, params):
+        return self.exchange.change_leverage(account, params)
+
+    def on_multi_assets_margin(self, account, params):
+        return self.exchange.change_multi_asset_mode(account, params)
+
+    def on_user_trades(self, account, params):
+        return self.exchange.account_trades(account, params)
+
+    def on_new_listen_key(self, account, params):
+        return self.exchange.new_listen_key(account)
+
+    def on_renew_listen_key(self, account, params):
+        return {}
+
+    def on_close_listen_key(self, account, params):
+        return self.exchange.close_listen_key(account, params.get("listenKey", ""))
+
+    # ---- websocket ----
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=60)
+        await ws.prepare(request)
+        # /ws/<name>、/stream?streams=a/b 直接订阅；/ws、/stream 连上后发 SUBSCRIBE
+        self.combined[ws] = request.path.startswith("/stream")
+        self.queues[ws] = asyncio.Queue(maxsize=1000)
+        names = request.match_info.get("streams") or request.query.get("streams", "")
+        for name in filter(None, names.split("/")):
+            self.subscribers[name].add(ws)
+        writer = asyncio.ensure_future(self.write_ws(ws))
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    command = json.loads(message.data)
+                except ValueError:
+                    continue
+                method = command.get("method")
+                for name in command.get("params", []):
+                    if method == "SUBSCRIBE":
+                        self.subscribers[name].add(ws)
+                    elif method == "UNSUBSCRIBE":
+                        self.subscribers[name].discard(ws)
+                await ws.send_str(json.dumps({"result": None, "id": command.get("id")}))
+        finally:
+            writer.cancel()
+            for connections in self.subscribers.values():
+                connections.discard(ws)
+            self.queues.pop(ws, None)
+            self.combined.pop(ws, None)
+        return ws
+
+    async def write_ws(self, ws: web.WebSocketResponse):
+        queue = self.queues[ws]
+        while not ws.closed:
+            await ws.send_str(await queue.get())
+
+    def publish(self, name: str, payload):
+        connections = self.subscribers.get(name)
+        if not connections:
+            return
+        raw = compact_dumps(payload)
+        wrapped = None
+        for ws in list(connections):
+            queue = self.queues.get(ws)
+            if queue is None:
+                continue
+            if self.combined.get(ws):
+                if wrapped is None:
+                    wrapped = compact_dumps({"stream": name, "data": payload})
+                message = wrapped
+            else:
+                message = raw
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 消费太慢的连接丢推送，客户端靠 REST 对账补齐
+                pass
+
+    def publish_user_event(self, key: str, event: dict):
+        for listen_key, owner in list(self.exchange.listen_keys.items()):
+            if owner == key:
+                self.publish(listen_key, event)
+
+    async def tick_forever(self):
+        last_mark = 0
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self.exchange.tick()
+            now = time.time()
+            if now - last_mark >= 1:
+                last_mark = now
+                self.publish("!markPrice@arr@1s", self.exchange.mark_price_event())
+                self.publish("!markPrice@arr", self.exchange.mark_price_event())
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_get("/ws/{streams:.*}", self.handle_ws)
+        app.router.add_get("/stream", self.handle_ws)
+        app.router.add_route("*", "/fapi/{tail:.*}", self.handle)
+
+        async def start_ticker(app):
+            app["ticker"] = asyncio.ensure_future(self.tick_forever())
+
+        async def stop_ticker(app):
+            app["ticker"].cancel()
+
+        app.on_startup.append(start_ticker)
+        app.on_cleanup.append(stop_ticker)
+        return app
+
+
+def compact_dumps(payload) -> str:
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def error_response(status: int, code: int, msg: str, headers: dict = None) -> web.Response:
+    return web.json_response({"code": code, "msg": msg}, status=status, headers=headers, dumps=compact_dumps)
+
+
+def generate_config(count: int, host: str, port: int, path: str):
+    # 生成一份直接可用的 config：账户 key/secret 与模拟服务一致，地址指向本地
+    config = {
+        "hedge_mode": False,
+        "dry_run": False,
+        "engine": "async" if count > 50 else "thread",
+        "base_url": f"http://{host}:{port}",
+        "stream_url": f"ws://{host}:{port}",
+        "accounts": [
+            {"name": f"sim{i:05d}", "key": f"simkey{i:05d}", "secret": f"simsecret{i:05d}", "proxy": "", "cost_per_day": 1}
+            for i in range(count)
+        ],
+    }
+    with open(path, "w") as f:
+        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地模拟交易所")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="生成指向模拟服务的配置文件")
+    generate.add_argument("--accounts", type=int, default=10)
+    generate.add_argument("--output", default="config_sim.yaml")
+    serve = commands.add_parser("serve", help="启动模拟服务")
+    serve.add_argument("--config", default="config_sim.yaml", help="从配置里读取账户的 key/secret")
+    serve.add_argument("--balance", type=float, default=10000, help="每个账户的初始 USDT")
+    serve.add_argument("--latency-ms", type=float, default=0)
+    serve.add_argument("--jitter-ms", type=float, default=0)
+    serve.add_argument("--error-rate", type=float, default=0, help="返回 503 的比例")
+    serve.add_argument("--ban-rate", type=float, default=0, help="返回 429 的比例")
+    serve.add_argument("--weight-limit", type=int, default=2400, help="每个来源地址每分钟的权重上限")
+    for sub in (generate, serve):
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=8800)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "generate":
+        generate_config(args.accounts, args.host, args.port, args.output)
+        print(f"wrote {args.accounts} accounts to {args.output}")
+        return 0
+    with open(args.config, "r") as f:
+        accounts = yaml.safe_load(f)["accounts"]
+    exchange = Exchange()
+    for account in accounts:
+        exchange.add_account(account["key"], account["secret"], args.balance)
+    simulator = Simulator(exchange, args.latency_ms, args.jitter_ms, args.error_rate, args.ban_rate, args.weight_limit)
+    print(f"simulating {len(accounts)} accounts on http://{args.host}:{args.port}")
+    web.run_app(simulator.build_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import bootstrap
+import metrics
+from workers import plan_workers
+
+logger = logging.getLogger("aster")
+
+# 多进程模式：supervisor 不交易，只负责按代理把账户分到 N 个 main.py --shard i/N 子进程，
+# 子进程挂掉或卡死时单独重启，其它分片不受影响
+status_file = os.path.join("data", "supervisor.json")
+main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+check_interval = 5
+# 子进程的 metrics socket 这么久没有应答视为卡死，杀掉重启
+hang_timeout = 120
+# 连续快速退出时逐级拉长重启间隔，运行超过 stable_after 秒后清零
+restart_backoff = (1, 2, 5, 10, 30, 60)
+stable_after = 60
+stop_timeout = 30
+
+metrics.help_texts.update({
+    "aster_shard_up": "Whether the shard process is running and answering",
+    "aster_shard_restarts_total": "Shard process restarts",
+    "aster_shard_accounts": "Accounts assigned to the shard",
+})
+
+
+def assign_proxies(groups: list, count: int, previous: dict = None) -> dict:
+    # 按代理分片：同一代理的账户总在同一个进程，共用连接池和限速额度。
+    # 已经分过的代理留在原分片（配置重载时不会把整组账户搬到别的进程，新旧两个进程同时撤单平仓）；
+    # 新代理按账户数从多到少，每次分给当前账户最少的分片。同样的 previous 和配置在 supervisor 和各子进程里算出的结果一致
+    sizes = {}
+    for group in groups:
+        proxy = group[0].get("proxy", "")
+        sizes[proxy] = sizes.get(proxy, 0) + len(group)
+    loads = [0] * count
+    assignment = {}
+    for proxy, index in (previous or {}).items():
+        if proxy in sizes and 0 <= index < count:
+            assignment[proxy] = index
+            loads[index] += sizes[proxy]
+    for proxy, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        if proxy in assignment:
+            continue
+        index = loads.index(min(loads))
+        assignment[proxy] = index
+        loads[index] += size
+    return assignment
+
+
+def load_assignment(count: int) -> dict:
+    # supervisor 落盘的代理 -> 分片表；分片数变了就作废重新分
+    try:
+        with open(status_file, "r") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if status.get("count") != count:
+        return {}
+    return status.get("assignment") or {}
+
+
+def shard_accounts(config: dict, count: int, index: int, previous: dict = None) -> list:
+    # 先按原来的规则分组（对冲模式两两成组）再分片，对冲模式下每个分片的账户数是偶数，分片内的调度器总能配成对。
+    # 子进程不传 previous，读 supervisor 刚写下的分片表，和 supervisor 的结果一致
+    groups = list(plan_workers(config.get("accounts") or [], config.get("hedge_mode", False)).values())
+    assignment = assign_proxies(groups, count, load_assignment(count) if previous is None else previous)
+    return [account for group in groups if assignment[group[0].get("proxy", "")] == index for account in group]
+
+
+def parse_shard(text: str):
+    index, count = text.split("/")
+    return int(index), int(count)
+
+
+def shard_path(path: str, index: int) -> str:
+    # 每个分片各用一份 socket / 状态文件：data/metrics.sock -> data/metrics-0.sock
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index}{ext}"
+
+
+class Shard:
+    def __init__(self, index: int, count: int, socket_path: str):
+        self.index = index
+        self.count = count
+        self.socket_path = shard_path(socket_path, index)
+        self.process = None
+        self.accounts = 0
+        self.started_at = 0
+        self.last_ok = 0
+        self.restarts = 0
+        self.failures = 0
+        self.next_start = 0
+        self.last_exit = None
+
+    def start(self):
+        env = dict(os.environ)
+        # 日志按分片分目录，避免多个进程同时滚动同一个文件
+        env["ASTER_LOG_DIR"] = os.path.join(bootstrap.log_dir, f"shard-{self.index}")
+        env["ASTER_CONFIG"] = bootstrap.config_path
+        self.process = subprocess.Popen([sys.executable, main_script, "--shard", f"{self.index}/{self.count}"], env=env)
+        self.started_at = time.time()
+        self.last_ok = self.started_at
+        logger.info(f"shard {self.index}/{self.count} started pid {self.process.pid}, {self.accounts} accounts")
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def supervise(self, now: float):
+        # 每个节拍都检查：退出的进程按退避时间重启
+        if self.process is None:
+            if self.accounts and now >= self.next_start:
+                self.start()
+            return
+        code = self.process.poll()
+        if code is not None:
+            self.on_exit(code, now)
+
+    def probe(self, now: float):
+        # 子进程只要 metrics socket 还能应答就算活着；只卡住某个账户线程不会被误杀
+        if not self.running():
+            return
+        try:
+            metrics.fetch(self.socket_path)
+            self.last_ok = now
+        except OSError:
+            if now - self.last_ok > hang_timeout:
+                logger.error(f"shard {self.index} pid {self.process.pid} not answering for {now - self.last_ok:.0f}s, killing")
+                self.process.kill()
+
+    def on_exit(self, code: int, now: float):
+        uptime = now - self.started_at
+        self.failures = 1 if uptime > stable_after else self.failures + 1
+        delay = restart_backoff[min(self.failures, len(restart_backoff)) - 1]
+        logger.error(f"shard {self.index} pid {self.process.pid} exited with {code} after {uptime:.0f}s, restart in {delay}s")
+        metrics.registry.inc("aster_shard_restarts_total", (("shard", str(self.index)),))
+        self.last_exit = {"code": code, "time": now, "uptime": round(uptime, 1)}
+        self.process = None
+        self.restarts += 1
+        self.next_start = now + delay
+
+    def stop(self):
+        if self.running():
+            self.process.terminate()
+
+    def status(self, now: float) -> dict:
+        return {
+            "shard": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "running": self.running(),
+            "alive": self.running() and now - self.last_ok <= check_interval * 2,
+            "accounts": self.accounts,
+            "started_at": self.started_at,
+            "last_ok": self.last_ok,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+        }
+
+
+def relabel(text: str, label: str) -> list:
+    # 给子进程的每条样本加上 shard 标签，返回 [(指标名, 类型, HELP 行, [样本行])]
+    families = []
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            families.append([line.split(" ", 3)[2], "untyped", line, []])
+        elif line.startswith("# TYPE "):
+            families[-1][1] = line.split(" ", 3)[3]
+        elif line and not line.startswith("#") and families:
+            brace = line.find("{")
+            space = line.find(" ")
+            if brace != -1 and brace < space:
+                line = f"{line[:brace + 1]}{label},{line[brace + 1:]}"
+            else:
+                line = f"{line[:space]}{{{label}}}{line[space:]}"
+            families[-1][3].append(line)
+    return families
+
+
+def merge_metrics(texts: list) -> str:
+    # 同名指标的样本要放在同一组 HELP/TYPE 下面
+    merged = {}
+    for index, text in texts:
+        for name, kind, help_line, samples in relabel(text, f'shard="{index}"'):
+            family = merged.setdefault(name, (kind, help_line, []))
+            family[2].extend(samples)
+    lines = []
+    for name, (kind, help_line, samples) in merged.items():
+        lines.append(help_line)
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class Supervisor:
+    def __init__(self, config: dict, count: int):
+        self.count = count
+        self.socket_path = config.get("metrics_socket", metrics.socket_path)
+        self.shards = [Shard(index, count, self.socket_path) for index in range(count)]
+        self.reload_requested = False
+        self.stopping = False
+        # supervisor 重启后沿用上次的分片表
+        self.assignment = load_assignment(count)
+        self.assign(config)
+
+    def assign(self, config: dict):
+        groups = list(plan_workers(config.get("accounts") or [], config.get("hedge_mode", False)).values())
+        self.assignment = assign_proxies(groups, self.count, self.assignment)
+        for shard in self.shards:
+            shard.accounts = len(shard_accounts(config, self.count, shard.index, self.assignment))
+            metrics.registry.set("aster_shard_accounts", (("shard", str(shard.index)),), shard.accounts)
+        # 子进程启动或收到 SIGHUP 时从文件里读这张表，必须先写下去
+        try:
+            self.write_status(time.time())
+        except OSError as e:
+            logger.error(f"write supervisor status failed:{e}")
+
+    def on_reload(self, *args):
+        self.reload_requested = True
+
+    def on_stop(self, *args):
+        self.stopping = True
+
+    def collect(self) -> str:
+        texts = []
+        for shard in self.shards:
+            if not shard.running():
+                continue
+            try:
+                texts.append((shard.index, metrics.fetch(shard.socket_path)))
+            except OSError:
+                continue
+        return merge_metrics(texts)
+
+    def reload(self):
+        # 子进程各自重载自己分到的账户；新出现账户的空分片在这里启动
+        try:
+            config = bootstrap.load_config(bootstrap.config_path)
+        except Exception as e:
+            logger.error(f"reload config failed, keep running shards:{e}")
+            return
+        self.assign(config)
+        for shard in self.shards:
+            if shard.running():
+                shard.process.send_signal(signal.SIGHUP)
+        logger.info(f"config reloaded, accounts per shard: {[shard.accounts for shard in self.shards]}")
+
+    def write_status(self, now: float):
+        status = {"pid": os.getpid(), "time": now, "count": self.count, "assignment": self.assignment,
+                  "shards": [shard.status(now) for shard in self.shards]}
+        for shard in self.shards:
+            metrics.registry.set("aster_shard_up", (("shard", str(shard.index)),), int(status["shards"][shard.index]["alive"]))
+        directory = os.path.dirname(status_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{status_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, status_file)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGHUP, self.on_reload)
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        metrics.collectors.append(self.collect)
+        try:
+            metrics.start_server(self.socket_path)
+        except OSError as e:
+            logger.error(f"start metrics server failed:{e}")
+        next_check = 0
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            now = time.time()
+            for shard in self.shards:
+                shard.supervise(now)
+            if now >= next_check:
+                next_check = now + check_interval
+                for shard in self.shards:
+                    shard.probe(now)
+                try:
+                    self.write_status(now)
+                except OSError as e:
+                    logger.error(f"write supervisor status failed:{e}")
+            time.sleep(0.5)
+        self.shutdown()
+        return 0
+
+    def shutdown(self):
+        logger.info("supervisor stopping shards")
+        for shard in self.shards:
+            shard.stop()
+        deadline = time.time() + stop_timeout
+        for shard in self.shards:
+            if shard.process is None:
+                continue
+            try:
+                shard.process.wait(max(0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                shard.process.kill()
+
+
+def run_supervisor(config: dict, count: int) -> int:
+    logger.info(f"supervisor starting {count} shards")
+    return Supervisor(config, count).run()
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("aster")
+
+cache_file = os.path.join("data", "exchange_info.json")
+
+
+def parse_symbol_limits(market_info: dict) -> dict:
+    # 一次遍历把 exchange_info 解析成 symbol -> 精度/过滤器 的字典
+    symbol_limits = {}
+    for symbol_info in market_info["symbols"]:
+        tick_size = 0
+        min_qty = 0
+        max_qty = 0
+        step_size = 0
+        min_notional = 5
+        for filter in symbol_info["filters"]:
+            if filter["filterType"] == "LOT_SIZE":
+                min_qty = filter["minQty"]
+                max_qty = filter["maxQty"]
+                step_size = filter["stepSize"]
+            elif filter["filterType"] == "PRICE_FILTER":
+                tick_size = filter["tickSize"]
+            elif filter["filterType"] == "MIN_NOTIONAL":
+                min_notional = filter.get("notional", filter.get("minNotional", min_notional))
+        symbol_limits[symbol_info["symbol"]] = {
+            "qty_precision": int(symbol_info["quantityPrecision"]),
+            "price_precision": int(symbol_info["pricePrecision"]),
+            "min_qty": float(min_qty),
+            "max_qty": float(max_qty),
+            "tick_size": float(tick_size),
+            "step_size": float(step_size),
+            "min_notional": float(min_notional),
+        }
+    return symbol_limits
+
+
+class SymbolLimitsService:
+    # 进程内共享的交易规则：落盘带 TTL，冷启动直接读本地，后台定时刷新并记录过滤器变化
+    def __init__(self, path: str = cache_file, ttl: float = 6 * 3600, refresh_interval: float = 600):
+        self.path = path
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.limits = None
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+        self.client = None
+        self.refresh_thread = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"load symbol limits cache failed:{e}")
+            return False
+        if time.time() - cached["fetched_at"] > self.ttl:
+            return False
+        self.limits = cached["limits"]
+        self.fetched_at = cached["fetched_at"]
+        logger.info(f"symbol limits loaded from {self.path}, {len(self.limits)} symbols")
+        return True
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再替换，避免其它进程读到半个文件；临时文件带 pid，多个分片进程同时保存也不会互相覆盖
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": self.fetched_at, "limits": self.limits}, f)
+        os.replace(tmp_path, self.path)
+
+    def fetch(self, client):
+        self.update(client.exchange_info())
+
+    def update(self, market_info: dict):
+        limits = parse_symbol_limits(market_info)
+        if self.limits is not None:
+            for symbol, limit in limits.items():
+                if symbol in self.limits and self.limits[symbol] != limit:
+                    logger.info(f"symbol limits changed {symbol}: {self.limits[symbol]} -> {limit}")
+        self.limits = limits
+        self.fetched_at = time.time()
+        try:
+            self.save()
+        except OSError as e:
+            logger.error(f"save symbol limits cache failed:{e}")
+
+    def get(self, client=None) -> dict:
+        if client is not None:
+            self.client = client
+        if self.limits is not None and time.time() - self.fetched_at <= self.ttl:
+            if self.refresh_thread is None and self.client is not None:
+                with self.lock:
+                    self.start_refresh()
+            return self.limits
+        with self.lock:
+            if self.limits is None or time.time() - self.fetched_at > self.ttl:
+                if not self.load():
+                    if self.client is not None:
+                        self.fetch(self.client)
+                    elif self.limits is None:
+                        raise RuntimeError("symbol limits not cached and no client to fetch them")
+                    else:
+                        # 没有 client 时先用过期的规则，等有 client 的调用再刷新
+                        logger.warning(f"symbol limits expired, no client to refresh, using cache from {self.fetched_at}")
+                        return self.limits
+            self.start_refresh()
+        return self.limits
+
+    def start_refresh(self):
+        # 没有 client 时后台线程无从刷新，等第一次带 client 的 get() 再启动
+        if self.refresh_thread is not None or self.client is None:
+            return
+        self.refresh_thread = threading.Thread(target=self.refresh_loop, daemon=True)
+        self.refresh_thread.start()
+
+    def refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                with self.lock:
+                    self.fetch(self.client)
+            except Exception as e:
+                logger.error(f"refresh symbol limits failed:{e}")
+
+
+symbol_limits_service = SymbolLimitsService()
+
+
+def get_symbol_limits(client=None) -> dict:
+    return symbol_limits_service.get(client)
@@ -0,0 +1,38 @@
+import json
+
+import batch_orders
+
+limit = {"qty_precision": 3, "price_precision": 1}
+
+buy = {"symbol": "BTCUSDT", "side": "BUY", "type": "LIMIT", "quantity": 0.0126, "price": 100.04}
+sell = {"symbol": "BTCUSDT", "side": "SELL", "type": "LIMIT", "quantity": 0.0126, "price": 100.06}
+
+
+def test_format_batch_orders_rounds_to_precision():
+    payload = json.loads(batch_orders.format_batch_orders([buy, sell], limit))
+    assert payload[0]["quantity"] == "0.013"
+    assert payload[0]["price"] == "100.0"
+    assert payload[1]["price"] == "100.1"
+    # 原始订单不被修改
+    assert buy["price"] == 100.04
+
+
+def test_split_batch_results_keeps_order_pairing():
+    responses = [{"orderId": 1, "updateTime": 1000}, {"code": -2019, "msg": "Margin is insufficient."}]
+    placed, failed = batch_orders.split_batch_results([buy, sell], responses)
+    assert placed == [responses[0]]
+    assert failed == [(sell, responses[1])]
+
+
+def test_split_batch_results_all_failed():
+    responses = [{"code": -1111, "msg": "x"}, {"code": -1111, "msg": "y"}]
+    placed, failed = batch_orders.split_batch_results([buy, sell], responses)
+    assert placed == []
+    assert [order for order, _ in failed] == [buy, sell]
+
+
+def test_leg_gap_ms():
+    placed = [{"orderId": 1, "updateTime": "1005"}, {"orderId": 2, "updateTime": 998}]
+    assert batch_orders.leg_gap_ms(placed) == 7
+    assert batch_orders.leg_gap_ms(placed[:1]) is None
+    assert batch_orders.leg_gap_ms([]) is None
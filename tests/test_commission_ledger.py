@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+import commission_ledger
+
+
+class IncomeClient:
+    # 按 startTime 返回流水，记录每次请求的参数
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def get_income_history(self, startTime, endTime, incomeType, limit):
+        self.calls.append(startTime)
+        return [row for row in self.rows if startTime <= row["time"] <= endTime][:limit]
+
+
+def income(ms, tran_id, amount="-0.1", asset="USDT"):
+    return {"time": ms, "tranId": tran_id, "asset": asset, "income": amount, "incomeType": "COMMISSION", "tradeId": str(tran_id)}
+
+
+@pytest.fixture
+def now_ms():
+    return int(time.time() * 1000)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return commission_ledger.CommissionLedger(IncomeClient([]), "key", str(tmp_path))
+
+
+def test_apply_skips_rows_at_or_before_cursor(ledger):
+    assert ledger.apply(income(1000, 1))
+    assert ledger.apply(income(1000, 2))
+    # 同一毫秒内已经记过的、游标之前的都不再计入
+    assert not ledger.apply(income(1000, 1))
+    assert not ledger.apply(income(999, 3))
+    assert ledger.apply(income(1001, 4))
+    assert ledger.cursor_time == 1001
+    assert ledger.cursor_ids == {"4:USDT:4"}
+    assert ledger.rows == 3
+    assert ledger.totals["USDT"] == pytest.approx(-0.3)
+
+
+def test_ingest_ignores_other_income_and_pages(ledger, monkeypatch, now_ms):
+    monkeypatch.setattr(commission_ledger, "page_limit", 2)
+    ledger.roll_day()
+    funding = dict(income(now_ms, 9), incomeType="FUNDING_FEE")
+    assert ledger.ingest([income(now_ms, 1), funding], now_ms) == now_ms
+    assert ledger.rows == 1
+    # 整页都已经记过时往后推 1ms，不会死循环
+    assert ledger.ingest([income(now_ms, 1), income(now_ms, 1)], now_ms) == now_ms + 1
+    assert ledger.ingest([income(now_ms + 5, 2)], now_ms + 1) is None
+
+
+def test_sync_is_incremental_and_survives_restart(tmp_path, monkeypatch, now_ms):
+    monkeypatch.setattr(commission_ledger, "page_limit", 2)
+    client = IncomeClient([income(now_ms - 30, 1), income(now_ms - 20, 2), income(now_ms - 20, 3), income(now_ms - 10, 4)])
+    ledger = commission_ledger.CommissionLedger(client, "key", str(tmp_path))
+    assert ledger.sync()["USDT"] == pytest.approx(-0.4)
+    client.calls.clear()
+    assert ledger.sync()["USDT"] == pytest.approx(-0.4)
+    # 第二次只从游标开始拉
+    assert client.calls[0] == now_ms - 10
+    # 重启后从文件恢复，不重复计入
+    restored = commission_ledger.CommissionLedger(client, "key", str(tmp_path))
+    client.rows.append(income(now_ms - 5, 5))
+    assert restored.sync()["USDT"] == pytest.approx(-0.5)
+    assert restored.rows == 5
+
+
+def test_broken_line_is_skipped(tmp_path, now_ms):
+    ledger = commission_ledger.CommissionLedger(IncomeClient([income(now_ms - 10, 1)]), "key", str(tmp_path))
+    ledger.sync()
+    with open(ledger.store_path(ledger.day), "a") as f:
+        f.write('{"time": ')
+    restored = commission_ledger.CommissionLedger(IncomeClient([]), "key", str(tmp_path))
+    assert restored.sync()["USDT"] == pytest.approx(-0.1)
+
+
+def fill(ms, trade_id, **fields):
+    return dict({"s": "BTCUSDT", "t": trade_id, "T": ms, "l": "0.01", "L": "50000"}, **fields)
+
+
+def test_record_fill_uses_pushed_commission_or_estimates(ledger, now_ms):
+    marks = {"BNBUSDT": {"markPrice": "500"}}
+    ledger.record_fill(fill(now_ms, 1, n="0.001", N="BNB"), marks)
+    ledger.record_fill(fill(now_ms, 2), marks)
+    ledger.record_fill(fill(now_ms, 3, m=True), marks)
+    # 重复推送不重复计入
+    ledger.record_fill(fill(now_ms, 3, m=True), marks)
+    assert ledger.cost() == pytest.approx(-(0.5 + 500 * commission_ledger.taker_rate + 500 * commission_ledger.maker_rate))
+
+
+def test_record_fill_skips_trades_already_in_income(ledger, now_ms):
+    ledger.roll_day()
+    ledger.apply(income(now_ms, 1))
+    ledger.record_fill(fill(now_ms, 1), {})
+    assert ledger.pending == {}
+
+
+def test_settle_replaces_estimates_covered_by_income(tmp_path, now_ms):
+    client = IncomeClient([income(now_ms - 10, 1, "-0.3")])
+    ledger = commission_ledger.CommissionLedger(client, "key", str(tmp_path))
+    ledger.record_fill(fill(now_ms - 10, 1), {})
+    ledger.record_fill(fill(now_ms + 10, 2, n="0.05", N="USDT"), {})
+    # 流水里已经有第一笔，只保留游标之后的估算
+    assert ledger.reconcile({}) == pytest.approx(-0.35)
+    assert list(ledger.pending) == [("BTCUSDT", 2)]
+    assert ledger.synced_at > 0
+
+
+def test_needs_reconcile_follows_stream_liveness(ledger):
+    ledger.roll_day()
+    assert ledger.needs_reconcile()
+    ledger.attach_stream()
+    # 刚连上还没对过账
+    assert ledger.needs_reconcile()
+    ledger.settle({})
+    assert not ledger.needs_reconcile()
+    # 推送很久没有动静就不再信任，报活后恢复
+    ledger.stream_seen_at -= commission_ledger.stream_timeout + 1
+    assert not ledger.is_streaming()
+    assert ledger.needs_reconcile()
+    ledger.touch_stream()
+    assert not ledger.needs_reconcile()
+    ledger.detach_stream()
+    assert ledger.needs_reconcile()
@@ -0,0 +1,73 @@
+import time
+
+import hedge_scheduler
+
+
+def make_scheduler(*accounts):
+    scheduler = hedge_scheduler.HedgeScheduler(lambda account: (account["key"], None))
+    scheduler.add([{"key": key, "proxy": proxy, "cost_per_day": cost} for key, proxy, cost in accounts])
+    return scheduler
+
+
+def keys(pair):
+    return [entry.key for entry in pair]
+
+
+def test_lease_pairs_largest_remaining_across_proxies():
+    scheduler = make_scheduler(("a", "p1", 10), ("b", "p1", 9), ("c", "p2", 5), ("d", "p3", 1))
+    assert keys(scheduler.lease("slot1")) == ["a", "c"]
+    # 已被占用的账户不会再被选中
+    assert keys(scheduler.lease("slot2")) == ["b", "d"]
+    assert scheduler.lease("slot3") is None
+
+
+def test_lease_falls_back_to_same_proxy():
+    scheduler = make_scheduler(("a", "p1", 10), ("b", "p1", 5))
+    assert keys(scheduler.lease("slot")) == ["a", "b"]
+
+
+def test_spent_accounts_leave_the_pool():
+    scheduler = make_scheduler(("a", "p1", 10), ("b", "p2", 10), ("c", "p3", 10))
+    pair = scheduler.lease("slot")
+    scheduler.record(pair[0], -10)
+    scheduler.record(pair[1], -4)
+    scheduler.release(pair)
+    # 预算用完的账户不再配对，剩下的和新对手组对
+    assert keys(scheduler.lease("slot")) == ["c", pair[1].key]
+
+
+def test_deferred_accounts_wait_for_their_turn():
+    scheduler = make_scheduler(("a", "p1", 10), ("b", "p2", 10), ("c", "p3", 1))
+    entry = scheduler.entries["a"]
+    scheduler.defer(entry, time.time() + 60)
+    assert keys(scheduler.lease("slot")) == ["b", "c"]
+
+
+def test_retire_returns_holders_and_drops_idle():
+    scheduler = make_scheduler(("a", "p1", 10), ("b", "p2", 10), ("c", "p3", 1))
+    scheduler.lease("slot")
+    # a 的代理变了、c 被删掉
+    holders = scheduler.retire([{"key": "a", "proxy": "px", "cost_per_day": 10}, {"key": "b", "proxy": "p2", "cost_per_day": 10}])
+    assert holders == ["slot"]
+    assert [entry.key for entry in scheduler.drop_retired()] == ["c"]
+    scheduler.release([scheduler.entries["a"], scheduler.entries["b"]])
+    assert [entry.key for entry in scheduler.drop_retired()] == ["a"]
+    assert scheduler.keys() == {"b"}
+
+
+def test_add_updates_kept_accounts_in_place():
+    scheduler = make_scheduler(("a", "p1", 10))
+    entry = scheduler.entries["a"]
+    assert scheduler.add([{"key": "a", "proxy": "p1", "cost_per_day": 20}, {"key": "b", "proxy": "p2", "cost_per_day": 5}]) == ["b"]
+    assert scheduler.entries["a"] is entry
+    assert entry.account["cost_per_day"] == 20
+
+
+def test_leg_is_prepared_once():
+    calls = []
+    scheduler = hedge_scheduler.HedgeScheduler(lambda account: calls.append(account["key"]) or (account["key"], None))
+    scheduler.add([{"key": "a", "proxy": "p1", "cost_per_day": 1}])
+    entry = scheduler.entries["a"]
+    assert scheduler.leg(entry) == ("a", None)
+    assert scheduler.leg(entry) == ("a", None)
+    assert calls == ["a"]
@@ -0,0 +1,58 @@
+import pytest
+
+import journal
+
+
+@pytest.fixture
+def log(tmp_path):
+    writer = journal.Journal(str(tmp_path))
+    yield writer
+    writer.close()
+
+
+def test_record_round_trip(log):
+    log.record(journal.ORDER_ACK, "key-a", symbol="BTCUSDT", side="BUY", price=100.5, qty=0.01,
+               value=1.005, order_id=42, code=-2019, latency_ms=12.345)
+    items = list(journal.read_journal(log.path))
+    assert len(items) == 1
+    item = items[0]
+    assert item["event"] == "order_ack"
+    assert item["side"] == "BUY"
+    assert item["symbol"] == "BTCUSDT"
+    assert item["account"] == journal.account_id("key-a").hex()
+    assert (item["price"], item["qty"], item["value"]) == (100.5, 0.01, 1.005)
+    assert item["order_id"] == 42
+    assert item["code"] == -2019
+    assert item["latency_ms"] == 12.345
+
+
+def test_out_of_range_fields_are_clamped(log):
+    log.record(journal.ORDER_ACK, "key-a", code=-99999, latency_ms=-1)
+    log.record(journal.ORDER_ACK, "key-a", code=99999, latency_ms=10 ** 9)
+    low, high = journal.read_journal(log.path)
+    assert (low["code"], low["latency_ms"]) == (-2 ** 15, 0)
+    assert (high["code"], high["latency_ms"]) == (2 ** 15 - 1, (2 ** 32 - 1) / 1000)
+
+
+def test_unpackable_record_is_dropped(log):
+    log.record(journal.QUOTE, "key-a", symbol="BTCUSDT")
+    log.record(journal.QUOTE, "key-a", symbol="BTCUSDT", order_id="42")
+    assert log.dropped == 1
+    assert len(list(journal.read_journal(log.path))) == 1
+
+
+def test_read_journal_filters(log):
+    log.record(journal.QUOTE, "key-a", symbol="BTCUSDT")
+    log.record(journal.ORDER_SENT, "key-a", symbol="ETHUSDT", side="SELL")
+    log.record(journal.ORDER_SENT, "key-b", symbol="BTCUSDT", side="BUY")
+    assert [item["symbol"] for item in journal.read_journal(log.path, event="order_sent")] == ["ETHUSDT", "BTCUSDT"]
+    assert [item["event"] for item in journal.read_journal(log.path, api_key="key-a")] == ["quote", "order_sent"]
+    assert [item["side"] for item in journal.read_journal(log.path, symbol="BTCUSDT")] == ["", "BUY"]
+
+
+def test_partial_trailing_record_is_skipped(log):
+    log.record(journal.CANCEL, "key-a", order_id=7)
+    with open(log.path, "ab") as f:
+        # 模拟别的进程正在追加，只写了半条
+        f.write(b"\1" * (journal.record_size // 2))
+    assert [item["order_id"] for item in journal.read_journal(log.path)] == [7]
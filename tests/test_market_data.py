@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+import market_data
+
+
+class MarkPriceClient:
+    def __init__(self, prices=None, error=None):
+        self.prices = prices or []
+        self.error = error
+        self.calls = 0
+
+    def mark_price(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.prices
+
+
+def price(symbol, mark):
+    return {"symbol": symbol, "markPrice": mark}
+
+
+def stream_message(*items):
+    return json.dumps([{"e": "markPriceUpdate", "s": symbol, "p": mark, "E": 1} for symbol, mark in items])
+
+
+@pytest.fixture
+def cache():
+    return market_data.MarkPriceCache(ttl=10)
+
+
+def test_fresh_cache_does_not_hit_rest(cache):
+    client = MarkPriceClient([price("BTCUSDT", "1")])
+    cache.on_message(stream_message(("BTCUSDT", "100")))
+    assert cache.get_all(client)["BTCUSDT"]["markPrice"] == "100"
+    assert client.calls == 0
+
+
+def test_stale_cache_falls_back_to_rest(cache, monkeypatch):
+    client = MarkPriceClient([price("BTCUSDT", "101")])
+    cache.on_message(stream_message(("BTCUSDT", "100"), ("ETHUSDT", "5")))
+    monkeypatch.setattr(market_data.time, "time", lambda: cache.updated_at + 11)
+    assert cache.is_stale()
+    prices = cache.get_all(client)
+    assert client.calls == 1
+    assert prices["BTCUSDT"]["markPrice"] == "101"
+    # REST 没返回的交易对保留推送里的旧价格
+    assert prices["ETHUSDT"]["markPrice"] == "5"
+
+
+def test_rest_failure_keeps_last_prices(cache):
+    cache.update([price("BTCUSDT", "100")])
+    cache.updated_at = 0
+    prices = cache.get_all(MarkPriceClient(error=RuntimeError("down")))
+    assert prices["BTCUSDT"]["markPrice"] == "100"
+    assert cache.is_stale()
+
+
+def test_no_client_returns_cached_prices(cache):
+    cache.update([price("BTCUSDT", "100")])
+    cache.updated_at = 0
+    assert cache.get_all()["BTCUSDT"]["markPrice"] == "100"
+
+
+def test_update_replaces_the_dict(cache):
+    cache.update([price("BTCUSDT", "100")])
+    snapshot = cache.get_all()
+    cache.on_message(stream_message(("BTCUSDT", "200")))
+    # 读者拿到的快照不会被并发修改
+    assert snapshot["BTCUSDT"]["markPrice"] == "100"
+
+
+def test_non_price_messages_are_ignored(cache):
+    cache.on_message(json.dumps({"result": None, "id": 1}))
+    assert cache.prices == {}
+    assert cache.updated_at == 0
+
+
+def test_disk_cache_respects_ttl(tmp_path, monkeypatch):
+    path = str(tmp_path / "mark_price.json")
+    writer = market_data.MarkPriceCache()
+    writer.use_disk_cache(30, path)
+    client = MarkPriceClient([price("BTCUSDT", "100")])
+    writer.get_all(client)
+    assert client.calls == 1
+    reader = market_data.MarkPriceCache()
+    reader.use_disk_cache(30, path)
+    assert reader.get_all(client)["BTCUSDT"]["markPrice"] == "100"
+    assert client.calls == 1
+    # 文件过期后重新拉 REST
+    saved_at = reader.updated_at
+    monkeypatch.setattr(market_data.time, "time", lambda: saved_at + 31)
+    late = market_data.MarkPriceCache()
+    late.use_disk_cache(30, path)
+    late.get_all(client)
+    assert client.calls == 2
+
+
+class BookTickerClient:
+    def __init__(self):
+        self.calls = 0
+
+    def book_ticker(self, symbol):
+        self.calls += 1
+        return {"symbol": symbol, "bidPrice": "99", "bidQty": "1", "askPrice": "101", "askQty": "1"}
+
+
+def book_message(symbol, bid, ask):
+    return json.dumps({"e": "bookTicker", "s": symbol, "b": bid, "B": "2", "a": ask, "A": "3", "T": 1})
+
+
+def test_book_ticker_uses_fresh_push():
+    feed = market_data.BookTickerFeed(max_age=3)
+    client = BookTickerClient()
+    feed.on_message(book_message("BTCUSDT", "100", "100.5"))
+    assert feed.get("BTCUSDT", client)["askPrice"] == "100.5"
+    assert client.calls == 0
+
+
+def test_book_ticker_falls_back_to_rest_when_stale(monkeypatch):
+    feed = market_data.BookTickerFeed(max_age=3)
+    client = BookTickerClient()
+    feed.on_message(book_message("BTCUSDT", "100", "100.5"))
+    received = feed.tickers["BTCUSDT"]["received"]
+    monkeypatch.setattr(market_data.time, "time", lambda: received + 4)
+    assert feed.get("BTCUSDT", client)["askPrice"] == "101"
+    assert client.calls == 1
+    # REST 结果写回缓存，时效内不再重复请求
+    assert feed.get("BTCUSDT", client)["askPrice"] == "101"
+    assert client.calls == 1
+
+
+def test_book_ticker_without_client_or_push():
+    feed = market_data.BookTickerFeed()
+    assert feed.get("BTCUSDT") is None
+    client = BookTickerClient()
+    assert feed.get("BTCUSDT", client)["bidPrice"] == "99"
+    assert client.calls == 1
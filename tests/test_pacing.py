@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+import commission_ledger
+import pacing
+
+noon = datetime(2026, 3, 10, 12, 0).timestamp()
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    for name, value in (("min_delay", 60), ("max_delay", 3600), ("finish_margin", 3600), ("jitter", 0),
+                        ("base_value", 250), ("min_scale", 0.5), ("max_scale", 2)):
+        monkeypatch.setattr(pacing, name, value)
+    monkeypatch.setattr(commission_ledger, "taker_rate", 0.0004)
+
+
+def interval_at(now, cost_per_day, orders_per_round=2, unit_cost=0.0004):
+    return (pacing.day_end(now) - now - 3600) * unit_cost * 250 * orders_per_round / cost_per_day
+
+
+def test_plan_spreads_budget_over_the_day():
+    delay, value = pacing.Pacer(2).plan(0, 10, noon)
+    assert delay == pytest.approx(interval_at(noon, 10))
+    assert value == 250
+
+
+def test_plan_scales_up_when_budget_is_large():
+    # 最快节奏也花不完：间隔取 min_delay，单量放大但不超过 max_scale
+    assert pacing.Pacer(2).plan(0, 1000, noon) == (60, 500)
+
+
+def test_plan_scales_down_when_budget_is_small():
+    interval = interval_at(noon, 1)
+    assert interval * 0.5 > 3600
+    assert pacing.Pacer(2).plan(0, 1, noon) == (3600, 125)
+
+
+def test_plan_sleeps_when_budget_is_spent():
+    assert pacing.Pacer(2).plan(-10, 10, noon) == (3600, 250)
+    late = datetime(2026, 3, 10, 23, 59, 30).timestamp()
+    delay, _ = pacing.Pacer(2).plan(-10, 10, late)
+    assert delay == 60
+
+
+def test_plan_catches_up_after_finish_time():
+    late = datetime(2026, 3, 10, 23, 30).timestamp()
+    assert pacing.Pacer(2).plan(-1, 10, late) == (60, 500)
+
+
+def test_observe_learns_unit_cost():
+    pacer = pacing.Pacer(2)
+    pacer.observe(0)
+    pacer.traded(100)
+    pacer.observe(-0.1)
+    assert pacer.unit_cost == pytest.approx(0.0005)
+    assert pacer.plan(-0.1, 10, noon)[0] == pytest.approx(interval_at(noon, 9.9, unit_cost=0.0005))
+    # 换日后重新累计，不会拿跨天的差值去更新
+    pacer.traded(100)
+    pacer.observe(-0.01)
+    assert pacer.planned == 0
+    assert pacer.unit_cost == pytest.approx(0.0005)
+
+
+def test_jitter_stays_in_range(monkeypatch):
+    monkeypatch.setattr(pacing, "jitter", 0.2)
+    pacer = pacing.Pacer(1)
+    for _ in range(100):
+        assert 80 <= pacer.jittered(100) <= 120
+
+
+def test_pacer_of_keeps_one_per_account(monkeypatch):
+    monkeypatch.setattr(pacing, "pacers", {})
+    pacer = pacing.pacer_of("a", 2)
+    assert pacing.pacer_of("a", 2) is pacer
+    assert pacing.pacer_of("a", 1) is not pacer
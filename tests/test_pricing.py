@@ -0,0 +1,68 @@
+import pytest
+
+import pricing
+
+btc = {"tick_size": 0.1, "step_size": 0.001, "min_qty": 0.001, "max_qty": 100, "min_notional": 5}
+
+
+def test_digits_of():
+    assert pricing.digits_of(0.1) == 1
+    assert pricing.digits_of(0.00001) == 5
+    assert pricing.digits_of(1.0) == 0
+    assert pricing.digits_of(10) == 0
+
+
+@pytest.mark.parametrize("value, digits, units", [
+    ("0.1", 1, 1),
+    ("123.45", 4, 1234500),
+    (0.07, 2, 7),
+    ("100", 3, 100000),
+    ("1e-05", 5, 1),
+    ("0.123456", 3, 123),
+])
+def test_to_units(value, digits, units):
+    assert pricing.to_units(value, digits) == units
+
+
+def test_mid_price_rounds_down_to_tick():
+    mid, quantities = pricing.size_orders({"bidPrice": "100.0", "askPrice": "100.5"}, btc, [100], times=[0])
+    assert mid == 100.2
+    assert quantities == [0.998]
+
+
+def test_no_trade_when_spread_is_one_tick():
+    mid, quantities = pricing.size_orders({"bidPrice": "100.0", "askPrice": "100.1"}, btc, [100, 200])
+    assert mid is None
+    assert quantities == [None, None]
+
+
+def test_times_adds_min_qty():
+    _, quantities = pricing.size_orders({"bidPrice": "100.0", "askPrice": "100.5"}, btc, [100, 100], times=[0, 3])
+    assert quantities == [0.998, 1.001]
+
+
+def test_quantity_capped_at_max_qty():
+    _, (quantity,) = pricing.size_orders({"bidPrice": "100.0", "askPrice": "100.5"}, btc, [1000000], times=[0])
+    assert quantity == 100
+
+
+def test_below_min_notional_is_none():
+    _, (quantity,) = pricing.size_orders({"bidPrice": "100.0", "askPrice": "100.5"}, btc, [4], times=[0])
+    assert quantity is None
+
+
+def test_quantity_is_exact_multiple_of_step():
+    limit = {"tick_size": 0.0001, "step_size": 0.1, "min_qty": 0.1, "max_qty": 1000000}
+    mid, (quantity,) = pricing.size_orders({"bidPrice": "0.3001", "askPrice": "0.3009"}, limit, [333.3], times=[0])
+    assert mid == 0.3005
+    assert quantity == 1109.1
+    assert repr(quantity) == "1109.1"
+
+
+def test_calc_net_balance():
+    account = {"assets": [
+        {"asset": "USDT", "marginBalance": "100"},
+        {"asset": "BTC", "marginBalance": "0.5"},
+        {"asset": "ETH", "marginBalance": "0"},
+    ]}
+    assert pricing.calc_net_balance(account, {"BTCUSDT": {"markPrice": "20000"}}) == 10100
@@ -0,0 +1,101 @@
+import pytest
+
+import rate_limiter
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "ip_weight_per_minute", 2400)
+    monkeypatch.setattr(rate_limiter, "account_weight_per_minute", 1200)
+    monkeypatch.setattr(rate_limiter, "reserve_ratio", 0.1)
+    return rate_limiter.WeightScheduler()
+
+
+def test_request_weight_depends_on_symbol():
+    assert rate_limiter.request_weight("GET", "/fapi/v1/openOrders", {"symbol": "BTCUSDT"}) == 1
+    assert rate_limiter.request_weight("GET", "/fapi/v1/openOrders", {}) == 40
+    assert rate_limiter.request_weight("get", "/fapi/v1/unknown") == 1
+    assert rate_limiter.endpoint_weight("GET", "https://x/fapi/v1/ticker/bookTicker?symbol=BTCUSDT") == 2
+
+
+def test_is_priority():
+    assert rate_limiter.is_priority("DELETE")
+    assert rate_limiter.is_priority("POST", {"reduceOnly": "true"})
+    assert rate_limiter.is_priority("POST", {"reduceOnly": True})
+    assert not rate_limiter.is_priority("POST", {"side": "BUY"})
+    assert not rate_limiter.is_priority("GET")
+
+
+def test_reserve_keeps_floor_for_priority(scheduler):
+    # 账户桶 1200，预留 120：普通请求用到 1080 就要等，撤单和平仓还能继续用预留额度
+    assert scheduler.reserve("p", "a", 1070) == 0
+    assert scheduler.reserve("p", "a", 20) > 0
+    assert scheduler.reserve("p", "a", 20, priority=True) == 0
+
+
+@pytest.mark.parametrize("status_code, default_backoff", [(418, 120), (429, 60)])
+def test_ban_blocks_everyone_on_the_proxy(scheduler, status_code, default_backoff):
+    scheduler.on_response("p", "a", status_code, {})
+    ip_bucket = scheduler.ip_buckets["p"]
+    assert ip_bucket.tokens == 0
+    wait = scheduler.reserve("p", "b", 1, priority=True)
+    assert default_backoff - 1 < wait <= default_backoff
+    # 其它代理不受影响
+    assert scheduler.reserve("q", "c", 1) == 0
+
+
+def test_ban_honours_retry_after_and_never_shortens(scheduler):
+    scheduler.on_response("p", "a", 429, {"Retry-After": "300"})
+    scheduler.on_response("p", "a", 429, {"Retry-After": "5"})
+    assert scheduler.reserve("p", "a", 1) > 290
+
+
+def test_used_weight_header_caps_tokens(scheduler):
+    scheduler.on_response("p", "a", 200, {"X-MBX-USED-WEIGHT-1M": "2000"})
+    ip_bucket = scheduler.ip_buckets["p"]
+    assert ip_bucket.used_weight == 2000
+    assert ip_bucket.tokens <= 400
+
+
+def test_account_budget_follows_ip_usage(scheduler):
+    for account in "abcd":
+        scheduler.on_response("p", account, 200, {})
+    # IP 宽裕时每个账户最多 account_weight_per_minute
+    scheduler.on_response("p", "a", 200, {"X-MBX-USED-WEIGHT-1M": "100"})
+    assert scheduler.account_buckets["a"].capacity == 1200
+    # IP 紧张时只保证四个活跃账户平分的那一份
+    scheduler.on_response("p", "b", 200, {"X-MBX-USED-WEIGHT-1M": "2300"})
+    assert scheduler.account_buckets["b"].capacity == 600
+
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_heavy_request_passes_after_account_budget_shrinks(scheduler, monkeypatch):
+    clock = Clock(1000000)
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    # 同一 IP 上 100 个活跃账户、IP 快用完：账户额度被压到 24，比 income(30) 和不带 symbol 的 openOrders(40) 还小
+    for i in range(100):
+        scheduler.on_response("p", f"a{i}", 200, {})
+    scheduler.on_response("p", "a0", 200, {"X-MBX-USED-WEIGHT-1M": "2390"})
+    account_bucket = scheduler.account_buckets["a0"]
+    assert account_bucket.capacity == 24
+    assert rate_limiter.request_weight("GET", "/fapi/v1/openOrders", {}) == 40
+    # 桶补满后就放行，扣成负数
+    clock.sleep(3600)
+    assert scheduler.reserve("p", "a0", 40) == 0
+    assert account_bucket.tokens < 0
+    # 下一个要等桶补回来，acquire 最终一定能拿到
+    assert scheduler.reserve("p", "a0", 30) > 0
+    started = clock.now
+    scheduler.acquire("p", "a0", rate_limiter.request_weight("GET", "/fapi/v1/income"))
+    assert 0 < clock.now - started < 600
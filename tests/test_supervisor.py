@@ -0,0 +1,62 @@
+import json
+
+import supervisor
+
+
+def groups_of(*proxies):
+    # 每个元素是一组账户的 (代理, 账户数)
+    return [[{"key": f"{proxy}-{i}", "proxy": proxy} for i in range(size)] for proxy, size in proxies]
+
+
+def test_new_proxies_go_to_least_loaded_shard():
+    assignment = supervisor.assign_proxies(groups_of(("a", 4), ("b", 3), ("c", 2), ("d", 1)), 2)
+    assert assignment == {"a": 0, "b": 1, "c": 1, "d": 0}
+
+
+def test_same_input_same_assignment():
+    groups = groups_of(("a", 1), ("b", 1), ("c", 1), ("d", 1), ("e", 1))
+    assert supervisor.assign_proxies(groups, 3) == supervisor.assign_proxies(list(reversed(groups)), 3)
+
+
+def test_previous_proxies_stay_on_their_shard():
+    previous = {"a": 1, "b": 0}
+    # a 变大了也不搬走，新代理 c 补到较空的分片
+    assignment = supervisor.assign_proxies(groups_of(("a", 5), ("b", 1), ("c", 2)), 2, previous)
+    assert assignment == {"a": 1, "b": 0, "c": 0}
+
+
+def test_removed_proxies_and_out_of_range_shards_are_dropped():
+    previous = {"a": 0, "gone": 1, "b": 3}
+    assignment = supervisor.assign_proxies(groups_of(("a", 1), ("b", 1)), 2, previous)
+    assert assignment == {"a": 0, "b": 1}
+
+
+def test_adding_a_proxy_keeps_the_rest_in_place():
+    before = supervisor.assign_proxies(groups_of(("a", 2), ("b", 2), ("c", 1)), 2)
+    after = supervisor.assign_proxies(groups_of(("a", 2), ("b", 2), ("c", 1), ("new", 3)), 2, before)
+    assert {proxy: after[proxy] for proxy in before} == before
+
+
+def test_load_assignment(tmp_path, monkeypatch):
+    path = tmp_path / "supervisor.json"
+    monkeypatch.setattr(supervisor, "status_file", str(path))
+    assert supervisor.load_assignment(2) == {}
+    path.write_text(json.dumps({"count": 2, "assignment": {"a": 1}}))
+    assert supervisor.load_assignment(2) == {"a": 1}
+    # 分片数变了就重新分
+    assert supervisor.load_assignment(3) == {}
+    path.write_text("{broken")
+    assert supervisor.load_assignment(2) == {}
+
+
+def test_shard_accounts_partitions_every_account(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "status_file", str(tmp_path / "missing.json"))
+    accounts = [{"key": f"k{i}", "proxy": f"p{i % 3}"} for i in range(7)]
+    config = {"accounts": accounts, "hedge_mode": False}
+    shards = [supervisor.shard_accounts(config, 2, index) for index in range(2)]
+    assert sorted(account["key"] for shard in shards for account in shard) == sorted(account["key"] for account in accounts)
+    for shard in shards:
+        for account in accounts:
+            # 同一代理的账户都在同一个分片
+            if account["proxy"] in {a["proxy"] for a in shard}:
+                assert account in shard
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+import symbol_limits
+
+
+def exchange_info(step_size="0.001"):
+    return {
+        "symbols": [
+            {
+                "symbol": "BTCUSDT",
+                "quantityPrecision": 3,
+                "pricePrecision": 1,
+                "filters": [
+                    {"filterType": "PRICE_FILTER", "tickSize": "0.1"},
+                    {"filterType": "LOT_SIZE", "minQty": "0.001", "maxQty": "100", "stepSize": step_size},
+                    {"filterType": "MIN_NOTIONAL", "notional": "5"},
+                ],
+            }
+        ]
+    }
+
+
+class Client:
+    def __init__(self):
+        self.calls = 0
+        self.step_size = "0.001"
+
+    def exchange_info(self):
+        self.calls += 1
+        return exchange_info(self.step_size)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbol_limits.SymbolLimitsService, "start_refresh", lambda self: None)
+    return symbol_limits.SymbolLimitsService(str(tmp_path / "exchange_info.json"), ttl=60)
+
+
+def test_parse_symbol_limits():
+    limits = symbol_limits.parse_symbol_limits(exchange_info())["BTCUSDT"]
+    assert limits == {
+        "qty_precision": 3,
+        "price_precision": 1,
+        "min_qty": 0.001,
+        "max_qty": 100.0,
+        "tick_size": 0.1,
+        "step_size": 0.001,
+        "min_notional": 5.0,
+    }
+
+
+def test_fresh_cache_is_reused(service):
+    client = Client()
+    service.get(client)
+    service.get(client)
+    assert client.calls == 1
+
+
+def test_expired_cache_is_refetched(service, monkeypatch):
+    client = Client()
+    service.get(client)
+    client.step_size = "0.01"
+    fetched_at = service.fetched_at
+    monkeypatch.setattr(symbol_limits.time, "time", lambda: fetched_at + 61)
+    assert service.get(client)["BTCUSDT"]["step_size"] == 0.01
+    assert client.calls == 2
+
+
+def test_disk_cache_shared_across_processes(service, tmp_path):
+    service.get(Client())
+    # 另一个进程冷启动直接读落盘文件，不需要 client
+    other = symbol_limits.SymbolLimitsService(service.path, ttl=60)
+    assert other.get()["BTCUSDT"]["tick_size"] == 0.1
+
+
+def test_expired_disk_cache_is_ignored(service, monkeypatch):
+    with open(service.path, "w") as f:
+        json.dump({"fetched_at": 0, "limits": {"BTCUSDT": {}}}, f)
+    client = Client()
+    assert service.get(client)["BTCUSDT"]["qty_precision"] == 3
+    assert client.calls == 1
+
+
+def test_no_client_and_no_cache_raises(service):
+    with pytest.raises(RuntimeError):
+        service.get()
+
+
+def test_no_client_keeps_expired_limits(service, monkeypatch):
+    service.get(Client())
+    service.client = None
+    fetched_at = service.fetched_at
+    monkeypatch.setattr(symbol_limits.time, "time", lambda: fetched_at + 61)
+    assert service.get()["BTCUSDT"]["step_size"] == 0.001
@@ -0,0 +1,87 @@
+import pytest
+
+import trade_history
+
+now_ms = 1_700_000_000_000
+day_ms = trade_history.day_ms
+
+
+class TradesClient:
+    # 按交易所的规则过滤：时间窗口不超过 7 天，fromId 不能和时间参数一起用
+    def __init__(self, trades):
+        self.trades = trades
+        self.calls = []
+
+    def get_account_trades(self, symbol, limit, recvWindow, startTime=None, endTime=None, fromId=None):
+        self.calls.append({"startTime": startTime, "endTime": endTime, "fromId": fromId})
+        if fromId is not None:
+            assert startTime is None and endTime is None
+            matched = [t for t in self.trades if t["id"] >= fromId]
+        else:
+            assert endTime - startTime < trade_history.window_ms
+            matched = [t for t in self.trades if startTime <= t["time"] <= endTime]
+        return sorted(matched, key=lambda t: t["id"])[:limit]
+
+
+def trade(id, time, quote_qty=10):
+    return {"id": id, "orderId": id, "time": time, "side": "BUY", "price": "1", "qty": str(quote_qty), "quoteQty": str(quote_qty)}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(trade_history, "page_limit", 3)
+    trade_store = trade_history.TradeStore(str(tmp_path / "trades.db"))
+    yield trade_store
+    trade_store.close()
+
+
+def test_first_sync_walks_windows_then_pages_by_id(store):
+    trades = [trade(1, now_ms - 20 * day_ms)] + [trade(id, now_ms - 10 * day_ms + id) for id in range(2, 9)]
+    client = TradesClient(trades)
+    assert trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms) == 8
+    windows = [call for call in client.calls if call["fromId"] is None]
+    # 30 天前开始的第一个窗口为空，第二个窗口拿到第一笔成交后改用 fromId
+    assert len(windows) == 2
+    assert windows[1]["startTime"] == windows[0]["endTime"] + 1
+    assert [call["fromId"] for call in client.calls if call["fromId"] is not None] == [2, 5, 8]
+    assert store.state("a", "BTCUSDT") == (8, now_ms)
+
+
+def test_resync_is_incremental(store):
+    client = TradesClient([trade(1, now_ms - day_ms), trade(2, now_ms - day_ms + 1)])
+    trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms)
+    client.calls.clear()
+    assert trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms) == 0
+    assert client.calls == [{"startTime": None, "endTime": None, "fromId": 3}]
+    client.trades.append(trade(3, now_ms))
+    assert trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms + 1) == 1
+
+
+def test_empty_history_advances_synced_until(store):
+    client = TradesClient([])
+    assert trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms) == 0
+    assert store.state("a", "BTCUSDT") == (None, now_ms)
+    client.calls.clear()
+    # 下次只查上次同步之后的一个窗口
+    trade_history.sync_pair(client, store, "a", "BTCUSDT", now_ms + 1000)
+    assert client.calls == [{"startTime": now_ms, "endTime": now_ms + 1000, "fromId": None}]
+
+
+def test_duplicate_trades_are_counted_once(store):
+    assert store.ingest("a", "BTCUSDT", [trade(1, now_ms - 10, 5)], now_ms) == 1
+    assert store.ingest("a", "BTCUSDT", [trade(1, now_ms - 10, 5), trade(2, now_ms - 5, 7)], now_ms) == 1
+    assert store.volumes("a", now_ms, [1]) == {1: (12.0, 2)}
+
+
+def test_volumes_split_at_partial_hour(store):
+    hour_ms = trade_history.hour_ms
+    start = now_ms - day_ms
+    store.ingest("a", "BTCUSDT", [
+        trade(1, start - 1, 100),
+        trade(2, start, 1),
+        trade(3, start + hour_ms, 2),
+        trade(4, now_ms - 1, 4),
+    ], now_ms)
+    store.ingest("b", "BTCUSDT", [trade(1, now_ms - 1, 1000)], now_ms)
+    # 窗口起点之前的成交不算，起点所在的不完整小时按明细精确求和
+    assert store.volumes("a", now_ms, [1, 2]) == {1: (7.0, 3), 2: (107.0, 4)}
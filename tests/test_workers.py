@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pytest
+
+import workers
+
+
+def account(key, proxy=None, cost=1.0):
+    return {"key": key, "secret": f"{key}-secret", "proxy": proxy, "cost_per_day": cost}
+
+
+@pytest.fixture
+def registry():
+    started = []
+
+    def start(worker):
+        # 真实线程里跑的是交易循环，这里只等停止信号
+        worker.thread = threading.Thread(target=worker.stop.wait, daemon=True)
+        worker.thread.start()
+        started.append(worker)
+
+    registry = workers.WorkerRegistry(start)
+    registry.started = started
+    yield registry
+    registry.stop_all()
+
+
+def test_first_apply_starts_every_account(registry):
+    result = registry.apply([account("a"), account("b")], False)
+    assert result == {"started": 2, "stopped": 0, "updated": 0, "running": 2}
+    assert registry.keys() == {"a", "b"}
+
+
+def test_non_restart_fields_update_in_place(registry):
+    registry.apply([account("a"), account("b")], False)
+    worker = registry.started[0]
+    live = worker.accounts[0]
+    result = registry.apply([account("a", cost=2.5), account("b")], False)
+    assert result == {"started": 0, "stopped": 0, "updated": 1, "running": 2}
+    # 运行中的线程持有的是同一个字典，下一轮直接读到新值
+    assert worker.accounts[0] is live
+    assert live["cost_per_day"] == 2.5
+    assert not worker.stopping()
+
+
+@pytest.mark.parametrize("field", workers.restart_fields)
+def test_restart_fields_restart_the_worker(registry, field):
+    registry.apply([account("a")], False)
+    old = registry.started[0]
+    changed = account("a")
+    changed[field] = "changed"
+    result = registry.apply([changed], False)
+    assert result == {"started": 1, "stopped": 1, "updated": 0, "running": 1}
+    assert old.stopping()
+    assert not old.thread.is_alive()
+    assert registry.started[-1].accounts == [changed]
+
+
+def test_stop_wakes_waiting_worker(registry):
+    registry.apply([account("a")], False)
+    worker = registry.started[0]
+    worker.waiting = threading.Event()
+    registry.apply([], False)
+    assert worker.waiting.is_set()
+
+
+def test_hedge_mode_switch_regroups(registry):
+    accounts = [account("a"), account("b"), account("c")]
+    registry.apply(accounts, False)
+    result = registry.apply(accounts, True)
+    # a+b 成对，落单的 c 按单账户跑，和原来的 worker 一样保留
+    assert result == {"started": 1, "stopped": 2, "updated": 0, "running": 2}
+    names = sorted(worker.name for worker in registry.workers.values())
+    assert names == ["a+b", "c"]
+
+
+def test_stop_all(registry):
+    registry.apply([account("a"), account("b")], True)
+    registry.stop_all()
+    assert registry.workers == {}
+    assert all(not worker.thread.is_alive() for worker in registry.started)
+
+
+def test_config_watcher_detects_change_and_trigger(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("accounts: []\n")
+    watcher = workers.ConfigWatcher(str(path))
+    assert not watcher.changed()
+    watcher.trigger()
+    assert watcher.changed()
+    assert not watcher.changed()
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert watcher.changed()
@@ -0,0 +1,247 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("aster")
+
+# 按配置开启：span 写成 Chrome trace（chrome://tracing、Perfetto 可直接打开），
+# CPU 采样器把各线程占用 CPU 时的调用栈按 folded 格式累计 CPU 微秒（flamegraph.pl、speedscope 可直接读）
+enabled = False
+trace_dir = os.path.join("data", "trace")
+flush_interval = 5
+sample_interval = 0.01
+
+pid = os.getpid()
+events = []
+events_lock = threading.Lock()
+local = threading.local()
+trace_path = None
+profiler = None
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_span = NullSpan()
+
+
+class Span:
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        args = dict(self.args)
+        account = getattr(local, "account", None)
+        if account is not None:
+            args["account"] = account
+            args["loop"] = local.loop
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        emit({"name": self.name, "ph": "X", "ts": to_us(self.start), "dur": (end - self.start) * 1e6,
+              "pid": pid, "tid": threading.get_ident(), "args": args})
+        return False
+
+
+# perf_counter 的零点不固定，统一换算到 wall clock 的微秒
+clock_offset = time.time() - time.perf_counter()
+
+
+def to_us(counter: float) -> float:
+    return (counter + clock_offset) * 1e6
+
+
+def emit(event: dict):
+    with events_lock:
+        events.append(event)
+
+
+def span(name: str, **args):
+    # 关闭时返回共享的空对象，热路径上只多一次全局变量判断
+    if not enabled:
+        return null_span
+    return Span(name, args)
+
+
+def traced(name: str = None):
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin_loop(account: str):
+    # 标记当前线程进入新一轮循环，之后的 span 都带上账户和轮次
+    if not enabled:
+        return
+    now = time.perf_counter()
+    tid = threading.get_ident()
+    if getattr(local, "account", None) is not None:
+        emit({"name": "loop", "ph": "E", "ts": to_us(now), "pid": pid, "tid": tid})
+    local.account = account[:8]
+    local.loop = getattr(local, "loop", 0) + 1
+    emit({"name": "loop", "ph": "B", "ts": to_us(now), "pid": pid, "tid": tid,
+          "args": {"account": local.account, "loop": local.loop}})
+
+
+def flush():
+    with events_lock:
+        pending = events[:]
+        del events[:]
+    if not pending or trace_path is None:
+        return
+    # JSON Array 格式允许没有结尾的 ]，可以一直追加，进程被杀掉也能打开
+    with open(trace_path, "a") as f:
+        for event in pending:
+            f.write(json.dumps(event, separators=(",", ":")))
+            f.write(",\n")
+
+
+def flush_forever():
+    while True:
+        time.sleep(flush_interval)
+        try:
+            flush()
+        except OSError as e:
+            logger.error(f"flush trace failed:{e}")
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def thread_cpu_time(tid: int):
+    # 线程已用的 CPU 秒数；平台不支持或线程已经退出时返回 None
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(tid))
+    except (AttributeError, OSError):
+        return None
+
+
+def parked(frame) -> bool:
+    # 拿不到线程 CPU 时间时的退路：停在 threading 的 wait 里的线程是空闲的
+    return frame.f_code.co_name == "wait" and os.path.basename(frame.f_code.co_filename) == "threading.py"
+
+
+class CpuProfiler:
+    # 定时抓取各线程的栈，按两次采样之间该线程实际用掉的 CPU 时间加权；阻塞在 wait / sleep / 网络读写上的线程
+    # 不占 CPU，不会计入，所以结果是 CPU profile 而不是挂钟时间。只计数不记录时间线，开销与线程数成正比
+    def __init__(self, path: str, interval: float = sample_interval):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.sample_forever, daemon=True)
+        self.thread.start()
+
+    def sample_forever(self):
+        names = {}
+        cpu_seen = {}
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            samples = Counter()
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid == own:
+                    continue
+                cpu = thread_cpu_time(tid)
+                if cpu is None:
+                    if parked(frame):
+                        continue
+                    weight = int(self.interval * 1e6)
+                else:
+                    # 第一次见到的线程只记下起点
+                    weight = int((cpu - cpu_seen.get(tid, cpu)) * 1e6)
+                    cpu_seen[tid] = cpu
+                    if weight <= 0:
+                        continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                samples[";".join(reversed(stack))] += weight
+            for tid in [tid for tid in cpu_seen if tid not in frames]:
+                del cpu_seen[tid]
+            with self.lock:
+                self.stacks.update(samples)
+
+    def dump(self):
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, self.path)
+
+    def dump_forever(self, interval: float = 60):
+        while not self.stopped.wait(interval):
+            try:
+                self.dump()
+            except OSError as e:
+                logger.error(f"dump profile failed:{e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.dump()
+
+
+def shutdown():
+    flush()
+    if profiler is not None:
+        profiler.stop()
+
+
+def configure(config: dict):
+    # config: {"enabled": bool, "profile": bool, "sample_interval_ms": 10, "dir": "data/trace"}
+    global enabled, trace_dir, sample_interval, trace_path, profiler
+    if not config.get("enabled") and not config.get("profile"):
+        return
+    trace_dir = config.get("dir", trace_dir)
+    os.makedirs(trace_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if config.get("enabled"):
+        trace_path = os.path.join(trace_dir, f"trace-{stamp}-{pid}.json")
+        with open(trace_path, "w") as f:
+            f.write("[\n")
+        enabled = True
+        threading.Thread(target=flush_forever, daemon=True).start()
+        logger.info(f"tracing enabled, writing {trace_path}")
+    if config.get("profile"):
+        sample_interval = config.get("sample_interval_ms", sample_interval * 1000) / 1000
+        profiler = CpuProfiler(os.path.join(trace_dir, f"cpu-{stamp}-{pid}.folded"), sample_interval)
+        profiler.start()
+        threading.Thread(target=profiler.dump_forever, daemon=True).start()
+        logger.info(f"cpu profiler enabled, writing {profiler.path} (counts are CPU microseconds)")
+    atexit.register(shutdown)
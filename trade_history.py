@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("aster")
+
+store_file = os.path.join("data", "trades.db")
+page_limit = 1000
+# userTrades 的 startTime/endTime 跨度不能超过 7 天
+window_ms = 7 * 24 * 3600 * 1000
+hour_ms = 3600 * 1000
+day_ms = 24 * hour_ms
+history_days = 30
+# 超过统计窗口的成交定期清理，多留几天余量
+keep_days = history_days + 5
+
+schema = """
+CREATE TABLE IF NOT EXISTS trades (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    order_id INTEGER,
+    time INTEGER NOT NULL,
+    side TEXT,
+    price TEXT,
+    qty TEXT,
+    quote_qty REAL NOT NULL,
+    commission TEXT,
+    commission_asset TEXT,
+    maker INTEGER,
+    PRIMARY KEY (account, symbol, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trades_account_time ON trades (account, time, quote_qty);
+-- 按小时预聚合的成交额，只由新插入的成交触发更新，重复拉到的记录被主键忽略，不会重复计入
+CREATE TABLE IF NOT EXISTS hourly_volume (
+    account TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    quote_volume REAL NOT NULL,
+    trades INTEGER NOT NULL,
+    PRIMARY KEY (account, hour)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trades_hourly AFTER INSERT ON trades BEGIN
+    INSERT INTO hourly_volume (account, hour, quote_volume, trades)
+    VALUES (NEW.account, NEW.time / 3600000, NEW.quote_qty, 1)
+    ON CONFLICT (account, hour) DO UPDATE SET quote_volume = quote_volume + NEW.quote_qty, trades = trades + 1;
+END;
+-- 每个账户 × 交易对的同步游标：last_id 之后按 fromId 翻页，还没有成交时按 synced_until 往后按时间窗口查
+CREATE TABLE IF NOT EXISTS sync_state (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    last_id INTEGER,
+    synced_until INTEGER NOT NULL,
+    PRIMARY KEY (account, symbol)
+) WITHOUT ROWID;
+"""
+
+
+def account_id_of(api_key: str) -> str:
+    # 库里不存明文 key，与手续费账本一样用哈希前缀区分账户
+    return hashlib.sha1(api_key.encode()).hexdigest()[:16]
+
+
+class TradeStore:
+    # 所有账户共用一个 sqlite 文件，并发同步的线程共用一个连接，写入串行化
+    def __init__(self, path: str = store_file):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(schema)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def state(self, account: str, symbol: str):
+        with self.lock:
+            row = self.db.execute("SELECT last_id, synced_until FROM sync_state WHERE account = ? AND symbol = ?",
+                                  (account, symbol)).fetchone()
+        return row if row is not None else (None, 0)
+
+    def ingest(self, account: str, symbol: str, trades: list, synced_until: int) -> int:
+        # 一页成交和游标在同一个事务里提交，中途被杀也不会漏拉或重复计入
+        rows = [(account, symbol, int(t["id"]), int(t.get("orderId", 0)), int(t["time"]), t.get("side"), t.get("price"),
+                 t.get("qty"), float(t["quoteQty"]), t.get("commission"), t.get("commissionAsset"), int(bool(t.get("maker"))))
+                for t in trades]
+        last_id = max((row[2] for row in rows), default=None)
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany("INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # total_changes 也包含触发器里的写入，单独数一遍真正新增的成交
+            inserted = (self.db.total_changes - before) // 2
+            self.db.execute(
+                "INSERT INTO sync_state (account, symbol, last_id, synced_until) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (account, symbol) DO UPDATE SET last_id = COALESCE(MAX(last_id, excluded.last_id), last_id, excluded.last_id), "
+                "synced_until = MAX(synced_until, excluded.synced_until)",
+                (account, symbol, last_id, synced_until))
+        return inserted
+
+    def volumes(self, account: str, now_ms: int, days: list) -> dict:
+        # 整小时的部分直接加预聚合，窗口起点所在的那个不完整小时走索引精确求和
+        result = {}
+        with self.lock:
+            for day in days:
+                start = now_ms - day * day_ms
+                first_full_hour = -(-start // hour_ms)
+                hours = self.db.execute("SELECT COALESCE(SUM(quote_volume), 0), COALESCE(SUM(trades), 0) FROM hourly_volume "
+                                        "WHERE account = ? AND hour >= ?", (account, first_full_hour)).fetchone()
+                edge = self.db.execute("SELECT COALESCE(SUM(quote_qty), 0), COUNT(*) FROM trades WHERE account = ? AND time >= ? AND time < ?",
+                                       (account, start, first_full_hour * hour_ms)).fetchone()
+                result[day] = (hours[0] + edge[0], hours[1] + edge[1])
+        return result
+
+    def prune(self, now_ms: int, days: int = keep_days):
+        cutoff = now_ms - days * day_ms
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM trades WHERE time < ?", (cutoff,))
+            self.db.execute("DELETE FROM hourly_volume WHERE hour < ?", (cutoff // hour_ms,))
+
+
+def fetch_trades(client, symbol: str, **params) -> list:
+    return client.get_account_trades(symbol=symbol, limit=page_limit, recvWindow=6000, **params)
+
+
+def sync_pair(client, store: TradeStore, account: str, symbol: str, now_ms: int = None) -> int:
+    # 增量同步一个账户的一个交易对，返回新增成交数
+    now_ms = now_ms or int(time.time() * 1000)
+    last_id, synced_until = store.state(account, symbol)
+    inserted = 0
+    if last_id is None:
+        # 还没有游标：从上次同步到的时间（首次为 history_days 天前）起按 7 天窗口往后找第一批成交，
+        # 找到之后改用 fromId，后面的成交一次翻到最新，不再逐个窗口查
+        start = max(synced_until, now_ms - history_days * day_ms)
+        while start <= now_ms:
+            end = min(start + window_ms - 1, now_ms)
+            trades = fetch_trades(client, symbol, startTime=start, endTime=end)
+            inserted += store.ingest(account, symbol, trades, end if len(trades) < page_limit else start)
+            if trades:
+                last_id = max(int(t["id"]) for t in trades)
+                break
+            start = end + 1
+        if last_id is None:
+            return inserted
+    while True:
+        # fromId 不能和 startTime/endTime 一起用，按成交 id 顺序翻页直到不满一页
+        trades = fetch_trades(client, symbol, fromId=last_id + 1)
+        inserted += store.ingest(account, symbol, trades, now_ms)
+        if not trades:
+            break
+        last_id = max(int(t["id"]) for t in trades)
+        if len(trades) < page_limit:
+            break
+    return inserted
@@ -1,11 +1,14 @@
-
-from aster.rest_api import Client
+from bootstrap import configure_endpoints, create_client, get_logger, load_config
+from fanout import build_parser, format_results, run_fanout
+from trade_history import TradeStore, account_id_of, history_days, store_file, sync_pair
+import sys
 import time
-import logging
-import yaml
 
 
+logger = get_logger("aster_trade_vol")
+
 symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT"]
+windows = [1, 7, 30]
 
 
 '''
@@ -28,27 +31,83 @@ symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT"]
   }
 ]
 '''
-def get_trade_vol(client: Client, symbol: str, start_time: int, end_time: int):
-    response = client.get_account_trades(symbol=symbol, recvWindow=6000, startTime=start_time, endTime=end_time)
-    vol = 0
-    for trade in response:
-        vol += float(trade['quoteQty'])
-    return vol
-
-def load_config():
-    with open('config.yaml', 'r') as f:
-        config = yaml.safe_load(f)
-    return config["accounts"]
+def sync_all(accounts: list, pair_symbols: list, store: TradeStore, concurrency: int, timeout: float) -> dict:
+    # 账户 × 交易对拆成独立任务，按代理限制并发；返回 key -> {"new": 新增成交数, "errors": [...]}
+    clients = {}
+    now_ms = int(time.time() * 1000)
+
+    def client_of(account: dict):
+        # 同一账户的多个交易对共用一个 client，连接池本身按代理共享
+        client = clients.get(account["key"])
+        if client is None:
+            client = clients.setdefault(account["key"], create_client(account, timeout))
+        return client
+
+    def task(job: dict):
+        return {"new": sync_pair(client_of(job), store, account_id_of(job["key"]), job["symbol"], now_ms)}
+
+    jobs = [dict(account, symbol=symbol) for account in accounts for symbol in pair_symbols]
+    summary = {account["key"]: {"new": 0, "errors": []} for account in accounts}
+    for item in run_fanout(jobs, task, concurrency, timeout):
+        entry = summary[item["key"]]
+        if item["ok"]:
+            entry["new"] += item["result"]["new"]
+        else:
+            symbol = jobs[item["index"]]["symbol"]
+            logger.error(f"{item['key']} {symbol} sync trades failed:{item['error']}")
+            entry["errors"].append(f"{symbol}: {item['error']}")
+    return summary
+
+
+def report(accounts: list, store: TradeStore, summary: dict, latency_ms: float) -> list:
+    # 输出结构与 fanout 的结果一致，直接复用它的表格 / CSV / JSON 格式化
+    now_ms = int(time.time() * 1000)
+    results = []
+    for index, account in enumerate(accounts):
+        volumes = store.volumes(account_id_of(account["key"]), now_ms, windows)
+        entry = summary.get(account["key"], {"new": 0, "errors": []})
+        result = {f"vol_{day}d": round(volumes[day][0], 2) for day in windows}
+        result["trades_30d"] = volumes[30][1]
+        result["new_trades"] = entry["new"]
+        results.append({
+            "index": index,
+            "name": account.get("name", ""),
+            "key": account["key"],
+            "proxy": account.get("proxy", ""),
+            "ok": not entry["errors"],
+            "latency_ms": latency_ms,
+            "result": result,
+            "error": "; ".join(entry["errors"]),
+        })
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = build_parser("统计所有账户近 1 / 7 / 30 天的成交额")
+    parser.add_argument("--symbols", default=",".join(symbols), help="逗号分隔的交易对")
+    parser.add_argument("--store", default=store_file, help="本地成交库")
+    parser.add_argument("--offline", action="store_true", help="不同步，只用本地库里已有的成交出报表")
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    configure_endpoints(config)
+    accounts = config["accounts"]
+    store = TradeStore(args.store)
+    start = time.time()
+    summary = {}
+    if not args.offline:
+        summary = sync_all(accounts, args.symbols.split(","), store, args.concurrency, args.timeout)
+        store.prune(int(time.time() * 1000))
+    latency_ms = round((time.time() - start) * 1000, 1)
+    logger.info(f"trade history synced for {len(accounts)} accounts in {latency_ms}ms, history {history_days} days")
+    results = report(accounts, store, summary, latency_ms)
+    store.close()
+    text = format_results(results, args.format)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if all(item["ok"] for item in results) else 1
 
 if __name__ == "__main__":
-    accounts = load_config()
-    for account in accounts:
-        proxies = { 'https': account["proxy"] }
-        client = Client(key=account["key"], secret=account["secret"], proxies=proxies)
-        vol = 0
-        for symbol in symbols:
-            start_time = int(time.time() * 1000) - 1000 * 60 * 60 * 24 * 7
-            end_time = int(time.time() * 1000)  - 1000 * 60 * 60 * 24 * 0
-
-            vol += get_trade_vol(client, symbol, start_time, end_time)
-        print(account["key"], vol)
+    sys.exit(main())
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+
+import aiohttp
+import market_data
+import metrics
+from commission_ledger import get_ledger
+from market_data import get_mark_price_dict, parse_stream_message
+
+logger = logging.getLogger("aster")
+
+# listenKey 60 分钟过期，按官方建议 30 分钟续期一次
+keepalive_interval = 30 * 60
+# websocket 心跳间隔，超时收不到 pong 视为断线
+heartbeat_interval = 20
+# 连接没断但超过这么久没有任何推送时也重连一次
+silence_timeout = 10 * 60
+# 接收最多等这么久就醒来一次，给账本报一次活（要小于 commission_ledger.stream_timeout）
+touch_interval = 30
+reconnect_delay = 1
+max_reconnect_delay = 60
+open_status = ("NEW", "PARTIALLY_FILLED")
+
+
+class AccountState:
+    # 单账户的本地挂单/持仓/余额表，由 ORDER_TRADE_UPDATE 和 ACCOUNT_UPDATE 推送维护
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.positions = {}
+        self.balances = {}
+        # 推送里没有可用余额（开仓占用的保证金、未实现盈亏都不在里面），成交或余额变化后记一次，
+        # 和上次 REST 刷新时的计数不一致就说明缓存的可用余额已经过期
+        self.balance_changes = 0
+        self.balances_synced = 0
+        # 仓位变化时通知的等待者，单账户和对冲组各自注册一个 Event，run() 重启后旧的自动回收
+        self.fill_listeners = weakref.WeakSet()
+        self.fills = 0
+        self.last_event_time = 0
+
+    def reset(self, orders: list, positions: list, balances: list):
+        with self.lock:
+            self.orders = {order["orderId"]: order for order in orders}
+            self.positions = {}
+            for position in positions:
+                self.positions[(position["symbol"], position.get("positionSide", "BOTH"))] = {
+                    "symbol": position["symbol"],
+                    "positionSide": position.get("positionSide", "BOTH"),
+                    "positionAmt": position["positionAmt"],
+                    "entryPrice": position["entryPrice"],
+                    "updateTime": position["updateTime"],
+                }
+            self.balances = {balance["asset"]: dict(balance) for balance in balances}
+            self.balances_synced = self.balance_changes
+
+    def on_order_update(self, order: dict, event_time: int):
+        with self.lock:
+            order_id = order["i"]
+            if order["X"] in open_status:
+                self.orders[order_id] = {
+                    "symbol": order["s"],
+                    "orderId": order_id,
+                    "clientOrderId": order["c"],
+                    "side": order["S"],
+                    "type": order["o"],
+                    "status": order["X"],
+                    "price": order["p"],
+                    "origQty": order["q"],
+                    "executedQty": order["z"],
+                    "positionSide": order.get("ps", "BOTH"),
+                    "updateTime": order.get("T", event_time),
+                }
+            else:
+                self.orders.pop(order_id, None)
+            if order["x"] == "TRADE":
+                # 不在这里通知：成交推送先于对应的 ACCOUNT_UPDATE 到达时仓位还是旧的，等待者按旧仓位平仓会多下一笔只减仓单
+                self.fills += 1
+                self.balance_changes += 1
+
+    def on_account_update(self, update: dict, event_time: int):
+        with self.lock:
+            for item in update.get("B", []):
+                balance = self.balances.setdefault(item["a"], {"asset": item["a"], "availableBalance": item["cw"]})
+                balance["balance"] = item["wb"]
+                balance["crossWalletBalance"] = item["cw"]
+                balance["updateTime"] = event_time
+            if update.get("B"):
+                self.balance_changes += 1
+            changed = False
+            for item in update.get("P", []):
+                key = (item["s"], item.get("ps", "BOTH"))
+                previous = self.positions.get(key)
+                if previous is None or float(previous["positionAmt"]) != float(item["pa"]):
+                    changed = True
+                self.positions[key] = {
+                    "symbol": item["s"],
+                    "positionSide": item.get("ps", "BOTH"),
+                    "positionAmt": item["pa"],
+                    "entryPrice": item["ep"],
+                    "updateTime": event_time,
+                }
+            # 只有仓位数量真的变了才叫醒等待者，此时持仓已经是成交后的
+            if changed:
+                self.notify()
+
+    def notify(self):
+        for event in list(self.fill_listeners):
+            event.set()
+
+    def open_orders(self) -> list:
+        with self.lock:
+            return list(self.orders.values())
+
+    def get_positions(self) -> list:
+        # 与 get_position_risk 返回格式一致，notional 用缓存的标记价格估算
+        mark_price_dict = get_mark_price_dict()
+        with self.lock:
+            positions = [dict(position) for position in self.positions.values()]
+        for position in positions:
+            price = position["entryPrice"]
+            if position["symbol"] in mark_price_dict:
+                price = mark_price_dict[position["symbol"]]["markPrice"]
+            position["notional"] = str(float(position["positionAmt"]) * float(price))
+        return positions
+
+    def get_balances(self) -> list:
+        with self.lock:
+            return [dict(balance) for balance in self.balances.values()]
+
+    def fresh_balances(self) -> tuple:
+        # 返回 (余额列表, 版本)；上次刷新之后有过成交或余额变化时余额列表为 None，调用方走 REST 后用 set_balances 写回
+        with self.lock:
+            if self.balances_synced != self.balance_changes:
+                return None, self.balance_changes
+            return [dict(balance) for balance in self.balances.values()], self.balance_changes
+
+    def set_balances(self, balances: list, version: int):
+        with self.lock:
+            self.balances = {balance["asset"]: dict(balance) for balance in balances}
+            # REST 请求期间又有成交时仍然算过期
+            if version == self.balance_changes:
+                self.balances_synced = version
+
+    def add_fill_listener(self, event: threading.Event):
+        self.fill_listeners.add(event)
+
+    def remove_fill_listener(self, event: threading.Event):
+        self.fill_listeners.discard(event)
+
+
+class UserDataStream:
+    # 基于 listenKey 的账户推送。连接跑在自己的线程和事件循环里，和 REST 一样走账户的代理；
+    # 心跳收不到 pong、连接关闭、续期失败、listenKey 过期或长时间没有推送都会重连，每次连上先用 REST 对账
+    def __init__(self, client, api_key: str, proxy: str = None):
+        self.client = client
+        self.api_key = api_key
+        self.proxy = proxy or None
+        self.state = AccountState()
+        self.listen_key = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # ready：已连上并对过账；attempted：第一次连接已有结果（成功或失败）
+        self.ready = threading.Event()
+        self.attempted = threading.Event()
+        self.thread = None
+        self.loop = None
+        self.task = None
+        self.last_message_at = 0
+
+    def start(self, timeout: float = 30):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name=f"user-stream-{self.api_key[:8]}")
+                self.thread.start()
+        self.attempted.wait(timeout)
+        if not self.ready.is_set():
+            raise RuntimeError(f"{self.api_key} user data stream not connected")
+
+    def stop(self):
+        self.stopped.set()
+        loop, task = self.loop, self.task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已经结束
+                pass
+        if self.thread is not None:
+            self.thread.join(10)
+        if self.listen_key is not None:
+            try:
+                self.client.close_listen_key(self.listen_key)
+            except Exception as e:
+                logger.error(f"{self.api_key} close listen key failed:{e}")
+            self.listen_key = None
+
+    def run(self):
+        delay = reconnect_delay
+        while not self.stopped.is_set():
+            try:
+                asyncio.run(self.session())
+            except Exception as e:
+                logger.error(f"{self.api_key} user data stream error:{e}")
+            connected = self.ready.is_set()
+            self.ready.clear()
+            self.attempted.set()
+            get_ledger(self.client, self.api_key).detach_stream()
+            # 连上过就马上重连，一直连不上时逐步拉长间隔
+            delay = reconnect_delay if connected else min(delay * 2, max_reconnect_delay)
+            self.stopped.wait(delay)
+
+    async def session(self):
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        try:
+            if self.stopped.is_set():
+                return
+            self.listen_key = (await asyncio.to_thread(self.client.new_listen_key))["listenKey"]
+            url = f"{market_data.stream_url}/ws/{self.listen_key}"
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(url, proxy=self.proxy, heartbeat=heartbeat_interval) as ws:
+                    # 先连上再对账：对账期间到达的推送排在 ws 的接收队列里，快照写入后才按顺序处理，不会被快照覆盖
+                    await asyncio.to_thread(self.reconcile)
+                    get_ledger(self.client, self.api_key).attach_stream()
+                    self.last_message_at = time.time()
+                    self.ready.set()
+                    self.attempted.set()
+                    logger.info(f"{self.api_key} user data stream connected")
+                    await self.receive(ws)
+        except asyncio.CancelledError:
+            pass
+
+    async def receive(self, ws):
+        ledger = get_ledger(self.client, self.api_key)
+        renew_at = time.time() + keepalive_interval
+        while not self.stopped.is_set():
+            ledger.touch_stream()
+            now = time.time()
+            if now - self.last_message_at > silence_timeout:
+                # 连接看起来还在但很久没有推送，重连一次顺带对账，防止连接假活
+                logger.warning(f"{self.api_key} user data stream silent for {silence_timeout}s, reconnecting")
+                return
+            if now >= renew_at:
+                # 续期失败抛出异常，由 run() 重连
+                await asyncio.to_thread(self.client.renew_listen_key, self.listen_key)
+                renew_at = now + keepalive_interval
+            try:
+                message = await ws.receive(timeout=min(renew_at, self.last_message_at + silence_timeout, now + touch_interval) - now)
+            except asyncio.TimeoutError:
+                continue
+            if message.type != aiohttp.WSMsgType.TEXT:
+                logger.warning(f"{self.api_key} user data stream closed: {message.type.name}")
+                return
+            self.last_message_at = time.time()
+            if self.on_message(message.data):
+                return
+
+    def reconcile(self):
+        orders = self.client.get_orders()
+        positions = self.client.get_position_risk()
+        balances = self.client.balance()
+        self.state.reset(orders, positions, balances)
+
+    def on_message(self, message) -> bool:
+        # 返回 True 表示需要重连
+        event = parse_stream_message(message)
+        if not isinstance(event, dict) or "e" not in event:
+            return False
+        self.state.last_event_time = event.get("E", 0)
+        try:
+            if event["e"] == "ORDER_TRADE_UPDATE":
+                self.state.on_order_update(event["o"], event.get("E", 0))
+                if event["o"].get("x") == "TRADE":
+                    metrics.inc_fills(self.api_key)
+                    # 手续费即时计入账本，成本检查不用再拉流水
+                    get_ledger(self.client, self.api_key).record_fill(event["o"], get_mark_price_dict())
+            elif event["e"] == "ACCOUNT_UPDATE":
+                self.state.on_account_update(event["a"], event.get("E", 0))
+            elif event["e"] == "listenKeyExpired":
+                logger.warning(f"{self.api_key} listen key expired")
+                return True
+        except Exception as e:
+            logger.exception(f"{self.api_key} handle user data event failed:{e}")
+        return False
+
+
+streams = {}
+streams_lock = threading.Lock()
+
+
+def get_user_stream(client, api_key: str, proxy: str = None) -> UserDataStream:
+    # 每个账户只建一条推送连接，run() 异常重启后沿用已有的本地状态
+    with streams_lock:
+        stream = streams.get(api_key)
+        if stream is None:
+            stream = UserDataStream(client, api_key, proxy)
+            streams[api_key] = stream
+        else:
+            stream.client = client
+    stream.start()
+    return stream
+
+
+def close_user_stream(api_key: str):
+    # 账户从配置中删除后关闭推送并注销 listenKey
+    with streams_lock:
+        stream = streams.pop(api_key, None)
+    if stream is not None:
+        stream.stop()
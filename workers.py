@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("aster")
+
+# 这些字段变了需要重建 client，只能重启对应的 worker；其余字段（cost_per_day 等）就地更新，下一轮生效
+restart_fields = ("key", "secret", "proxy")
+stop_timeout = 60
+watch_interval = 5
+
+
+class Worker:
+    # 一个交易线程：单账户或一对对冲账户。accounts 是运行中共享的配置字典，重载时就地更新
+    def __init__(self, accounts: list):
+        self.accounts = accounts
+        self.name = "+".join(account["key"][:8] for account in accounts)
+        self.stop = threading.Event()
+        # 线程正在等的 Event（pacing 定时器和成交推送共用的那个），停掉 worker 时一并叫醒
+        self.waiting = None
+        self.thread = None
+
+    def request_stop(self):
+        self.stop.set()
+        waiting = self.waiting
+        if waiting is not None:
+            waiting.set()
+
+    def stopping(self) -> bool:
+        return self.stop.is_set()
+
+    def pause(self, seconds: float) -> bool:
+        # 可被打断的 sleep，返回 True 表示该收尾退出了
+        return self.stop.wait(seconds)
+
+
+def worker_id(accounts: list) -> tuple:
+    return tuple(tuple(account.get(field) for field in restart_fields) for account in accounts)
+
+
+def plan_workers(accounts: list, hedge_mode: bool) -> dict:
+    # 与启动时的分组一致：对冲模式按顺序两两成对，奇数时最后一个按单账户跑
+    if hedge_mode and len(accounts) >= 2:
+        groups = [accounts[i:i + 2] for i in range(0, len(accounts) - 1, 2)]
+        if len(accounts) % 2 == 1:
+            groups.append(accounts[-1:])
+    else:
+        groups = [[account] for account in accounts]
+    return {worker_id(group): group for group in groups}
+
+
+class WorkerRegistry:
+    # 按配置维护运行中的 worker：重载时只停掉消失的、启动新增的，保留下来的账户不断开连接、不丢缓存
+    def __init__(self, start):
+        # start(worker) 负责创建并启动线程，由调用方决定单账户还是对冲逻辑
+        self.start = start
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def apply(self, accounts: list, hedge_mode: bool) -> dict:
+        with self.lock:
+            desired = plan_workers(accounts, hedge_mode)
+            removed = [self.workers.pop(wid) for wid in list(self.workers) if wid not in desired]
+            for worker in removed:
+                logger.info(f"stopping worker {worker.name}")
+                worker.request_stop()
+            # 先等旧 worker 撤单平仓退出，再启动新的，避免同一个账户同时被两个线程操作
+            for worker in removed:
+                if worker.thread is not None:
+                    worker.thread.join(stop_timeout)
+                    if worker.thread.is_alive():
+                        logger.error(f"worker {worker.name} did not stop within {stop_timeout}s")
+            updated = 0
+            started = 0
+            for wid, group in desired.items():
+                worker = self.workers.get(wid)
+                if worker is None:
+                    worker = Worker([dict(account) for account in group])
+                    self.workers[wid] = worker
+                    logger.info(f"starting worker {worker.name}")
+                    self.start(worker)
+                    started += 1
+                    continue
+                for live, account in zip(worker.accounts, group):
+                    if live != account:
+                        changes = {field: account.get(field) for field in account if field not in restart_fields and live.get(field) != account.get(field)}
+                        logger.info(f"worker {worker.name} account {live['key'][:8]} updated: {changes}")
+                        live.clear()
+                        live.update(account)
+                        updated += 1
+            return {"started": started, "stopped": len(removed), "updated": updated, "running": len(self.workers)}
+
+    def keys(self) -> set:
+        with self.lock:
+            return {account["key"] for worker in self.workers.values() for account in worker.accounts}
+
+    def stop_all(self):
+        self.apply([], False)
+
+
+class ConfigWatcher:
+    # 轮询配置文件的修改时间，收到 SIGHUP 时立即检查
+    def __init__(self, path: str, interval: float = watch_interval):
+        self.path = path
+        self.interval = interval
+        # signal handler 里只改一个标志位，不碰锁，避免和主线程正在持有的锁死锁
+        self.triggered = False
+        self.mtime = self.current_mtime()
+
+    def current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def trigger(self, *args):
+        # 可以直接作为 signal handler
+        self.triggered = True
+
+    def wait(self) -> bool:
+        deadline = time.time() + self.interval
+        while not self.triggered and time.time() < deadline:
+            time.sleep(0.2)
+        return self.changed()
+
+    def changed(self) -> bool:
+        # 收到过 SIGHUP 或文件修改时间变了
+        triggered = self.triggered
+        self.triggered = False
+        mtime = self.current_mtime()
+        if not triggered and mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        return True